@@ -0,0 +1,577 @@
+# async_engine.py
+"""
+Motor de rastreo asyncio: muchas URLs en vuelo por proceso.
+
+El bucle de ``ParesFileScraper.process_archive`` atiende una URL por contexto y
+pasa casi todo el tiempo esperando la ida y vuelta por Tor. Este motor mantiene
+hasta ``concurrency`` URLs en vuelo en un solo proceso, repartidas en etapas
+acotadas:
+
+    frontier -> fetch (corrutinas, Playwright async) -> parse (pool de procesos) -> persist
+
+- fetch: ``context.request`` de Playwright async, que comparte cookies con el
+  contexto sin renderizar la página. Los contextos (UA, cookies, circuito de
+  Tor) se usan por turno y se reciclan como en el motor síncrono. Cada contiene
+  abre un contexto propio para que su estado de sesión no se mezcle con el de otras.
+- parse: ``extract_page`` / ``extract_image_links`` en un ``ProcessPoolExecutor``
+  de ``parse_workers`` procesos, con como mucho ``2 * parse_workers`` páginas esperando.
+- persist: una sola corrutina escribe el segmento, SQLite y ``image_jobs`` y
+  confirma la URL. Su cola es acotada, así que si el disco no da abasto frena a fetch.
+
+El frontier va sobre ``redis.asyncio`` (:class:`AsyncRedisWorkQueue`). El
+presupuesto HTML compartido, la caché de respuestas y el progreso por bloques
+de las contiene son los del motor síncrono, así que ambos pueden convivir. Las
+imágenes siempre se encolan en ``image_jobs`` (ver image_worker.py).
+
+    python3 controller.py --async-concurrency 32
+    python3 async_engine.py --concurrency 32 --contexts 4
+"""
+import re
+import time
+import random
+import signal
+import asyncio
+import logging
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import redis.asyncio as aioredis
+from playwright.async_api import async_playwright
+from iterando import REDIS_URL, USER_AGENTS, redis_client
+from contiene_blocks import SEARCH_CONTROLLER_PATH, CONTIENE_BLOCK_SIZE, CONTIENE_MAX_ATTEMPTS, ContieneBlocks, progress_key
+from browser_pool import BrowserSlot, ContextPool
+from circuit_pool import CircuitPool, parse_ports
+from description_store import DescriptionStore
+from image_queue import ImageJobQueue
+from metrics import Metrics
+from pares_parser import extract_page, extract_image_links
+from rate_limiter import RedisRateLimiter
+from response_cache import ResponseCache, DEFAULT_TTL
+from sqlite_export import SqliteSink
+from work_queue import AsyncRedisWorkQueue, RedisWorkQueue
+
+
+class AsyncParesScraper:
+    """Una instancia por proceso; :meth:`run` rastrea hasta vaciar el frontier o recibir SIGTERM."""
+
+    def __init__(self, base_url="https://pares.mcu.es", skip_download=False, use_tor=True, concurrency=16,
+                 parse_workers=2, contexts=1, rotate_after=200, circuit_mode="auth", socks_ports=(9050,),
+                 parser="auto", idle_timeout=30, dequeue_timeout=5, max_retries=3, frontier="priority",
+                 html_rate=0.5, html_max_rate=4.0, cache_dir=None, cache_ttl=DEFAULT_TTL, replay=False,
+                 sqlite_path=None, contiene_block_size=CONTIENE_BLOCK_SIZE, contiene_parallel=4,
+                 contiene_page_field=None, metrics_port=0, metrics_dir=None):
+        self.logger = logging.getLogger('ParesFileScraper.Async')
+        self.logger.setLevel(logging.INFO)
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            self.logger.addHandler(handler)
+
+        self.base_url = base_url
+        self.use_tor = use_tor and not replay
+        self.replay = replay
+        self.concurrency = max(1, concurrency)
+        self.parse_workers = max(1, parse_workers)
+        self.rotate_after = rotate_after
+        self.parser = parser
+        self.idle_timeout = idle_timeout
+        self.dequeue_timeout = dequeue_timeout
+        self.max_retries = max_retries
+        self.contiene_page_field = contiene_page_field
+        self.contiene_block_size = max(1, contiene_block_size)
+        self.contiene_parallel = max(1, contiene_parallel)
+
+        self.cache = ResponseCache(cache_dir, ttl=cache_ttl) if cache_dir else None
+        if replay and not self.cache:
+            raise ValueError("El modo replay necesita un directorio de caché")
+
+        # Redis síncrono para lo que ya va en hilos (limitador, image_jobs, contadores)
+        self.r = redis_client()
+        self.ar = aioredis.from_url(REDIS_URL)
+        self.queue = AsyncRedisWorkQueue(self.ar, frontier=frontier, base_url=base_url)
+        self.html_limiter = RedisRateLimiter(self.r, "html", rate=html_rate, max_rate=html_max_rate)
+        self.image_jobs = None if skip_download or replay else ImageJobQueue(self.r)
+        self.store = DescriptionStore("description_data.json")
+        self.sqlite = SqliteSink(sqlite_path) if sqlite_path else None
+
+        self.circuits = CircuitPool(circuit_mode, ports=socks_ports)
+        self.slots = [BrowserSlot(i) for i in range(max(1, contexts))]
+        self._turn = itertools.count()
+        self._pw = None
+        self.browser = None
+        self.engine = None
+
+        # Bloqueos, colas y pools se crean en run(), dentro del bucle de eventos
+        self._tasks = set()
+        self._io = ThreadPoolExecutor(max_workers=4, thread_name_prefix="io")
+        self._parse_pool = None
+
+        self.metrics = Metrics()
+        self.metrics.gauge("pares_queue_todo", RedisWorkQueue(self.r, frontier=frontier).pending)
+        self.metrics.gauge("pares_urls_in_flight", lambda: len(self._tasks))
+        if metrics_port:
+            self.metrics.serve(metrics_port)
+        self.metrics_path = self.metrics.start_file_dump(metrics_dir) if metrics_dir else None
+
+    async def _blocking(self, fn, *args):
+        """Llamadas síncronas (disco, Redis síncrono) en el pool de E/S."""
+        return await asyncio.get_running_loop().run_in_executor(self._io, fn, *args)
+
+    # --- Navegador ---------------------------------------------------------------
+
+    async def _launch(self):
+        self._pw = await async_playwright().start()
+        self.engine = random.choice(ContextPool.ENGINES)
+        self.logger.info(f"[SESSION] Lanzando {self.engine} con {len(self.slots)} contextos")
+        launch_kwargs = {"headless": True}
+        if self.use_tor:
+            launch_kwargs["proxy"] = {"server": "socks5://127.0.0.1:9050"}
+        self.browser = await getattr(self._pw, self.engine).launch(**launch_kwargs)
+        if self.use_tor and self.circuits.mode == "auth" and self.engine != "firefox":
+            # Sin credenciales SOCKS5 en el navegador el modo auth no aísla: un SocksPort por circuito
+            self.logger.warning(f"[SESSION] {self.engine} no admite credenciales SOCKS5: se usa el modo ports")
+            self.circuits = self.circuits.ports_fallback()
+        for slot in self.slots:
+            await self._open_context(slot)
+
+    def _context_kwargs(self, slot):
+        context_kwargs = {"user_agent": slot.user_agent}
+        if self.use_tor:
+            proxy = {"server": slot.circuit.server}
+            # Chromium no admite autenticación SOCKS5; Firefox sí
+            if self.engine == "firefox" and slot.circuit.auth:
+                proxy.update({"username": slot.circuit.auth[0], "password": slot.circuit.auth[1]})
+            context_kwargs["proxy"] = proxy
+        return context_kwargs
+
+    async def _new_context(self, slot, url):
+        """Contexto con el UA y circuito de ``slot``; visita ``url`` para fijar cookies y sesión."""
+        context = await self.browser.new_context(**self._context_kwargs(slot))
+        page = await context.new_page()
+        await self._acquire()
+        try:
+            await page.goto(url, timeout=60000, wait_until="domcontentloaded")
+            await page.wait_for_load_state("networkidle", timeout=10000)
+        except Exception as e:
+            self.logger.warning(f"[SESSION] {slot.name}: no se pudo cargar {url}: {e}")
+        finally:
+            await page.close()
+        return context
+
+    async def _open_context(self, slot):
+        """(Re)abre el contexto de ``slot`` con UA y circuito nuevos."""
+        previous = slot.context
+        slot.generation += 1
+        slot.user_agent = random.choice(USER_AGENTS)
+        slot.circuit = self.circuits.acquire(slot.circuit) if self.use_tor else None
+        slot.needs_rotation = False
+        slot.request_count = 0
+        slot.context = await self._new_context(slot, self.base_url)
+        if previous is not None:
+            # Las peticiones que aún usan el contexto anterior terminan antes de cerrarlo
+            asyncio.create_task(self._close_later(previous))
+
+    async def _close_later(self, context, delay=90):
+        await asyncio.sleep(delay)
+        try:
+            await context.close()
+        except Exception:
+            pass
+
+    async def _next_slot(self):
+        """Siguiente contexto por turno, reciclado si toca (peticiones o circuito retirado)."""
+        slot = self.slots[next(self._turn) % len(self.slots)]
+        if slot.request_count >= self.rotate_after or slot.needs_rotation:
+            async with self._rotation_locks[slot.index]:
+                if slot.request_count >= self.rotate_after or slot.needs_rotation:
+                    self.metrics.inc("pares_rotations_total")
+                    with self.metrics.timer("rotation"):
+                        await self._open_context(slot)
+        slot.request_count += 1
+        return slot
+
+    # --- Fetch -------------------------------------------------------------------
+
+    async def _acquire(self):
+        """Ficha del presupuesto HTML compartido sin bloquear el bucle de eventos."""
+        start = time.monotonic()
+        while True:
+            wait_ms = await self._blocking(self.html_limiter.try_acquire)
+            if not wait_ms:
+                self.metrics.observe("rate_wait", time.monotonic() - start)
+                return
+            await asyncio.sleep(min(wait_ms / 1000, 5))
+
+    def _record_page(self, error=None):
+        """AIMD del limitador y contadores ``stats:pages_*`` del supervisor (en el pool de E/S)."""
+        self.html_limiter.report(error)
+        self.r.incr("stats:pages_failed" if error is not None else "stats:pages_ok")
+
+    def _score(self, slot, ok, latency=None):
+        if self.use_tor and slot.circuit is not None and self.circuits.record(slot.circuit, ok, latency):
+            slot.needs_rotation = True
+
+    async def fetch(self, url, referer=None, form=None, slot=None, context=None):
+        """
+        HTML de ``url``, o del POST de SearchController.do con ``form``; "" si falla.
+
+        ``context`` sustituye al contexto de ``slot`` (el propio de una contiene).
+        """
+        if self.cache:
+            html = await self._blocking(self.cache.get, url, form, self.replay)
+            if html is not None:
+                self.metrics.inc("pares_cache_hits_total")
+                return html
+            self.metrics.inc("pares_cache_misses_total")
+            if self.replay:
+                self.logger.warning(f"[REPLAY] {url} no está en la caché")
+                return ""
+
+        for attempt in range(1, self.max_retries + 1):
+            current = slot or await self._next_slot()
+            request = (context or current.context).request
+            await self._acquire()
+            start = time.monotonic()
+            headers = {"Accept-Language": "es-ES,es;q=0.9,en;q=0.8"}
+            try:
+                if form is not None:
+                    headers.update({
+                        "Accept": "text/html, */*; q=0.01",
+                        "X-Requested-With": "XMLHttpRequest",
+                        "Origin": self.base_url,
+                        "Referer": referer or url,
+                    })
+                    response = await request.post(self.base_url + SEARCH_CONTROLLER_PATH, form=form,
+                                                  headers=headers, timeout=60000)
+                else:
+                    if referer:
+                        headers["Referer"] = referer
+                    response = await request.get(url, headers=headers, timeout=60000)
+                if not response.ok:
+                    raise Exception(f"Status inválido: {response.status}")
+                html = await response.text()
+            except Exception as e:
+                self._score(current, False)
+                await self._blocking(self._record_page, e)
+                self.logger.warning(f"[Intento {attempt}] Error en fetch({url}): {e}")
+                if attempt < self.max_retries:
+                    self.metrics.inc("pares_retries_total")
+                continue
+
+            elapsed = time.monotonic() - start
+            self._score(current, True, elapsed)
+            await self._blocking(self._record_page, None)
+            self.metrics.observe("fetch", elapsed)
+            if self.cache:
+                try:
+                    await self._blocking(self.cache.put, url, html, form)
+                except OSError as e:
+                    self.logger.error(f"[CACHE] No se pudo guardar {url}: {e}")
+            return html
+
+        self.logger.error(f"Fallo después de {self.max_retries} intentos: {url}")
+        return ""
+
+    # --- Parse -------------------------------------------------------------------
+
+    async def _parse(self, fn, *args):
+        """Parseo en el pool de procesos, con como mucho ``2 * parse_workers`` páginas esperando."""
+        async with self._parse_slots:
+            start = time.monotonic()
+            result = await asyncio.get_running_loop().run_in_executor(self._parse_pool, fn, *args)
+            self.metrics.observe("parse", time.monotonic() - start)
+            return result
+
+    async def parse_page(self, html, with_ficha=True):
+        return await self._parse(extract_page, html, self.base_url, self.parser, with_ficha)
+
+    # --- Tipos de URL ------------------------------------------------------------
+    # Cada handler devuelve True (confirmar ya), False (reencolar) o None (lo confirma persist)
+
+    async def process_find(self, url):
+        html = await self.fetch(url)
+        if not html:
+            self.logger.warning(f"No se obtuvo contenido HTML para find URL: {url}")
+            return True
+        desc_urls = (await self.parse_page(html, with_ficha=False))["descriptions"]
+        if desc_urls:
+            await self.queue.enqueue_many(desc_urls)
+        return True
+
+    async def process_description(self, url):
+        match = re.search(r'description/(\d+)', url)
+        if not match:
+            self.logger.error(f"No se pudo extraer page_id de la URL: {url}")
+            return True
+        html = await self.fetch(url)
+        if not html:
+            self.logger.warning(f"No se obtuvo contenido HTML para description URL: {url}")
+            return True
+        page_id = match.group(1)
+        page = await self.parse_page(html)
+        if page["contiene"]:
+            await self.queue.enqueue_many(page["contiene"])
+
+        img_download_links = []
+        if page["show"]:
+            show_html = await self.fetch(page["show"], referer=url)
+            if show_html:
+                img_download_links = await self._parse(extract_image_links, show_html, self.base_url)
+        record = {
+            "url": url,
+            "additional_data": page["ficha"],
+            "has_image": bool(page["show"]),
+            "image_links": img_download_links,
+        }
+        # Cola acotada: si persist se retrasa, esta URL conserva su hueco de fetch
+        await self._persist_queue.put((url, page_id, record))
+        return None
+
+    async def _fetch_block(self, url, blocks, block, slot, context):
+        try:
+            html = await self.fetch(url, form=blocks.form(block), slot=slot, context=context)
+            if not html:
+                return block, None
+            return block, (await self.parse_page(html, with_ficha=False))["descriptions"]
+        except Exception as e:
+            self.logger.error(f"Error en el bloque {block} de contiene {url}: {e}")
+            return block, None
+
+    async def process_contiene(self, url):
+        """Como ``ParesFileScraper.process_contiene``: bloques en paralelo con progreso en Redis."""
+        blocks = ContieneBlocks(url, await self.ar.hgetall(progress_key(url)), self.contiene_block_size,
+                                self.contiene_page_field)
+        pushed = 0
+
+        slot = None if self.replay else await self._next_slot()
+        context = None if self.replay else await self._new_context(slot, url)
+        try:
+            while True:
+                window = blocks.next_window(self.contiene_parallel)
+                if not window:
+                    break
+                for result in asyncio.as_completed([self._fetch_block(url, blocks, block, slot, context)
+                                                    for block in window]):
+                    block, desc_urls = await result
+                    fields = blocks.record(block, desc_urls)
+                    if fields is None:
+                        if block in blocks.repeated:
+                            # El servidor ignora el campo de página: no es el fin del listado
+                            self.logger.error("Contiene %s: el bloque %d repite el bloque %d; el servidor no "
+                                              "pagina con '%s'", url, block, blocks.repeated[block],
+                                              self.contiene_page_field)
+                            if self.cache and not self.replay:
+                                await self._blocking(self.cache.discard, url, blocks.form(block))
+                        continue
+                    self.metrics.inc("pares_contiene_blocks_total")
+                    if desc_urls:
+                        pushed += await self.queue.enqueue_many(desc_urls)
+                    await self.ar.hset(blocks.key, mapping=fields)
+        finally:
+            if context is not None:
+                await context.close()
+
+        self.logger.info(f"Contiene {url}: {blocks.found} descripciones, {pushed} URLs nuevas encoladas")
+        pipe = self.ar.pipeline(transaction=False)
+        outcome = blocks.finish(pipe)
+        await pipe.execute()
+        if outcome == "done":
+            if blocks.truncated:
+                self.logger.warning(f"Contiene {url}: el listado puede estar truncado (sin --contiene-page-field "
+                                    f"no se pagina); anotada en contiene_truncated")
+            return True
+        if outcome == "failed":
+            self.logger.error(f"Contiene {url}: bloques {sorted(blocks.failed)} fallidos tras "
+                              f"{blocks.attempts} intentos")
+            return True
+        self.logger.warning(f"Contiene {url}: bloques {sorted(blocks.failed)} fallidos, se reencola "
+                            f"(intento {blocks.attempts}/{CONTIENE_MAX_ATTEMPTS})")
+        return False
+
+    async def _handle(self, url):
+        try:
+            if await self.queue.is_done(url):
+                self.logger.debug(f"URL ya procesada, saltando: {url}")
+                outcome = True
+            elif "description/" in url:
+                outcome = await self.process_description(url)
+            elif "contiene/" in url:
+                outcome = await self.process_contiene(url)
+            elif "catalogo/find" in url:
+                outcome = await self.process_find(url)
+            else:
+                self.logger.warning(f"Tipo de URL no reconocido: {url}")
+                outcome = True
+        except Exception as e:
+            self.logger.error(f"Error procesando {url}: {e}")
+            outcome = e
+        finally:
+            self._fetch_slots.release()
+        try:
+            if isinstance(outcome, Exception):
+                # Sin resultado: se reintenta hasta max_retries veces antes de darla por fallida
+                if not await self.queue.fail(url, self.max_retries):
+                    self.logger.error(f"{url} falló {self.max_retries} veces, anotada en failed_urls")
+            elif outcome:
+                await self.queue.ack(url)
+                self._count_processed()
+            elif outcome is False:
+                await self.queue.retry(url)
+        except Exception as e:
+            self.logger.error(f"Error confirmando {url}: {e}")
+
+    # --- Persist -----------------------------------------------------------------
+
+    def _persist(self, page_id, record, url):
+        self.store.append(page_id, record)
+        if self.sqlite:
+            self.sqlite.upsert(page_id, record)
+        if self.image_jobs and record["image_links"]:
+            self.image_jobs.enqueue(page_id, record["image_links"], url=url)
+
+    async def _persister(self):
+        while True:
+            item = await self._persist_queue.get()
+            if item is None:
+                return
+            url, page_id, record = item
+            try:
+                with self.metrics.timer("persist"):
+                    await self._blocking(self._persist, page_id, record, url)
+            except Exception as e:
+                self.logger.error(f"Error guardando descripción {page_id}: {e}")
+                # Sin confirmar: vuelve a su nivel del frontier para otro intento (hasta max_retries)
+                try:
+                    if not await self.queue.fail(url, self.max_retries):
+                        self.logger.error(f"{url} falló {self.max_retries} veces, anotada en failed_urls")
+                except Exception as e:
+                    self.logger.error(f"No se pudo reencolar {url}: {e}")
+                continue
+            try:
+                await self.queue.ack(url)
+                self._count_processed()
+            except Exception as e:
+                self.logger.error(f"Error confirmando {url}: {e}")
+
+    def _count_processed(self):
+        self.metrics.inc("pares_urls_processed_total")
+        self._processed += 1
+        if self._processed % 100 == 0:
+            elapsed = time.time() - self._start
+            self.logger.info(f"Progreso: {self._processed} URLs en {elapsed:.2f}s "
+                             f"({self._processed / elapsed:.2f} URLs/s, {len(self._tasks)} en vuelo)")
+
+    # --- Bucle principal ---------------------------------------------------------
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        try:
+            # SIGTERM (supervisor o kill): no sacar más URLs, terminar las que están en vuelo y salir
+            loop.add_signal_handler(signal.SIGTERM, self.stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+        self._fetch_slots = asyncio.Semaphore(self.concurrency)
+        self._parse_slots = asyncio.Semaphore(2 * self.parse_workers)
+        self._persist_queue = asyncio.Queue(maxsize=self.concurrency)
+        self._rotation_locks = [asyncio.Lock() for _ in self.slots]
+        # spawn: a estas alturas ya hay hilos (I/O, Redis, logging) y un fork los heredaría a medias
+        self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers,
+                                               mp_context=multiprocessing.get_context("spawn"))
+        self._processed = 0
+        self._start = time.time()
+
+        if not self.replay:
+            await self._launch()
+        persister = asyncio.create_task(self._persister())
+        self.logger.info(f"Motor asyncio: {self.concurrency} URLs en vuelo, {self.parse_workers} procesos de parseo, "
+                         f"{len(self.slots)} contextos")
+        idle_since = None
+        try:
+            while not self.stop_event.is_set():
+                await self._fetch_slots.acquire()
+                url = await self.queue.dequeue(timeout=self.dequeue_timeout)
+                if url is None:
+                    self._fetch_slots.release()
+                    # Cola vacía: se espera mientras haya URLs en vuelo que puedan generar trabajo
+                    if idle_since is None:
+                        idle_since = time.time()
+                    # is_drained cuenta también lo sacado y aún sin confirmar (tareas y persist)
+                    if time.time() - idle_since >= self.idle_timeout and await self.queue.is_drained():
+                        self.logger.info("No hay más URLs para procesar")
+                        break
+                    continue
+                idle_since = None
+                task = asyncio.create_task(self._handle(url))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            if self.stop_event.is_set():
+                self.logger.info(f"Parada solicitada, esperando {len(self._tasks)} URLs en vuelo")
+        finally:
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self._persist_queue.put(None)
+            await persister
+            await self.close()
+        elapsed = time.time() - self._start
+        self.logger.info(f"Procesamiento completado. {self._processed} URLs procesadas en {elapsed:.2f}s")
+        return self._processed
+
+    async def close(self):
+        if self.browser:
+            try:
+                await self.browser.close()
+            except Exception:
+                pass
+        if self._pw:
+            await self._pw.stop()
+        if self._parse_pool:
+            self._parse_pool.shutdown()
+        self._io.shutdown()
+        self.store.close()
+        if self.sqlite:
+            self.sqlite.close()
+        await self.ar.aclose()
+        if self.metrics_path:
+            self.metrics.dump(self.metrics_path)
+        self.metrics.stop()
+
+
+def run_async_scraper(concurrency=16, parse_workers=2, skip_download=False, tor_disable=False, idle_timeout=30,
+                      contexts=1, circuit_mode="auth", socks_ports=(9050,), parser="auto",
+                      metrics_port=0, metrics_dir=None, html_rate=0.5, html_max_rate=4.0,
+                      cache_dir=None, cache_ttl=DEFAULT_TTL, replay=False, base_url="https://pares.mcu.es",
+                      frontier="priority", sqlite_path=None, contiene_block_size=CONTIENE_BLOCK_SIZE,
+                      contiene_parallel=4, contiene_page_field=None):
+    scraper = AsyncParesScraper(base_url=base_url, skip_download=skip_download, use_tor=not tor_disable,
+                                concurrency=concurrency, parse_workers=parse_workers, contexts=contexts,
+                                circuit_mode=circuit_mode, socks_ports=socks_ports, parser=parser,
+                                idle_timeout=idle_timeout, frontier=frontier,
+                                html_rate=html_rate, html_max_rate=html_max_rate,
+                                cache_dir=cache_dir, cache_ttl=cache_ttl, replay=replay,
+                                sqlite_path=sqlite_path, contiene_block_size=contiene_block_size,
+                                contiene_parallel=contiene_parallel, contiene_page_field=contiene_page_field,
+                                metrics_port=metrics_port, metrics_dir=metrics_dir)
+    try:
+        asyncio.run(scraper.run())
+    except KeyboardInterrupt:
+        scraper.logger.info("Scraper interrumpido por el usuario (Ctrl+C)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Worker de rastreo asyncio (muchas URLs en vuelo por proceso)')
+    parser.add_argument('--concurrency', type=int, default=16, help='URLs en vuelo en este proceso')
+    parser.add_argument('--parse-workers', type=int, default=2, help='Procesos de parseo')
+    parser.add_argument('--contexts', type=int, default=1, help='Contextos de navegador usados por turno')
+    parser.add_argument('--skip-download', action='store_true', help='No encolar las imágenes en image_jobs')
+    parser.add_argument('--tor-disable', action='store_true', help='Desactiva el uso de Tor (no proxy)')
+    parser.add_argument('--circuit-mode', choices=['auth', 'ports'], default='auth')
+    parser.add_argument('--socks-ports', default='9050')
+    parser.add_argument('--frontier', choices=['fifo', 'priority', 'depth'], default='priority')
+    parser.add_argument('--sqlite', default=None, help='Base SQLite donde escribir también las fichas')
+    args = parser.parse_args()
+    run_async_scraper(concurrency=args.concurrency, parse_workers=args.parse_workers, contexts=args.contexts,
+                      skip_download=args.skip_download, tor_disable=args.tor_disable,
+                      circuit_mode=args.circuit_mode, socks_ports=parse_ports(args.socks_ports),
+                      frontier=args.frontier, sqlite_path=args.sqlite)
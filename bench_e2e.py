@@ -0,0 +1,440 @@
+# bench_e2e.py
+"""
+Benchmark de extremo a extremo del scraper contra un Pares simulado en local.
+
+Levanta un servidor HTTP que imita pares.mcu.es sirviendo:
+  - description, contiene (GET + POST a ``SearchController.do``) y show;
+  - ``ViewImage.do``.
+La latencia y los errores (503) se inyectan por configuración. Después
+lanza ``run_scraper`` en N procesos contra una base de Redis aparte (sin Tor
+ni caché) e informa de:
+  - páginas/s, imágenes/s y MB/s;
+  - p50/p99 por etapa, leídos de los volcados de ``metrics.py``;
+  - la memoria máxima de cada worker.
+
+El corpus es sintético: ``--units`` descripciones raíz con ``--children`` hijas
+cada una, y ``--images`` imágenes por descripción. Con ``--recorded DIR`` se
+sirven las páginas guardadas (``description_<id>.html``, ``contiene_<id>.html``
+con la respuesta del POST, ``show_<id>.html``) cuando existen. Las que no
+existan se generan.
+
+El POST del listado respeta ``tambloque`` y, con ``--contiene-page-field``, pagina
+por ese campo como haría Pares; sin él devuelve siempre el primer bloque (un
+servidor que no pagina). El mismo campo se pasa a los workers.
+
+    python3 bench_e2e.py --workers 2 --units 20 --children 10 --latency 50 --error-rate 0.02
+    python3 bench_e2e.py --save-baseline bench_baseline.json
+    python3 bench_e2e.py --baseline bench_baseline.json   # sale con 1 si hay regresiones
+"""
+import os
+import re
+import sys
+import json
+import time
+import glob
+import uuid
+import random
+import shutil
+import argparse
+import resource
+import urllib.parse
+import tempfile
+import threading
+from multiprocessing import Process
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import redis
+
+CATALOGO = "/ParesBusquedas20/catalogo"
+_PATH_RE = re.compile(r'/catalogo/(description|contiene|show)/(\d+)')
+_COOKIE_RE = re.compile(r'JSESSIONID=([\w-]+)')
+_METRIC_RE = re.compile(r'^(\w+?)(?:_bucket)?\{([^}]*)\} (\S+)$')
+_LABEL_RE = re.compile(r'(\w+)="([^"]*)"')
+
+
+# --- Pares simulado -------------------------------------------------------------------
+
+class StandInPares:
+    """Corpus sintético (o grabado) y estado de sesión de las páginas contiene."""
+
+    def __init__(self, units, children, images, image_kb, recorded=None,
+                 latency_ms=0, jitter=0.3, error_rate=0.0, error_status=503, page_field=None):
+        self.units = units
+        self.children = children
+        self.images = images
+        self.image_body = os.urandom(image_kb * 1024)
+        self.recorded = recorded
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.page_field = page_field
+        self.sessions = {}   # JSESSIONID -> id de la última contiene visitada
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + n
+
+    def delay(self):
+        if self.latency_ms:
+            ms = max(0.0, random.gauss(self.latency_ms, self.latency_ms * self.jitter))
+            time.sleep(ms / 1000)
+
+    def inject_error(self):
+        return self.error_rate and random.random() < self.error_rate
+
+    def _recorded(self, kind, page_id):
+        if not self.recorded:
+            return None
+        path = os.path.join(self.recorded, f"{kind}_{page_id}.html")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8", errors="replace") as f:
+                return f.read()
+        return None
+
+    def description(self, page_id):
+        html = self._recorded("description", page_id)
+        if html is not None:
+            return html
+        contiene = (f'<a href="{CATALOGO}/contiene/{page_id}">Contiene</a>'
+                    if page_id <= self.units and self.children else "")
+        show = f'<a href="{CATALOGO}/show/{page_id}">Ver imágenes</a>' if self.images else ""
+        fields = "".join(
+            f'<div class="info"><h4 class="aviso">Campo {n}:</h4><p>Valor {n} de la unidad {page_id}</p></div>'
+            for n in range(1, 9)
+        )
+        return (f"<html><head><title>Descripción {page_id}</title></head><body>"
+                f'<div id="wrapper_ficha"><div class="area">{fields}</div></div>'
+                f"{contiene}{show}</body></html>")
+
+    def contiene_list(self, page_id, form=None):
+        html = self._recorded("contiene", page_id)
+        if html is not None:
+            return html
+        form = form or {}
+        size = int(form.get("tambloque") or self.children or 1)
+        # Sin campo de página configurado el bloque pedido se ignora, como en un servidor que no pagina
+        block = int(form.get(self.page_field) or 1) if self.page_field else 1
+        rows = "".join(
+            f'<tr><td><a href="{CATALOGO}/description/{page_id * 1000 + k}">Unidad {k}</a></td></tr>'
+            for k in range((block - 1) * size + 1, min(self.children, block * size) + 1)
+        )
+        return f"<table>{rows}</table>"
+
+    def show(self, page_id):
+        html = self._recorded("show", page_id)
+        if html is not None:
+            return html
+        # Un enlace por línea: DBCODE_RE usa ".*" y no debe abarcar varios
+        lines = [
+            f"<a href=\"javascript:void(0)\" onclick=\"abrir('/ParesBusquedas20/catalogo/VisorController.do?"
+            f"txt_id_imagen={page_id * 100 + n}&txt_rotar=0&txt_contraste=0&appOrigen=&dbCode={page_id}')\">{n}</a>"
+            for n in range(1, self.images + 1)
+        ]
+        return "<html><body>\n" + "\n".join(lines) + "\n</body></html>"
+
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, body, content_type="text/html; charset=utf-8", cookie=None):
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if cookie:
+                self.send_header("Set-Cookie", f"JSESSIONID={cookie}; Path=/")
+            self.end_headers()
+            self.wfile.write(body)
+            site.count("bytes", len(body))
+
+        def _session(self):
+            match = _COOKIE_RE.search(self.headers.get("Cookie", ""))
+            return match.group(1) if match else None
+
+        def _serve(self, kind, fn):
+            site.delay()
+            if site.inject_error():
+                site.count(f"{kind}_errors")
+                self._send(site.error_status, f"<html><body>Error {site.error_status}</body></html>")
+                return
+            site.count(kind)
+            fn()
+
+        def do_GET(self):
+            if "/ViewImage.do" in self.path:
+                self._serve("image", lambda: self._send(200, site.image_body, "image/jpeg"))
+                return
+            match = _PATH_RE.search(self.path)
+            if not match:
+                self._send(404, "<html><body>No encontrado</body></html>")
+                return
+            kind, page_id = match.group(1), int(match.group(2))
+            if kind == "description":
+                self._serve(kind, lambda: self._send(200, site.description(page_id)))
+            elif kind == "show":
+                self._serve(kind, lambda: self._send(200, site.show(page_id)))
+            else:
+                # Como en Pares, la página contiene fija en sesión qué listará el POST
+                session = self._session() or uuid.uuid4().hex
+                with site._lock:
+                    site.sessions[session] = page_id
+                self._serve("contiene_page", lambda: self._send(
+                    200, f"<html><body>Contiene {page_id}</body></html>", cookie=session))
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            form = dict(urllib.parse.parse_qsl(body.decode("utf-8", "replace")))
+            if not self.path.endswith("SearchController.do"):
+                self._send(404, "<html><body>No encontrado</body></html>")
+                return
+            page_id = site.sessions.get(self._session())
+            if page_id is None:
+                site.count("contiene_sin_sesion")
+                self._send(200, "<table></table>")
+                return
+            self._serve("contiene", lambda: self._send(200, site.contiene_list(page_id, form)))
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+# --- Workers ---------------------------------------------------------------------------
+
+def _worker(workdir, kwargs):
+    os.chdir(workdir)
+    from iterando import run_scraper
+    run_scraper(**kwargs)
+    usage = {
+        "pid": os.getpid(),
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "children_max_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+    with open(os.path.join(workdir, f"rusage_{os.getpid()}.json"), "w") as f:
+        json.dump(usage, f)
+
+
+# --- Resultados ------------------------------------------------------------------------
+
+def read_metrics(metrics_dir):
+    """Suma los volcados ``pares_<pid>.prom`` de todos los workers."""
+    buckets, counters = {}, {}
+    for path in glob.glob(os.path.join(metrics_dir, "*.prom")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                match = _METRIC_RE.match(line.strip())
+                if not match:
+                    continue
+                name, labels, value = match.group(1), dict(_LABEL_RE.findall(match.group(2))), float(match.group(3))
+                if "le" in labels:
+                    le = float("inf") if labels["le"] == "+Inf" else float(labels["le"])
+                    stage = buckets.setdefault(labels["stage"], {})
+                    stage[le] = stage.get(le, 0) + value
+                elif "stage" not in labels:
+                    counters[name] = counters.get(name, 0) + value
+    return buckets, counters
+
+
+def quantile(cumulative, q):
+    """Cuantil aproximado a partir de buckets acumulados (interpolación lineal)."""
+    bounds = sorted(cumulative)
+    total = cumulative[bounds[-1]]
+    if not total:
+        return 0.0
+    target = q * total
+    prev_bound, prev_count = 0.0, 0
+    for bound in bounds:
+        count = cumulative[bound]
+        if count >= target:
+            if bound == float("inf"):
+                return prev_bound
+            if count == prev_count:
+                return bound
+            return prev_bound + (bound - prev_bound) * (target - prev_count) / (count - prev_count)
+        prev_bound, prev_count = bound, count
+    return prev_bound
+
+
+def compare(result, baseline, tolerance):
+    """Lista de regresiones de ``result`` respecto a ``baseline``."""
+    regressions = []
+    for key in ("pages_per_s", "images_per_s"):
+        old, new = baseline.get(key, 0), result.get(key, 0)
+        if old and new < old * (1 - tolerance):
+            regressions.append(f"{key}: {new:.2f} < {old:.2f}")
+    for stage, old in baseline.get("stages", {}).items():
+        new = result["stages"].get(stage)
+        # Por debajo de 5ms el ruido manda
+        if new and new["p99"] > max(old["p99"] * (1 + tolerance), old["p99"] + 0.005):
+            regressions.append(f"p99 {stage}: {new['p99'] * 1000:.1f}ms > {old['p99'] * 1000:.1f}ms")
+    old_rss = max((w["max_rss_mb"] for w in baseline.get("workers", [])), default=0)
+    new_rss = max((w["max_rss_mb"] for w in result.get("workers", [])), default=0)
+    if old_rss and new_rss > old_rss * (1 + tolerance):
+        regressions.append(f"memoria máxima por worker: {new_rss:.0f}MB > {old_rss:.0f}MB")
+    return regressions
+
+
+def print_report(result):
+    print(f"\n{result['pages']} páginas, {result['images']} imágenes en {result['elapsed_s']:.2f}s "
+          f"con {result['config']['workers']} workers")
+    print(f"  {result['pages_per_s']:.2f} páginas/s, {result['images_per_s']:.2f} imágenes/s, "
+          f"{result['mb_per_s']:.2f} MB/s")
+    print("  Etapa            n        p50        p99")
+    for stage, s in sorted(result["stages"].items()):
+        print(f"  {stage:14s} {s['count']:6d} {s['p50'] * 1000:8.1f}ms {s['p99'] * 1000:8.1f}ms")
+    for w in result["workers"]:
+        print(f"  worker {w['pid']}: {w['max_rss_mb']:.0f}MB (descendientes {w['children_max_rss_mb']:.0f}MB)")
+    print(f"  servidor: {json.dumps(result['server'], sort_keys=True)}")
+
+
+# --- Main ------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de extremo a extremo contra un Pares local')
+    parser.add_argument('--workers', type=int, default=1, help='Procesos run_scraper')
+    parser.add_argument('--contexts', type=int, default=1, help='Contextos de navegador por proceso')
+    parser.add_argument('--fetch-mode', choices=['browser', 'http'], default='http')
+    parser.add_argument('--units', type=int, default=10, help='Descripciones raíz (semillas)')
+    parser.add_argument('--children', type=int, default=10, help='Descripciones hijas por contiene')
+    parser.add_argument('--images', type=int, default=5, help='Imágenes por descripción')
+    parser.add_argument('--image-kb', type=int, default=200, help='Tamaño de cada imagen servida')
+    parser.add_argument('--skip-images', action='store_true', help='No descargar imágenes')
+    parser.add_argument('--recorded', help='Directorio con páginas grabadas a servir cuando existan')
+    parser.add_argument('--latency', type=float, default=0, help='Latencia media inyectada (ms)')
+    parser.add_argument('--jitter', type=float, default=0.3, help='Desviación de la latencia (fracción de la media)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fracción de respuestas con error')
+    parser.add_argument('--error-status', type=int, default=503, help='Código HTTP de los errores inyectados')
+    parser.add_argument('--contiene-page-field', help='Campo de página del listado contiene (sin él no se pagina)')
+    parser.add_argument('--contiene-block-size', type=int, default=10000,
+                        help='Unidades por bloque del listado contiene (con --contiene-page-field)')
+    parser.add_argument('--frontier', choices=['fifo', 'priority', 'depth'], default='priority')
+    parser.add_argument('--html-rate', type=float, default=1000, help='Tasa HTML global (alta: no limita)')
+    parser.add_argument('--image-rate', type=float, default=1000, help='Tasa de imágenes global')
+    parser.add_argument('--idle-timeout', type=float, default=3)
+    parser.add_argument('--redis-url', default='redis://localhost:6379/15',
+                        help='Base de Redis del benchmark (se vacía antes y después)')
+    parser.add_argument('--force', action='store_true', help='Vaciar la base de Redis aunque tenga datos')
+    parser.add_argument('--keep', action='store_true', help='Conservar el directorio de trabajo y Redis')
+    parser.add_argument('--json', help='Guardar el resultado en este fichero')
+    parser.add_argument('--save-baseline', help='Guardar el resultado como línea base')
+    parser.add_argument('--baseline', help='Comparar con esta línea base')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Margen antes de considerar regresión')
+    args = parser.parse_args()
+
+    # Antes de importar iterando: los workers leen PARES_REDIS_URL al arrancar
+    os.environ["PARES_REDIS_URL"] = args.redis_url
+    from work_queue import RedisWorkQueue
+
+    r = redis.StrictRedis.from_url(args.redis_url)
+    if r.dbsize() and not args.force:
+        print(f"La base {args.redis_url} no está vacía; usa --force para vaciarla")
+        return 2
+    r.flushdb()
+
+    site = StandInPares(args.units, args.children, args.images, args.image_kb, recorded=args.recorded,
+                        latency_ms=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate, error_status=args.error_status,
+                        page_field=args.contiene_page_field)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(site))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    workdir = tempfile.mkdtemp(prefix="pares_bench_")
+    metrics_dir = os.path.join(workdir, "metrics")
+    queue = RedisWorkQueue(r, frontier=args.frontier, base_url=base_url)
+    queue.enqueue_many(
+        [f"{base_url}{CATALOGO}/description/{i}" for i in range(1, args.units + 1)]
+    )
+    kwargs = {
+        "base_url": base_url,
+        "skip_download": args.skip_images,
+        "tor_disable": True,
+        "idle_timeout": args.idle_timeout,
+        "fetch_mode": args.fetch_mode,
+        "contexts": args.contexts,
+        "log_mode": "production",
+        "metrics_dir": metrics_dir,
+        "html_rate": args.html_rate,
+        "html_max_rate": args.html_rate,
+        "image_rate": args.image_rate,
+        "image_max_rate": args.image_rate,
+        "cache_dir": None,
+        "frontier": args.frontier,
+        "contiene_block_size": args.contiene_block_size,
+        "contiene_page_field": args.contiene_page_field,
+    }
+
+    print(f"Pares simulado en {base_url}, {args.workers} workers, trabajo en {workdir}")
+    start = time.monotonic()
+    processes = [Process(target=_worker, args=(workdir, kwargs)) for _ in range(args.workers)]
+    for p in processes:
+        p.start()
+
+    # El final es cuando todo lo visto está hecho, no cuando los workers agotan su idle_timeout
+    finished = None
+    while any(p.is_alive() for p in processes):
+        if finished is None and queue.pending() == 0 and queue.done_count() >= queue.seen_count() > 0:
+            finished = time.monotonic()
+        time.sleep(0.2)
+    for p in processes:
+        p.join()
+    elapsed = max((finished or time.monotonic()) - start, 1e-6)
+    server.shutdown()
+
+    buckets, counters = read_metrics(metrics_dir)
+    workers = []
+    for path in glob.glob(os.path.join(workdir, "rusage_*.json")):
+        with open(path) as f:
+            workers.append(json.load(f))
+
+    pages = queue.done_count()
+    images = int(counters.get("pares_images_downloaded_total", 0))
+    result = {
+        "config": {k: v for k, v in vars(args).items()
+                   if k not in ("json", "save_baseline", "baseline", "keep", "force")},
+        "elapsed_s": elapsed,
+        "pages": pages,
+        "pages_per_s": pages / elapsed,
+        "images": images,
+        "images_per_s": images / elapsed,
+        "mb_per_s": counters.get("pares_image_bytes_total", 0) / elapsed / (1024 * 1024),
+        "counters": counters,
+        "stages": {
+            stage: {"count": int(cum[float("inf")]), "p50": quantile(cum, 0.5), "p99": quantile(cum, 0.99)}
+            for stage, cum in buckets.items()
+        },
+        "workers": workers,
+        "server": site.counts,
+    }
+    print_report(result)
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2, sort_keys=True)
+            print(f"Resultado guardado en {path}")
+
+    if not args.keep:
+        r.flushdb()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESIÓN {regression}")
+        if regressions:
+            return 1
+        print(f"Sin regresiones respecto a {args.baseline} (tolerancia {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# bench_parser.py
+"""
+Micro-benchmark del parseo sobre páginas de Pares guardadas.
+
+Compara la extracción antigua (varias pasadas con html.parser) con
+``pares_parser.extract_page`` para cada backend disponible y comprueba que los
+campos extraídos coinciden, para detectar regresiones a nivel de campo.
+
+Las páginas se leen de un directorio con ficheros ``description_<id>.html``,
+``contiene_<id>.html`` o ``find_<id>.html``:
+
+    python3 bench_parser.py paginas_guardadas/ --repeat 20
+"""
+import os
+import re
+import sys
+import glob
+import time
+import argparse
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+
+from pares_parser import HAS_LXML, extract_page, sanitizar_texto
+
+BASE_URL = "https://pares.mcu.es"
+
+
+def legacy_extract(html, kind):
+    """Reproduce la extracción anterior (un árbol para enlaces y otro para la ficha)."""
+    soup = BeautifulSoup(html, 'html.parser')
+    result = {"contiene": [], "descriptions": [], "show": None, "ficha": {}}
+    if kind == "description":
+        result["contiene"] = [urljoin(BASE_URL, a['href']) for a in soup.find_all('a', href=re.compile(r'/contiene/\d+'))]
+        show = soup.find('a', href=re.compile(r'/show/\d+'))
+        result["show"] = urljoin(BASE_URL, show['href']) if show else None
+        # parse_html_to_json volvía a parsear el mismo HTML
+        ficha_soup = BeautifulSoup(html, 'html.parser')
+        wrapper = ficha_soup.find(id="wrapper_ficha")
+        area = wrapper.find(class_="area") if wrapper else None
+        for info in (area.find_all(class_="info") if area else []):
+            title_element = info.find('h4', class_='aviso')
+            value_element = info.find('p')
+            if title_element and value_element:
+                title = title_element.get_text(strip=True).rstrip(':')
+                value = sanitizar_texto(''.join(value_element.stripped_strings))
+                link = value_element.find('a')
+                result["ficha"][title] = {'texto': value, 'link': link['href']} if link else value
+    elif kind == "find":
+        result["descriptions"] = [urljoin(BASE_URL, a['href']) for a in soup.find_all('a', href=re.compile(r'/description/\d+'))]
+    else:
+        seen, urls = set(), []
+        for pattern in (r'/description/\d+', r'description/\d+', r'/catalogo/description/\d+', r'catalogo/description/\d+'):
+            for link in soup.find_all('a', href=re.compile(pattern)):
+                if link['href'] not in seen:
+                    seen.add(link['href'])
+                    urls.append(urljoin(BASE_URL, link['href']))
+        soup.find_all('a')
+        for script in soup.find_all('script'):
+            content = script.get_text()
+            if 'description' in content.lower():
+                for desc_id in re.findall(r'description[/\\](\d+)', content):
+                    desc_url = f"{BASE_URL}/ParesBusquedas20/catalogo/description/{desc_id}"
+                    if desc_url not in urls:
+                        urls.append(desc_url)
+        result["descriptions"] = urls
+    return result
+
+
+def compare(kind, legacy, new):
+    """Devuelve la lista de diferencias relevantes para el tipo de página."""
+    diffs = []
+    if kind == "description":
+        if legacy["contiene"] != new["contiene"]:
+            diffs.append("contiene")
+        if legacy["show"] != new["show"]:
+            diffs.append("show")
+        for field in set(legacy["ficha"]) | set(new["ficha"]):
+            if legacy["ficha"].get(field) != new["ficha"].get(field):
+                diffs.append(f"ficha[{field}]")
+    elif set(legacy["descriptions"]) - set(new["descriptions"]):
+        # Se admiten enlaces extra (p. ej. rutas relativas), nunca perder alguno
+        diffs.append("descriptions")
+    return diffs
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del parseo de páginas de Pares guardadas')
+    parser.add_argument('pages_dir', help='Directorio con description_<id>.html, contiene_<id>.html, find_<id>.html')
+    parser.add_argument('--repeat', type=int, default=10, help='Repeticiones por página')
+    args = parser.parse_args()
+
+    pages = sorted(glob.glob(os.path.join(args.pages_dir, "*.html")))
+    if not pages:
+        print(f"No hay páginas .html en {args.pages_dir}")
+        return 1
+
+    backends = ["html.parser"] + (["lxml"] if HAS_LXML else [])
+    totals = {"legacy": 0.0, **{b: 0.0 for b in backends}}
+    regressions = 0
+
+    for path in pages:
+        kind = os.path.basename(path).split("_", 1)[0]
+        if kind not in ("description", "contiene", "find"):
+            continue
+        with open(path, encoding="utf-8", errors="replace") as f:
+            html = f.read()
+        with_ficha = kind == "description"
+        legacy = legacy_extract(html, kind)
+        totals["legacy"] += timed(lambda: legacy_extract(html, kind), args.repeat)
+        for backend in backends:
+            new = extract_page(html, BASE_URL, parser=backend, with_ficha=with_ficha)
+            totals[backend] += timed(lambda: extract_page(html, BASE_URL, parser=backend, with_ficha=with_ficha), args.repeat)
+            diffs = compare(kind, legacy, new)
+            if diffs:
+                regressions += 1
+                print(f"REGRESIÓN {os.path.basename(path)} [{backend}]: {', '.join(diffs)}")
+
+    print(f"{len(pages)} páginas, {args.repeat} repeticiones")
+    for name, total in totals.items():
+        speedup = totals["legacy"] / total if total else 0
+        print(f"  {name:12s} {total * 1000:9.2f} ms/pasada completa  (x{speedup:.2f} vs legacy)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
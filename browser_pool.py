@@ -0,0 +1,185 @@
+# browser_pool.py
+import random
+import logging
+from circuit_pool import CircuitPool
+
+
+class BrowserSlot:
+    """Un contexto de navegador con su página, UA, cookies, circuito de Tor y contador."""
+
+    def __init__(self, index):
+        self.index = index
+        self.context = None
+        self.page = None
+        self.user_agent = None
+        self.circuit = None
+        # Circuito del cliente HTTP: el del navegador salvo que éste no admita auth SOCKS5
+        self.http_circuit = None
+        # False si el contexto va directo (fallback sin Tor) o el pool no usa proxy
+        self.proxied = False
+        self.request_count = 0
+        self.needs_rotation = False
+        self.generation = 0
+        self.http_fetcher = None
+
+    @property
+    def name(self):
+        return f"ctx{self.index}"
+
+    def proxy_url(self, host="127.0.0.1", port=9050):
+        """URL SOCKS para clientes HTTP; puerto y credenciales aíslan el circuito en Tor."""
+        circuit = self.http_circuit or self.circuit
+        if circuit:
+            return circuit.url()
+        return f"socks5h://{host}:{port}"
+
+
+class ContextPool:
+    """
+    Un navegador y ``size`` contextos independientes dentro del mismo proceso.
+
+    Cada :class:`BrowserSlot` tiene su propio User-Agent, cookies y circuito
+    de Tor (ver :class:`CircuitPool`), de modo que el bucle de rastreo puede
+    repartir URLs entre ellos. Con la API síncrona de Playwright todas las llamadas al
+    navegador deben hacerse desde el hilo que lo arrancó; de eso se encarga
+    ``ParesFileScraper._on_browser``.
+
+    El navegador compartido no se cierra para atender a un solo contexto: el
+    fallback directo (sin Tor) de un slot abre su contexto en un segundo
+    navegador sin proxy, que se lanza al primer uso y se cierra cuando ningún
+    slot lo necesita.
+    """
+
+    ENGINES = ["chromium", "firefox", "webkit"]
+
+    def __init__(self, pw, size, use_tor, user_agent_factory, http_fetcher_factory=None,
+                 proxy_server="socks5://127.0.0.1:9050", circuit_pool=None):
+        self.logger = logging.getLogger('ParesFileScraper')
+        self._pw = pw
+        self.use_tor = use_tor
+        self.proxy_server = proxy_server
+        self.user_agent_factory = user_agent_factory
+        self.http_fetcher_factory = http_fetcher_factory
+        self.circuit_pool = circuit_pool or CircuitPool("auth")
+        self.browser = None
+        self.direct_browser = None
+        self.engine = None
+        self.proxied = use_tor
+        self.slots = [BrowserSlot(i) for i in range(max(1, size))]
+
+    def launch(self):
+        """Lanza un navegador nuevo (motor aleatorio) y abre todos los contextos."""
+        self.proxied = self.use_tor
+        self.engine = random.choice(self.ENGINES)
+        launcher = getattr(self._pw, self.engine)
+        self.logger.info(f"[SESSION] Lanzando {self.engine} con {len(self.slots)} contextos")
+
+        launch_kwargs = {"headless": True}
+        if self.proxied:
+            launch_kwargs["proxy"] = {"server": self.proxy_server}
+        self.browser = launcher.launch(**launch_kwargs)
+        if self.proxied and self.circuits is not self.circuit_pool:
+            self.logger.warning(f"[SESSION] {self.engine} no admite credenciales SOCKS5: sus contextos usan un "
+                                f"SocksPort cada uno ({len(self.circuits.circuits)} puertos para "
+                                f"{len(self.slots)} contextos)")
+
+        for slot in self.slots:
+            self.open_context(slot)
+
+    @property
+    def circuits(self):
+        """Pool del que salen los circuitos con el motor actual (``ports`` si no hay auth SOCKS5)."""
+        if self.circuit_pool.mode == "auth" and self.engine != "firefox":
+            return self.circuit_pool.ports_fallback()
+        return self.circuit_pool
+
+    @staticmethod
+    def _isolated(circuits, size):
+        return circuits.mode == "auth" or len(circuits.circuits) >= size
+
+    @property
+    def circuit_isolated(self):
+        """Cierto si cada contexto tiene un circuito propio que el navegador respeta."""
+        return self._isolated(self.circuits, len(self.slots))
+
+    @property
+    def http_isolated(self):
+        """Como ``circuit_isolated``, para el cliente HTTP (que sí admite credenciales SOCKS5)."""
+        return self._isolated(self.circuit_pool, len(self.slots))
+
+    def record(self, circuit, ok, latency=None):
+        """Puntúa ``circuit`` en el pool del que salió (el de auth o el de puertos)."""
+        pool = self.circuit_pool if self.circuit_pool.owns(circuit) else self.circuits
+        return pool.record(circuit, ok, latency)
+
+    def open_context(self, slot, direct=False):
+        """(Re)abre el contexto de ``slot`` con UA y circuito de Tor nuevos (sin Tor si ``direct``)."""
+        slot.generation += 1
+        slot.proxied = self.proxied and not direct
+        slot.user_agent = self.user_agent_factory()
+        own_http = slot.http_circuit if slot.http_circuit is not slot.circuit else None
+        slot.circuit = self.circuits.acquire(slot.circuit)
+        if self.http_fetcher_factory is None or self.circuits is self.circuit_pool:
+            self.circuit_pool.release(own_http)
+            slot.http_circuit = slot.circuit
+        else:
+            # El cliente HTTP conserva un circuito con credenciales propias aunque el navegador no pueda
+            slot.http_circuit = self.circuit_pool.acquire(own_http)
+        slot.needs_rotation = False
+        self.logger.debug(f"[SESSION] {slot.name}: User-Agent asignado: {slot.user_agent}, circuito {slot.circuit}")
+
+        context_kwargs = {"user_agent": slot.user_agent}
+        browser = self.browser
+        if slot.proxied:
+            proxy = {"server": slot.circuit.server}
+            # Chromium no admite autenticación SOCKS5; Firefox sí
+            if self.engine == "firefox" and slot.circuit.auth:
+                proxy.update({"username": slot.circuit.auth[0], "password": slot.circuit.auth[1]})
+            context_kwargs["proxy"] = proxy
+        elif self.proxied:
+            browser = self._direct()
+        slot.context = browser.new_context(**context_kwargs)
+        slot.page = slot.context.new_page()
+        slot.request_count = 0
+
+        if self.http_fetcher_factory:
+            if slot.http_fetcher is None:
+                slot.http_fetcher = self.http_fetcher_factory()
+            # Las cookies del cliente HTTP pertenecían al contexto anterior
+            slot.http_fetcher.reset()
+            if slot.proxied:
+                slot.http_fetcher.set_proxy(slot.proxy_url())
+            else:
+                slot.http_fetcher.set_proxy(None)
+        if not direct:
+            self._close_direct()
+
+    def _direct(self):
+        """Navegador sin proxy (mismo motor) para los contextos en fallback directo."""
+        if self.direct_browser is None:
+            self.logger.info(f"[SESSION] Lanzando {self.engine} sin proxy para el fallback directo")
+            self.direct_browser = getattr(self._pw, self.engine).launch(headless=True)
+        return self.direct_browser
+
+    def _close_direct(self):
+        if self.direct_browser is None or any(s.context and not s.proxied for s in self.slots):
+            return
+        try: self.direct_browser.close()
+        except: pass
+        self.direct_browser = None
+
+    def close_context(self, slot):
+        for obj in (slot.page, slot.context):
+            try: obj.close()
+            except: pass
+        slot.page = None
+        slot.context = None
+
+    def close(self):
+        for slot in self.slots:
+            self.close_context(slot)
+        for browser in (self.browser, self.direct_browser):
+            try: browser.close()
+            except: pass
+        self.browser = None
+        self.direct_browser = None
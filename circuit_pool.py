@@ -0,0 +1,184 @@
+# circuit_pool.py
+import os
+import time
+import secrets
+import logging
+import threading
+
+
+class Circuit:
+    """Una vía aislada hacia Tor: un SocksPort y, opcionalmente, credenciales SOCKS propias."""
+
+    def __init__(self, host, port, auth=None):
+        self.host = host
+        self.port = port
+        self.auth = auth
+        self.latency = None      # Media móvil exponencial (s)
+        self.error_rate = 0.0    # Media móvil exponencial de fallos (0..1)
+        self.samples = 0
+        self.users = 0
+        self.retired = False
+        self.cooldown_until = 0
+
+    @property
+    def server(self):
+        return f"socks5://{self.host}:{self.port}"
+
+    def url(self, scheme="socks5h"):
+        if self.auth:
+            return f"{scheme}://{self.auth[0]}:{self.auth[1]}@{self.host}:{self.port}"
+        return f"{scheme}://{self.host}:{self.port}"
+
+    def __repr__(self):
+        name = self.auth[0] if self.auth else "-"
+        latency = f"{self.latency:.2f}s" if self.latency is not None else "?"
+        return f"<Circuit {self.port}/{name} lat={latency} err={self.error_rate:.2f}>"
+
+
+class CircuitPool:
+    """
+    Reparte circuitos de Tor aislados entre workers/contextos y retira los malos.
+
+    Modos:
+      - ``auth``: un solo SocksPort con credenciales distintas por circuito
+        (Tor aísla por credenciales gracias a ``IsolateSOCKSAuth``, activo por
+        defecto). Un circuito retirado se sustituye por credenciales nuevas.
+      - ``ports``: un SocksPort distinto por circuito (ver ``torrc``). Vale
+        también para Chromium, que no admite autenticación SOCKS5. Un puerto
+        retirado pasa ``cooldown`` segundos fuera del reparto.
+
+    Cada petición se puntúa con :meth:`record`; si la tasa de error o la
+    latencia media superan los umbrales tras ``min_samples`` muestras, el
+    circuito se retira y :meth:`record` devuelve True para que el contexto
+    cambie de circuito.
+    """
+
+    def __init__(self, mode="auth", host="127.0.0.1", ports=(9050,), alpha=0.3,
+                 max_error_rate=0.5, max_latency=30.0, min_samples=5, cooldown=300):
+        if mode not in ("auth", "ports"):
+            raise ValueError(f"Modo de circuitos desconocido: {mode}")
+        self.logger = logging.getLogger('ParesFileScraper')
+        self.mode = mode
+        self.host = host
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.max_latency = max_latency
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._serial = 0
+        self.ports = list(ports)
+        self._fallback = None
+        if mode == "ports":
+            self.circuits = [Circuit(host, port) for port in ports]
+        else:
+            self.circuits = []
+            self.port = ports[0]
+
+    def _new_auth_circuit(self):
+        self._serial += 1
+        auth = (f"pares-{os.getpid()}-{self._serial}", secrets.token_hex(8))
+        circuit = Circuit(self.host, self.port, auth=auth)
+        self.circuits.append(circuit)
+        return circuit
+
+    def _available(self):
+        now = time.time()
+        for circuit in self.circuits:
+            if circuit.retired and now >= circuit.cooldown_until and self.mode == "ports":
+                # Fin del enfriamiento: el puerto vuelve con la puntuación a cero
+                circuit.retired = False
+                circuit.latency, circuit.error_rate, circuit.samples = None, 0.0, 0
+        return [c for c in self.circuits if not c.retired]
+
+    def acquire(self, previous=None):
+        """Asigna un circuito (el menos usado y más rápido), liberando ``previous``."""
+        with self._lock:
+            if previous is not None:
+                previous.users = max(0, previous.users - 1)
+                if self.mode == "auth" and previous.users == 0 and previous in self.circuits:
+                    # Rotar es pedir otro circuito: las credenciales liberadas no se reutilizan
+                    self.circuits.remove(previous)
+            candidates = self._available()
+            if self.mode == "auth":
+                # Un circuito por contexto: se crea uno nuevo si todos están ocupados
+                free = [c for c in candidates if c.users == 0]
+                circuit = free[0] if free else self._new_auth_circuit()
+            else:
+                if not candidates:
+                    # Todos retirados: mejor un puerto malo que ninguno
+                    candidates = sorted(self.circuits, key=lambda c: c.cooldown_until)[:1]
+                    candidates[0].retired = False
+                circuit = min(candidates, key=lambda c: (c.users, c.latency or 0))
+            circuit.users += 1
+            return circuit
+
+    def record(self, circuit, ok, latency=None):
+        """Puntúa una petición; devuelve True si el circuito acaba de ser retirado."""
+        if circuit is None:
+            return False
+        with self._lock:
+            circuit.samples += 1
+            circuit.error_rate = (1 - self.alpha) * circuit.error_rate + self.alpha * (0.0 if ok else 1.0)
+            if ok and latency is not None:
+                circuit.latency = latency if circuit.latency is None else \
+                    (1 - self.alpha) * circuit.latency + self.alpha * latency
+            if circuit.retired or circuit.samples < self.min_samples:
+                return False
+            slow = circuit.latency is not None and circuit.latency > self.max_latency
+            if circuit.error_rate > self.max_error_rate or slow:
+                circuit.retired = True
+                circuit.cooldown_until = time.time() + self.cooldown
+                if self.mode == "auth":
+                    self.circuits.remove(circuit)
+                self.logger.warning(f"[CIRCUIT] Retirado {circuit} ({'lento' if slow else 'errores'})")
+                return True
+            return False
+
+    def release(self, circuit):
+        """Libera ``circuit`` sin asignar otro."""
+        if circuit is None:
+            return
+        with self._lock:
+            circuit.users = max(0, circuit.users - 1)
+            if self.mode == "auth" and circuit.users == 0 and circuit in self.circuits:
+                self.circuits.remove(circuit)
+
+    def owns(self, circuit):
+        with self._lock:
+            return any(c is circuit for c in self.circuits)
+
+    def ports_fallback(self):
+        """
+        Pool en modo ``ports`` con los mismos puertos, para clientes sin autenticación SOCKS5.
+
+        Chromium y WebKit ignoran las credenciales del proxy: en modo ``auth`` todos
+        sus contextos irían por el mismo circuito aunque el pool los contara como distintos.
+        """
+        if self.mode == "ports":
+            return self
+        with self._lock:
+            if self._fallback is None:
+                self._fallback = CircuitPool("ports", host=self.host, ports=self.ports, alpha=self.alpha,
+                                             max_error_rate=self.max_error_rate, max_latency=self.max_latency,
+                                             min_samples=self.min_samples, cooldown=self.cooldown)
+            return self._fallback
+
+    def stats(self):
+        with self._lock:
+            return [repr(c) for c in self.circuits]
+
+
+def parse_ports(spec):
+    """'9050,9052-9055' -> [9050, 9052, 9053, 9054, 9055]"""
+    ports = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            ports.extend(range(int(start), int(end) + 1))
+        else:
+            ports.append(int(part))
+    return ports
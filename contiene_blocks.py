@@ -0,0 +1,143 @@
+# contiene_blocks.py
+"""
+Listados contiene por bloques, compartido por los dos motores.
+
+El listado de una contiene sale de un POST a ``SearchController.do`` con
+``CONTIENE_FORM``; ``tambloque`` es el número de unidades por respuesta. El
+campo con el número de bloque no está confirmado contra el servidor, así que
+la paginación sólo se activa si se indica (``--contiene-page-field``). Sin él
+se hace el POST de siempre, un único bloque de ``CONTIENE_BLOCK_SIZE``, y las
+contiene que lo llenan (listado posiblemente truncado) se anotan en
+``contiene_truncated`` para volver a pedirlas cuando el campo esté verificado.
+
+:class:`ContieneBlocks` sólo lleva la cuenta: qué bloques faltan, dónde acaba
+el listado y qué escribir en ``contiene_blocks:<id>``. Las peticiones y las
+escrituras en Redis las hace cada motor.
+"""
+
+# POST AJAX que devuelve el listado de una página contiene
+SEARCH_CONTROLLER_PATH = "/ParesBusquedas20/catalogo/contiene/SearchController.do"
+CONTIENE_FORM = {"tambloque": "10000", "orderBy": "0"}
+CONTIENE_BLOCK_SIZE = 10000
+# Intentos de una contiene con bloques fallidos antes de darla por terminada
+CONTIENE_MAX_ATTEMPTS = 3
+# Contiene que agotaron los intentos con bloques fallidos o repetidos
+CONTIENE_FAILED_KEY = "contiene_failed"
+# Contiene pedidas sin paginar cuyo único bloque vino lleno
+CONTIENE_TRUNCATED_KEY = "contiene_truncated"
+
+
+def contiene_form(block, block_size=CONTIENE_BLOCK_SIZE, page_field=None):
+    """Formulario de SearchController.do para el bloque ``block`` (desde 1) del listado."""
+    form = dict(CONTIENE_FORM, tambloque=str(block_size))
+    if block > 1:
+        if not page_field:
+            raise ValueError("Sin campo de página sólo existe el bloque 1")
+        # El primer bloque es el formulario de siempre (y la misma entrada de caché)
+        form[page_field] = str(block)
+    return form
+
+
+def progress_key(url):
+    return f"contiene_blocks:{url.rstrip('/').rsplit('/', 1)[-1]}"
+
+
+class ContieneBlocks:
+    """
+    Recorrido por bloques de una contiene, reanudable desde ``contiene_blocks:<id>``.
+
+    El hash guarda bloque -> descripciones encontradas, ``last`` (último bloque),
+    ``attempts`` y ``first:<enlace>`` -> bloque con el primer enlace de cada bloque
+    completo. Un bloque completo que repite otro anterior (también de una pasada
+    previa) cuenta como fallido: el servidor no está paginando y tomarlo por el
+    fin del listado perdería el resto.
+    """
+
+    def __init__(self, url, raw, block_size=CONTIENE_BLOCK_SIZE, page_field=None):
+        self.url = url
+        self.key = progress_key(url)
+        self.page_field = page_field
+        self.block_size = block_size if page_field else CONTIENE_BLOCK_SIZE
+        blocks, self.first_links = {}, {}
+        for field, value in raw.items():
+            field = field.decode() if isinstance(field, bytes) else field
+            if field.startswith("first:"):
+                self.first_links[field[len("first:"):]] = int(value)
+            else:
+                blocks[field] = int(value)
+        self.last = blocks.pop("last", None)
+        self.attempts = blocks.pop("attempts", 0)
+        if not page_field:
+            self.last = 1
+        self.done = {int(block) for block in blocks}
+        self.found = sum(blocks.values())
+        self.failed = []
+        self.repeated = {}
+        self.truncated = False
+        self._next = 1
+
+    def form(self, block):
+        return contiene_form(block, self.block_size, self.page_field)
+
+    def next_window(self, size):
+        """Hasta ``size`` bloques pendientes; lista vacía si ya no queda ninguno por pedir."""
+        if self.stalled:
+            return []
+        window = []
+        while len(window) < size and (self.last is None or self._next <= self.last):
+            if self._next not in self.done:
+                window.append(self._next)
+            self._next += 1
+        return window
+
+    @property
+    def stalled(self):
+        # Sin saber dónde acaba el listado no se sigue pidiendo a ciegas
+        return bool(self.failed) and self.last is None
+
+    @property
+    def blocks(self):
+        return self.last if self.last is not None else self._next - 1
+
+    def record(self, block, desc_urls):
+        """
+        Anota el resultado de ``block`` (``None`` si falló la petición).
+
+        Devuelve los campos a guardar en el hash, o None si el bloque cuenta como
+        fallido; si repetía otro, ``repeated[block]`` dice cuál.
+        """
+        if desc_urls is None:
+            self.failed.append(block)
+            return None
+        full = len(desc_urls) >= self.block_size
+        original = self.first_links.get(desc_urls[0], block) if desc_urls else block
+        if full and original != block:
+            self.repeated[block] = original
+            self.failed.append(block)
+            return None
+        self.found += len(desc_urls)
+        fields = {block: len(desc_urls)}
+        if not full:
+            self.last = block if self.last is None else min(self.last, block)
+            fields["last"] = self.last
+        elif self.page_field:
+            self.first_links[desc_urls[0]] = block
+            fields[f"first:{desc_urls[0]}"] = block
+        else:
+            self.truncated = True
+        return fields
+
+    def finish(self, pipe):
+        """Encola en ``pipe`` el cierre de la pasada; devuelve ``"done"``, ``"retry"`` o ``"failed"``."""
+        if not self.failed:
+            pipe.delete(self.key)
+            if self.truncated:
+                pipe.sadd(CONTIENE_TRUNCATED_KEY, self.url)
+            return "done"
+        self.attempts += 1
+        if self.attempts >= CONTIENE_MAX_ATTEMPTS:
+            pipe.sadd(CONTIENE_FAILED_KEY, self.url)
+            pipe.delete(self.key)
+            return "failed"
+        pipe.hset(self.key, "attempts", self.attempts)
+        return "retry"
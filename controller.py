@@ -1,6 +1,17 @@
-from iterando import initialize_redis, run_scraper
-from multiprocessing import Process
+from iterando import initialize_redis, run_scraper, redis_client
+from contiene_blocks import CONTIENE_BLOCK_SIZE
+from async_engine import run_async_scraper
+from circuit_pool import parse_ports
+from description_store import DescriptionStore, CompactionThread
+from work_queue import RedisWorkQueue, ReaperThread
+from worker_supervisor import WorkerSupervisor
+from image_queue import ImageJobQueue
+from image_worker import run_image_worker, backfill
+from sqlite_export import SqliteExporter
+from response_cache import DEFAULT_TTL
+import socket
 import argparse
+import threading
 
 if __name__ == "__main__":
     # Parse command-line option to skip downloads
@@ -17,26 +28,404 @@ if __name__ == "__main__":
         action='store_true',
         help='Desactiva el uso de Tor (no proxy)'
     )
+    parser.add_argument(
+        '--compact-interval',
+        type=int,
+        default=300,
+        help='Segundos entre compactaciones de los segmentos en description_data.json (0 = sólo al terminar)'
+    )
+    parser.add_argument(
+        '--reliable-queue',
+        action='store_true',
+        help='Cola fiable: cada URL en curso queda en processing:<worker> con lease y se reencola si el worker muere'
+    )
+    parser.add_argument(
+        '--idle-timeout',
+        type=int,
+        default=30,
+        help='Segundos que un worker espera con la cola vacía antes de terminar'
+    )
+    parser.add_argument(
+        '--image-concurrency',
+        type=int,
+        default=4,
+        help='Descargas de imágenes simultáneas por unidad'
+    )
+    parser.add_argument(
+        '--image-global-concurrency',
+        type=int,
+        default=8,
+        help='Máximo de descargas de imágenes simultáneas por proceso'
+    )
+    parser.add_argument(
+        '--fetch-mode',
+        choices=['browser', 'http'],
+        default='browser',
+        help='browser: todas las páginas con Playwright; http: Playwright sólo para cookies y páginas con cliente HTTP keep-alive'
+    )
+    parser.add_argument(
+        '--contexts',
+        type=int,
+        default=1,
+        help='Contextos de navegador (UA, cookies y credenciales de proxy propios) por proceso'
+    )
+    parser.add_argument(
+        '--circuit-mode',
+        choices=['auth', 'ports'],
+        default='auth',
+        help='auth: credenciales SOCKS distintas por contexto (IsolateSOCKSAuth); ports: un SocksPort de torrc por contexto'
+    )
+    parser.add_argument(
+        '--socks-ports',
+        default='9050',
+        help='SocksPorts de Tor a repartir, p. ej. "9050,9060-9063" (ver torrc)'
+    )
+    parser.add_argument(
+        '--parser',
+        choices=['auto', 'lxml', 'html.parser'],
+        default='auto',
+        help='Backend de BeautifulSoup (auto usa lxml si está instalado)'
+    )
+    parser.add_argument(
+        '--log-mode',
+        choices=['verbose', 'production'],
+        default='verbose',
+        help='production: sin log de depuración, escritura en hilo aparte y resúmenes en lugar de logs por URL'
+    )
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=0,
+        help='Puerto base del endpoint Prometheus /metrics (el worker i usa puerto+i; 0 = desactivado)'
+    )
+    parser.add_argument(
+        '--metrics-dir',
+        default=None,
+        help='Directorio donde cada worker vuelca sus métricas (pares_<pid>.prom) cada 15s'
+    )
+    parser.add_argument(
+        '--html-rate',
+        type=float,
+        default=0.5,
+        help='Tasa inicial de páginas HTML por segundo, compartida por todos los workers'
+    )
+    parser.add_argument(
+        '--html-max-rate',
+        type=float,
+        default=4.0,
+        help='Tope global de páginas HTML por segundo al que puede subir la tasa adaptativa'
+    )
+    parser.add_argument(
+        '--image-rate',
+        type=float,
+        default=4.0,
+        help='Tasa inicial de descargas de imágenes por segundo, compartida por todos los workers'
+    )
+    parser.add_argument(
+        '--image-max-rate',
+        type=float,
+        default=16.0,
+        help='Tope global de descargas de imágenes por segundo'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        default=None,
+        help='Activa la caché de respuestas HTML comprimidas en este directorio (por defecto desactivada)'
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        default=DEFAULT_TTL,
+        help='Segundos tras los que una respuesta cacheada se vuelve a pedir (por defecto una semana)'
+    )
+    parser.add_argument(
+        '--replay',
+        action='store_true',
+        help='Reprocesa todo desde la caché (--cache-dir, o cache/), sin red, navegador ni descargas de '
+             'imágenes; en este modo las entradas no caducan'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Procesos scraper al arrancar (y mínimo al escalar hacia abajo)'
+    )
+    parser.add_argument(
+        '--max-workers',
+        type=int,
+        default=None,
+        help='Máximo de procesos al escalar según la profundidad de todo_urls (por defecto = --workers)'
+    )
+    parser.add_argument(
+        '--scale-interval',
+        type=float,
+        default=30,
+        help='Segundos entre decisiones de escalado'
+    )
+    parser.add_argument(
+        '--scale-up-depth',
+        type=int,
+        default=500,
+        help='URLs pendientes por worker a partir de las cuales se añade otro'
+    )
+    parser.add_argument(
+        '--scale-down-depth',
+        type=int,
+        default=50,
+        help='Con menos URLs pendientes que esto se retira un worker'
+    )
+    parser.add_argument(
+        '--max-error-rate',
+        type=float,
+        default=0.2,
+        help='Tasa de error de páginas por encima de la cual se retira un worker en lugar de añadirlo'
+    )
+    parser.add_argument(
+        '--frontier',
+        choices=['fifo', 'priority', 'depth'],
+        default='priority',
+        help='fifo: una sola lista; priority: description > contiene > find; depth: además termina cada subárbol antes de expandir otro'
+    )
+    parser.add_argument(
+        '--async-concurrency',
+        type=int,
+        default=0,
+        help='Con N > 0 cada worker usa el motor asyncio (async_engine.py) con N URLs en vuelo; 0 = motor síncrono'
+    )
+    parser.add_argument(
+        '--parse-workers',
+        type=int,
+        default=2,
+        help='Procesos de parseo por worker con el motor asyncio'
+    )
+    parser.add_argument(
+        '--contiene-block-size',
+        type=int,
+        default=CONTIENE_BLOCK_SIZE,
+        help='Unidades por bloque al pedir el listado de una contiene (tambloque); sólo con '
+             '--contiene-page-field'
+    )
+    parser.add_argument(
+        '--contiene-page-field',
+        default=None,
+        help='Campo del formulario de SearchController.do con el número de bloque. Sin él no se pagina: '
+             f'un único bloque de {CONTIENE_BLOCK_SIZE} y las contiene que lo llenan se anotan en '
+             'contiene_truncated'
+    )
+    parser.add_argument(
+        '--contiene-parallel',
+        type=int,
+        default=4,
+        help='Bloques de una misma contiene descargados a la vez (con --fetch-mode http o el motor asyncio; '
+             'en modo browser van de uno en uno)'
+    )
+    parser.add_argument(
+        '--seed-file',
+        default='todo_urls.txt',
+        help='Semillas: una URL por línea o rangos de ids como description:1000-250000'
+    )
+    parser.add_argument(
+        '--seed-merge',
+        action='store_true',
+        help='Añadir las semillas nunca vistas aunque el frontier ya tenga URLs pendientes'
+    )
+    parser.add_argument(
+        '--sqlite',
+        default=None,
+        help='Base SQLite donde cada worker escribe también sus fichas al vuelo (ver sqlite_export.py)'
+    )
+    parser.add_argument(
+        '--image-mode',
+        choices=['queue', 'inline'],
+        default='queue',
+        help='queue: las fichas encolan sus imágenes en image_jobs y las descarga un pool aparte; inline: cada worker descarga las de sus fichas'
+    )
+    parser.add_argument(
+        '--image-workers',
+        type=int,
+        default=1,
+        help='Procesos de descarga de imágenes (modo queue) al arrancar y mínimo al escalar'
+    )
+    parser.add_argument(
+        '--max-image-workers',
+        type=int,
+        default=None,
+        help='Máximo de procesos de imágenes al escalar según la profundidad de image_jobs (por defecto = --image-workers)'
+    )
+    parser.add_argument(
+        '--image-units',
+        type=int,
+        default=2,
+        help='Unidades que descarga a la vez cada proceso de imágenes (cada una con su circuito de Tor)'
+    )
+    parser.add_argument(
+        '--image-scale-up-depth',
+        type=int,
+        default=20,
+        help='Unidades pendientes en image_jobs por worker a partir de las cuales se añade otro'
+    )
+    parser.add_argument(
+        '--image-scale-down-depth',
+        type=int,
+        default=2,
+        help='Con menos unidades pendientes en image_jobs que esto se retira un worker de imágenes'
+    )
+    parser.add_argument(
+        '--image-backfill',
+        action='store_true',
+        help='Al arrancar, encolar las fichas de description_data.json con imágenes incompletas'
+    )
     args = parser.parse_args()
+    if args.contiene_block_size != CONTIENE_BLOCK_SIZE and not args.contiene_page_field:
+        parser.error('--contiene-block-size necesita --contiene-page-field (sin paginación se pide el listado entero)')
+    if args.cache_ttl <= 0:
+        parser.error('--cache-ttl debe ser mayor que 0')
+    if args.replay and not args.cache_dir:
+        args.cache_dir = 'cache'
+    if args.async_concurrency and args.reliable_queue:
+        parser.error('--async-concurrency no admite --reliable-queue (sólo cola simple)')
+    if args.async_concurrency and args.image_mode == 'inline':
+        parser.error('--async-concurrency encola siempre las imágenes (no admite --image-mode inline)')
+
+    # Estado antiguo (URLs completas en done_urls/seen_urls) al formato compacto por id
+    RedisWorkQueue(redis_client(), frontier=args.frontier).migrate_legacy()
+
+    # Esquema y modo WAL de la base SQLite antes de que la abran los workers a la vez
+    if args.sqlite:
+        SqliteExporter(args.sqlite).close()
 
     # Inicializa Redis con las URLs desde el archivo externo
-    initialize_redis("todo_urls.txt")
-
-    # Crear múltiples procesos para ejecutar el scraper en paralelo
-    num_processes = 1  # Cambia este número según la cantidad de procesos deseados
-    processes = []
-
-    for _ in range(num_processes):
-        # Pasar los flags skip_download y tor_disable a run_scraper
-        p = Process(
-            target=run_scraper,
-            kwargs={
-                'skip_download': args.skip_download,
-                'tor_disable': args.tor_disable
-            }
+    initialize_redis(args.seed_file, frontier=args.frontier, merge=args.seed_merge)
+
+    def worker_kwargs(i):
+        return {
+            'skip_download': args.skip_download,
+            'tor_disable': args.tor_disable,
+            'reliable_queue': args.reliable_queue,
+            'idle_timeout': args.idle_timeout,
+            'image_concurrency': args.image_concurrency,
+            'image_global_concurrency': args.image_global_concurrency,
+            'fetch_mode': args.fetch_mode,
+            'contexts': args.contexts,
+            'circuit_mode': args.circuit_mode,
+            'socks_ports': parse_ports(args.socks_ports),
+            'parser': args.parser,
+            'log_mode': args.log_mode,
+            'metrics_port': args.metrics_port + i if args.metrics_port else 0,
+            'metrics_dir': args.metrics_dir,
+            'html_rate': args.html_rate,
+            'html_max_rate': args.html_max_rate,
+            'image_rate': args.image_rate,
+            'image_max_rate': args.image_max_rate,
+            'cache_dir': args.cache_dir,
+            'cache_ttl': args.cache_ttl,
+            'replay': args.replay,
+            'frontier': args.frontier,
+            'image_mode': args.image_mode,
+            'sqlite_path': args.sqlite,
+            'contiene_block_size': args.contiene_block_size,
+            'contiene_parallel': args.contiene_parallel,
+            'contiene_page_field': args.contiene_page_field
+        }
+
+    def async_worker_kwargs(i):
+        kwargs = worker_kwargs(i)
+        # El motor asyncio pide las páginas con context.request y encola siempre las imágenes
+        for key in ('reliable_queue', 'fetch_mode', 'log_mode', 'image_mode', 'image_concurrency',
+                    'image_global_concurrency', 'image_rate', 'image_max_rate'):
+            del kwargs[key]
+        kwargs.update(concurrency=args.async_concurrency, parse_workers=args.parse_workers)
+        return kwargs
+
+    max_workers = args.max_workers or args.workers
+
+    def image_worker_kwargs(i):
+        return {
+            # Id estable por hueco: el sucesor de un worker muerto recupera su trabajo en curso
+            'worker_id': f"{socket.gethostname()}:img{i}",
+            'tor_disable': args.tor_disable,
+            'circuit_mode': args.circuit_mode,
+            'socks_ports': parse_ports(args.socks_ports),
+            'units': args.image_units,
+            'image_concurrency': args.image_concurrency,
+            'image_global_concurrency': args.image_global_concurrency,
+            'image_rate': args.image_rate,
+            'image_max_rate': args.image_max_rate,
+            'html_rate': args.html_rate,
+            'html_max_rate': args.html_max_rate,
+            'idle_timeout': args.idle_timeout,
+            # Los puertos de métricas de imágenes van detrás de los de los workers de rastreo
+            'metrics_port': args.metrics_port + max_workers + i if args.metrics_port else 0,
+            'metrics_dir': args.metrics_dir
+        }
+
+    # Supervisor: mantiene entre --workers y --max-workers procesos, relanza los que
+    # mueren con backoff y drena ordenadamente con SIGTERM/Ctrl+C
+    r = redis_client()
+    supervisor = WorkerSupervisor(
+        run_async_scraper if args.async_concurrency else run_scraper,
+        async_worker_kwargs if args.async_concurrency else worker_kwargs,
+        RedisWorkQueue(r, reliable=args.reliable_queue, frontier=args.frontier),
+        r,
+        min_workers=args.workers,
+        max_workers=args.max_workers,
+        scale_interval=args.scale_interval,
+        high_water=args.scale_up_depth,
+        low_water=args.scale_down_depth,
+        max_error_rate=args.max_error_rate,
+    )
+
+    # Pool de imágenes: consume image_jobs con su propia concurrencia, presupuesto y
+    # circuitos; corre en un hilo y termina cuando el rastreo ha acabado y la cola se vacía
+    image_supervisor = None
+    image_thread = None
+    if args.image_mode == 'queue' and not (args.skip_download or args.replay):
+        image_jobs = ImageJobQueue(r)
+        # Sin workers de imágenes vivos: lo que quedó en curso vuelve a la cola
+        image_jobs.requeue_all()
+        if args.image_backfill:
+            queued, complete = backfill(image_jobs)
+            print(f"{queued} unidades encoladas para descargar imágenes ({complete} ya completas)")
+        image_supervisor = WorkerSupervisor(
+            run_image_worker,
+            image_worker_kwargs,
+            image_jobs,
+            r,
+            min_workers=args.image_workers,
+            max_workers=args.max_image_workers,
+            scale_interval=args.scale_interval,
+            high_water=args.image_scale_up_depth,
+            low_water=args.image_scale_down_depth,
+            max_error_rate=args.max_error_rate,
+            stats_prefix="stats:images",
+            upstream=supervisor,
+            name="ImageSupervisor",
         )
-        p.start()
-        processes.append(p)
+        image_thread = threading.Thread(target=image_supervisor.run, kwargs={'install_signals': False},
+                                        name="image-supervisor")
+        image_thread.start()
+
+    # Reaper: reencola las URLs de workers cuyo lease ha caducado
+    reaper = None
+    if args.reliable_queue:
+        reaper = ReaperThread(RedisWorkQueue(r, reliable=True, frontier=args.frontier))
+        reaper.start()
+
+    # Compactación periódica de los segmentos JSONL en description_data.json
+    store = DescriptionStore()
+    compactor = None
+    if args.compact_interval > 0:
+        compactor = CompactionThread(store, interval=args.compact_interval)
+        compactor.start()
+
+    supervisor.run()
+    if image_thread:
+        image_thread.join()
 
-    for p in processes:
-        p.join()
+    if reaper:
+        reaper.stop()
+    if compactor:
+        compactor.stop()
+        compactor.join()
+    # Todos los workers han terminado: compactación final
+    store.compact()
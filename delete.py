@@ -3,7 +3,20 @@ import redis
 def clear_redis():
     r = redis.StrictRedis(host='localhost', port=6379, db=0)
     r.delete("todo_urls")  # Elimina la lista de URLs pendientes
+    for key in r.scan_iter("todo_urls:*"):  # Niveles de prioridad del frontier
+        r.delete(key)
     r.delete("done_urls")  # Elimina el conjunto de URLs procesadas
+    r.delete("seen_urls")  # URLs ya encoladas alguna vez (dedup)
+    for key in r.scan_iter("*_ids:*"):  # Bitmaps por id: seen_ids:<tipo>, done_ids:<tipo>
+        r.delete(key)
+    r.delete("queue_workers")  # Workers registrados en la cola fiable
+    r.delete("seed_ranges")  # Rangos de ids por expandir
+    r.delete("url_attempts", "failed_urls")  # Errores por URL del motor asyncio y las que los agotaron
+    for key in r.scan_iter("contiene_blocks:*"):  # Progreso por bloque de los listados contiene
+        r.delete(key)
+    for pattern in ("processing:*", "lease:*", "ratelimit:*", "stats:*", "seed_load:*"):
+        for key in r.scan_iter(pattern):
+            r.delete(key)
     print("Redis keys 'todo_urls', 'done_urls', images y failed_images han sido eliminadas.")
 
 def delete_all_image_keys():
@@ -11,7 +24,7 @@ def delete_all_image_keys():
     r = redis.StrictRedis(host='localhost', port=6379, db=0)
 
     # Buscar y eliminar todas las claves relacionadas con imágenes
-    patterns = ["images:*", "failed_images:*", "last_downloaded_image:*"]  # Patrones para imágenes exitosas y falladas
+    patterns = ["images:*", "failed_images:*", "last_downloaded_image:*", "image_jobs*"]  # Imágenes exitosas, falladas y cola de descargas
     for pattern in patterns:
         print(f"Eliminando claves que coinciden con: {pattern}")
         for key in r.scan_iter(pattern):
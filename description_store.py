@@ -0,0 +1,282 @@
+# description_store.py
+import os
+import json
+import glob
+import time
+import fcntl
+import logging
+import threading
+
+
+def iter_json_object(path, chunk_size=1 << 20):
+    """
+    Recorre los pares ``(clave, valor)`` del objeto JSON de primer nivel de ``path``
+    leyendo por bloques, sin cargar el fichero ni el dict completos en memoria.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding='utf-8') as f:
+        buf, pos, eof = "", 0, False
+
+        def fill():
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            return not eof
+
+        def skip_ws():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n":
+                    pos += 1
+                if pos < len(buf) or not fill():
+                    return buf[pos] if pos < len(buf) else ""
+
+        def decode():
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                    # Un valor que acaba justo en el borde del bloque puede estar cortado
+                    if end < len(buf) or eof:
+                        pos = end
+                        return value
+                except ValueError:
+                    if eof:
+                        raise
+                fill()
+
+        if skip_ws() != "{":
+            raise ValueError(f"{path} no contiene un objeto JSON")
+        pos += 1
+        if skip_ws() == "}":
+            return
+        while True:
+            key = decode()
+            if skip_ws() != ":":
+                raise ValueError(f"JSON inválido en {path}: se esperaba ':'")
+            pos += 1
+            skip_ws()
+            yield key, decode()
+            sep = skip_ws()
+            pos += 1
+            if sep == "}":
+                return
+            if sep != ",":
+                raise ValueError(f"JSON inválido en {path}: se esperaba ',' o '}}'")
+            skip_ws()
+
+
+class DescriptionStore:
+    """
+    Almacén de descripciones de solo-anexado.
+
+    Cada proceso escribe sus fichas terminadas, una por línea, en su propio
+    segmento JSONL (``<segment_dir>/segment-<pid>.jsonl``), de modo que guardar
+    una ficha cuesta lo mismo con 10 que con 100.000 entradas y varios procesos
+    no se pisan entre sí. La compactación sella los segmentos (los renombra a
+    ``sealed-<ns>-segment-<pid>.jsonl``), los junta con el ``description_data.json``
+    existente, lo reescribe de forma atómica y borra los sellados. Un proceso
+    que escribe en un segmento sellado lo detecta bajo ``flock`` y abre uno nuevo.
+    Las compactaciones se excluyen entre sí (también entre procesos) con ``flock``
+    sobre ``<segment_dir>/compact.lock``.
+    """
+
+    def __init__(self, description_file="description_data.json", segment_dir="descriptions"):
+        self.logger = logging.getLogger('ParesFileScraper.Store')
+        self.description_file = description_file
+        self.segment_dir = segment_dir
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self._segment = None
+        self._segment_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def compact_lock_path(self):
+        return os.path.join(self.segment_dir, "compact.lock")
+
+    def _segment_path(self, pid=None):
+        return os.path.join(self.segment_dir, f"segment-{pid or os.getpid()}.jsonl")
+
+    def _open_segment(self):
+        # Tras un fork el descriptor heredado no es nuestro: abrimos segmento propio
+        pid = os.getpid()
+        if self._segment is None or self._segment_pid != pid:
+            self._segment = open(self._segment_path(pid), "a", encoding='utf-8')
+            self._segment_pid = pid
+        return self._segment
+
+    @staticmethod
+    def _is_live(segment):
+        """Cierto si ``segment`` sigue siendo el fichero de su ruta (no lo ha sellado una compactación)."""
+        try:
+            return os.stat(segment.name).st_ino == os.fstat(segment.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def append(self, page_id, record):
+        """Añade una ficha al segmento del proceso actual (una sola escritura)."""
+        line = json.dumps({"page_id": page_id, "data": record}, ensure_ascii=False) + "\n"
+        with self._lock:
+            segment = self._open_segment()
+            fcntl.flock(segment, fcntl.LOCK_EX)
+            if not self._is_live(segment):
+                # Sellado por la compactación: lo ya escrito se fusiona, lo nuevo va a un segmento nuevo
+                fcntl.flock(segment, fcntl.LOCK_UN)
+                segment.close()
+                self._segment = None
+                segment = self._open_segment()
+                fcntl.flock(segment, fcntl.LOCK_EX)
+            try:
+                segment.write(line)
+                segment.flush()
+            finally:
+                fcntl.flock(segment, fcntl.LOCK_UN)
+
+    def close(self):
+        with self._lock:
+            if self._segment is not None:
+                try:
+                    self._segment.close()
+                except Exception:
+                    pass
+                self._segment = None
+
+    def sealed_files(self):
+        return sorted(glob.glob(os.path.join(self.segment_dir, "sealed-*.jsonl")))
+
+    def segment_files(self):
+        """Segmentos sellados (de compactaciones que no terminaron) y después los activos."""
+        return self.sealed_files() + sorted(glob.glob(os.path.join(self.segment_dir, "segment-*.jsonl")))
+
+    def _seal_segments(self):
+        """Renombra los segmentos activos para fusionarlos; devuelve todos los sellados."""
+        for path in sorted(glob.glob(os.path.join(self.segment_dir, "segment-*.jsonl"))):
+            sealed = os.path.join(self.segment_dir, f"sealed-{time.time_ns()}-{os.path.basename(path)}")
+            try:
+                os.replace(path, sealed)
+            except FileNotFoundError:
+                continue
+            # Espera a que termine una escritura en curso; las siguientes verán el segmento sellado
+            with open(sealed, "a", encoding='utf-8') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return self.sealed_files()
+
+    def iter_segment_records(self, paths=None):
+        """Recorre todas las fichas de los segmentos en orden de escritura por segmento."""
+        for path in self.segment_files() if paths is None else paths:
+            with open(path, "r", encoding='utf-8') as f:
+                for line_num, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Línea truncada por un proceso muerto a mitad de escritura
+                        self.logger.warning("Línea inválida en %s:%d, ignorada", path, line_num)
+                        continue
+                    yield entry["page_id"], entry["data"]
+
+    def load_consolidated(self):
+        if not os.path.exists(self.description_file):
+            return {}
+        try:
+            with open(self.description_file, "r", encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.error(f"Error cargando {self.description_file}: {e}")
+            return {}
+
+    def iter_records(self):
+        """
+        Fichas consolidadas y luego las de los segmentos, en streaming.
+
+        Una ficha puede salir más de una vez; la última es la vigente.
+        """
+        if os.path.exists(self.description_file):
+            yield from iter_json_object(self.description_file)
+        yield from self.iter_segment_records()
+
+    def load_all(self):
+        """Fichas consolidadas más las de los segmentos aún sin compactar (sin escribir nada)."""
+        data = self.load_consolidated()
+        for page_id, record in self.iter_segment_records():
+            data[page_id] = record
+        return data
+
+    def compact(self):
+        """
+        Sella los segmentos, los fusiona con ``description_data.json`` y lo reescribe atómicamente.
+
+        Los segmentos sellados se borran en cuanto el fichero nuevo está en su
+        sitio; si la compactación falla antes, la siguiente los vuelve a fusionar.
+        Si otro proceso está compactando, espera a que termine: dos compactaciones
+        a la vez leerían el mismo ``description_data.json`` y la última en
+        escribirlo perdería las fichas de la otra.
+        """
+        with open(self.compact_lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                return self._compact()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _compact(self):
+        start = time.time()
+        # Lo que este mismo proceso tenga abierto también se sella
+        self.close()
+        segments = self._seal_segments()
+        data = self.load_consolidated()
+        before = len(data)
+        merged = 0
+        for page_id, record in self.iter_segment_records(segments):
+            data[page_id] = record
+            merged += 1
+
+        tmp_path = f"{self.description_file}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.description_file)
+
+        for path in segments:
+            try:
+                os.remove(path)
+            except OSError as e:
+                self.logger.error(f"No se pudo borrar el segmento {path}: {e}")
+
+        self.logger.info(
+            f"Compactación completada: {merged} registros de {len(segments)} segmentos, "
+            f"{len(data) - before} fichas nuevas, {len(data)} en total ({time.time() - start:.2f}s)"
+        )
+        return len(data)
+
+
+class CompactionThread(threading.Thread):
+    """Compacta periódicamente el almacén en segundo plano (usado por controller.py)."""
+
+    def __init__(self, store, interval=300):
+        super().__init__(daemon=True)
+        self.store = store
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.store.compact()
+            except Exception as e:
+                self.store.logger.error(f"Error en compactación periódica: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Compacta los segmentos JSONL en description_data.json')
+    parser.parse_args()
+    DescriptionStore().compact()
@@ -0,0 +1,84 @@
+# http_fetcher.py
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ChallengeDetected(Exception):
+    """La respuesta parece un reto/bloqueo y hay que volver a pasar por el navegador."""
+
+
+class HttpFetcher:
+    """
+    Cliente HTTP keep-alive para las páginas de Pares.
+
+    Las fichas, ``show`` y ``contiene`` son HTML estático que luego se parsea con
+    BeautifulSoup, así que basta un ``requests.Session`` con conexiones
+    reutilizadas (por el mismo proxy SOCKS que el navegador). Playwright sólo se
+    usa para obtener/refrescar las cookies de sesión (:meth:`load_cookies`);
+    si la respuesta no parece válida se lanza :class:`ChallengeDetected` para
+    que el scraper recurra al navegador.
+    """
+
+    CHALLENGE_STATUS = (401, 403, 429, 503)
+    CHALLENGE_MARKERS = ("captcha", "challenge", "access denied", "acceso denegado")
+
+    def __init__(self, proxy=None, pool_size=4, timeout=60):
+        self.logger = logging.getLogger('ParesFileScraper')
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if proxy:
+            self.session.proxies = {"http": proxy, "https": proxy}
+        self._cookies_loaded = False
+
+    def load_cookies(self, cookies, user_agent=None):
+        """Sustituye las cookies de la sesión por las cosechadas en Playwright."""
+        self.session.cookies.clear()
+        for cookie in cookies or []:
+            self.session.cookies.set(cookie["name"], cookie["value"],
+                                     domain=cookie.get("domain", ""), path=cookie.get("path", "/"))
+        if user_agent:
+            self.session.headers["User-Agent"] = user_agent
+        self._cookies_loaded = True
+        self.logger.debug(f"[HTTP] Cargadas {len(cookies or [])} cookies desde el navegador")
+
+    def set_proxy(self, proxy):
+        self.session.proxies = {"http": proxy, "https": proxy} if proxy else {}
+
+    def reset(self):
+        """Olvida cookies y conexiones abiertas (tras rotar sesión o circuito de Tor)."""
+        self.session.cookies.clear()
+        self._cookies_loaded = False
+        for adapter in self.session.adapters.values():
+            adapter.close()
+
+    @property
+    def has_cookies(self):
+        return self._cookies_loaded
+
+    def _check(self, resp, url):
+        if resp.status_code in self.CHALLENGE_STATUS:
+            raise ChallengeDetected(f"HTTP {resp.status_code} en {url}")
+        if not resp.ok:
+            raise Exception(f"Status inválido: {resp.status_code}")
+        content_type = resp.headers.get("Content-Type", "")
+        if "html" not in content_type:
+            raise ChallengeDetected(f"Content-Type inesperado '{content_type}' en {url}")
+        head = resp.text[:2000].lower()
+        if any(marker in head for marker in self.CHALLENGE_MARKERS):
+            raise ChallengeDetected(f"Posible reto anti-bot en {url}")
+        return resp.text
+
+    def get(self, url, headers=None):
+        resp = self.session.get(url, headers=headers, timeout=self.timeout)
+        return self._check(resp, url)
+
+    def post(self, url, data, headers=None):
+        resp = self.session.post(url, data=data, headers=headers, timeout=self.timeout)
+        return self._check(resp, url)
+
+    def close(self):
+        self.session.close()
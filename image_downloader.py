@@ -0,0 +1,201 @@
+# image_downloader.py
+import os
+import time
+import hashlib
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from image_manifest import ImageManifest, looks_complete
+
+
+class ImageDownloader:
+    """
+    Motor de descarga de imágenes con paralelismo acotado.
+
+    Las imágenes se piden con un ``requests.Session`` que reutiliza las cookies
+    y el User-Agent de la sesión de Playwright (cuya API síncrona no admite
+    peticiones desde varios hilos). Hay dos límites: ``page_concurrency`` hilos
+    por unidad y un semáforo ``global_concurrency`` compartido por todas las
+    descargas del proceso. Cada imagen se escribe en ``.part`` y se renombra
+    al terminar, y el progreso en Redis se vuelca por lotes.
+
+    El estado de verdad es el manifiesto de la unidad (ver image_manifest.py):
+    cada imagen guarda tamaño y sha256, calculado mientras se descarga. Al
+    reanudar se saltan sin red las válidas; las truncadas (tamaño distinto
+    de ``Content-Length`` o sin final de JPEG/PNG) se vuelven a pedir.
+
+    Con ``limiter`` (un :class:`rate_limiter.RedisRateLimiter`) cada petición
+    consume una ficha del presupuesto global de imágenes y sus errores ajustan
+    la tasa compartida; sin él se espera 1s entre reintentos.
+    """
+
+    def __init__(self, r, proxy=None, page_concurrency=4, global_concurrency=8,
+                 flush_every=20, chunk_size=64 * 1024, timeout=30, limiter=None):
+        self.r = r
+        self.proxy = proxy
+        self.page_concurrency = max(1, page_concurrency)
+        self.flush_every = flush_every
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.limiter = limiter
+        self.logger = logging.getLogger('ParesFileScraper.Images')
+        self._global_slots = threading.BoundedSemaphore(max(1, global_concurrency))
+
+    def _build_session(self, cookies, user_agent, referer, proxy):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.page_concurrency)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if proxy:
+            session.proxies = {"http": proxy, "https": proxy}
+        session.headers.update({
+            "Referer": referer,
+            "Accept": "image/avif,image/webp,image/apng,*/*;q=0.8",
+            "User-Agent": user_agent,
+        })
+        for cookie in cookies or []:
+            session.cookies.set(cookie["name"], cookie["value"],
+                                domain=cookie.get("domain", ""), path=cookie.get("path", "/"))
+        return session
+
+    def _fetch_one(self, session, idx, img_url, img_path, max_retries):
+        """Descarga una imagen a ``img_path``; devuelve ``(bytes, sha256, error)``."""
+        tmp_path = f"{img_path}.part"
+        error = None
+        for intento in range(1, max_retries + 1):
+            if self.limiter:
+                self.limiter.acquire()
+            try:
+                with self._global_slots:
+                    with session.get(img_url, stream=True, timeout=self.timeout) as resp:
+                        if not resp.ok:
+                            raise Exception(f"HTTP {resp.status_code}")
+                        expected = int(resp.headers.get("Content-Length") or 0)
+                        size = 0
+                        digest = hashlib.sha256()
+                        head, tail = b"", b""
+                        with open(tmp_path, "wb") as f:
+                            for chunk in resp.iter_content(self.chunk_size):
+                                f.write(chunk)
+                                digest.update(chunk)
+                                if not head:
+                                    head = chunk[:16]
+                                tail = (tail + chunk)[-64:]
+                                size += len(chunk)
+                if size == 0:
+                    raise Exception("Respuesta vacía")
+                if expected and size != expected:
+                    raise Exception(f"Truncada: {size} de {expected} bytes")
+                if not looks_complete(head, tail):
+                    raise Exception("Truncada: falta el final de la imagen")
+                os.replace(tmp_path, img_path)
+                if self.limiter:
+                    self.limiter.feedback(True)
+                self.logger.debug("    ✔ Imagen %d guardada (%d bytes)", idx, size)
+                return size, digest.hexdigest(), None
+            except Exception as e:
+                error = e
+                self.logger.warning(f"    ✖ Imagen {idx} (intento {intento}/{max_retries}): {e}")
+                if self.limiter:
+                    self.limiter.report(e)
+                else:
+                    time.sleep(1)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return None, None, error
+
+    def _flush(self, page_id, done, failed, contiguous):
+        if not done and not failed:
+            return
+        pipe = self.r.pipeline(transaction=False)
+        if done:
+            pipe.sadd(f"images:{page_id}", *done)
+            pipe.srem(f"failed_images:{page_id}", *done)
+        if failed:
+            pipe.sadd(f"failed_images:{page_id}", *failed)
+        if contiguous:
+            pipe.set(f"last_downloaded_image:{page_id}", str(contiguous))
+        pipe.execute()
+        done.clear()
+        failed.clear()
+
+    def download(self, page_id, img_links, img_dir, cookies, user_agent, referer, max_retries=3, proxy=None):
+        """
+        Descarga las imágenes pendientes de una unidad.
+
+        ``img_links`` es la lista de URLs (índices desde 1) o un dict ``{índice: url}``
+        para descargar sólo algunas. ``proxy`` sustituye al proxy por defecto (p. ej.
+        con las credenciales SOCKS del contexto que descubrió las imágenes).
+
+        Devuelve un dict con ``downloaded``, ``skipped``, ``failed``, ``missing``,
+        ``bytes``, ``elapsed``, ``images_per_s`` y ``mb_per_s``.
+        """
+        os.makedirs(img_dir, exist_ok=True)
+        links = dict(img_links) if isinstance(img_links, dict) else dict(enumerate(img_links, start=1))
+        manifest = ImageManifest(img_dir, page_id)
+        manifest.set_sources(links)
+
+        stats = {"downloaded": 0, "skipped": 0, "failed": 0, "bytes": 0}
+        start = time.time()
+        completed = set()
+        done_batch, failed_batch = [], []
+        # Reanudación sin red: válidas según el manifiesto, o ficheros previos íntegros
+        pending = []
+        for idx, url in sorted(links.items()):
+            if manifest.is_valid(idx) or manifest.adopt(idx):
+                completed.add(idx)
+                done_batch.append(idx)
+                stats["skipped"] += 1
+            else:
+                pending.append((idx, url))
+        contiguous = 0
+        while contiguous + 1 in completed:
+            contiguous += 1
+
+        session = self._build_session(cookies, user_agent, referer, proxy or self.proxy)
+        try:
+            with ThreadPoolExecutor(max_workers=self.page_concurrency) as pool:
+                futures = {
+                    pool.submit(self._fetch_one, session, idx, url, manifest.file_path(idx), max_retries): idx
+                    for idx, url in pending
+                }
+                for future in as_completed(futures):
+                    idx = futures[future]
+                    size, sha256, error = future.result()
+                    if size is None:
+                        stats["failed"] += 1
+                        failed_batch.append(idx)
+                        manifest.record_failed(idx, error)
+                        self.logger.error(f"  ✖ Imagen {idx} de {page_id} no descargada tras {max_retries} intentos")
+                    else:
+                        manifest.record_ok(idx, size, sha256)
+                        stats["downloaded"] += 1
+                        stats["bytes"] += size
+                        done_batch.append(idx)
+                        completed.add(idx)
+                        while contiguous + 1 in completed:
+                            contiguous += 1
+                    if len(done_batch) + len(failed_batch) >= self.flush_every:
+                        self._flush(page_id, done_batch, failed_batch, contiguous)
+                        manifest.save()
+            self._flush(page_id, done_batch, failed_batch, contiguous)
+        finally:
+            session.close()
+            manifest.save()
+
+        elapsed = max(time.time() - start, 1e-6)
+        stats["missing"] = len(links) - len(completed)
+        stats["elapsed"] = elapsed
+        stats["images_per_s"] = stats["downloaded"] / elapsed
+        stats["mb_per_s"] = stats["bytes"] / elapsed / (1024 * 1024)
+        self.logger.info(
+            f"[{page_id}] {stats['downloaded']} imágenes ({stats['bytes'] / (1024 * 1024):.2f} MB) en {elapsed:.2f}s: "
+            f"{stats['images_per_s']:.2f} img/s, {stats['mb_per_s']:.2f} MB/s, {stats['failed']} fallidas, "
+            f"{stats['skipped']} ya válidas "
+            f"(concurrencia {self.page_concurrency})"
+        )
+        return stats
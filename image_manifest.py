@@ -0,0 +1,221 @@
+# image_manifest.py
+"""
+Manifiesto de imágenes por unidad y verificación offline del árbol ``img/``.
+
+Cada unidad guarda en ``img/<page_id>/manifest.json`` una entrada por imagen.
+Cada entrada tiene índice, URL de origen, fichero, tamaño, sha256 y estado:
+``ok``, ``pending``, ``failed`` o ``corrupt``. Al reanudar, las imágenes
+``ok`` cuyo fichero conserva el tamaño se saltan sin tocar la red. Sólo se
+vuelven a pedir las que faltan, están truncadas o no cuadran.
+
+Verificación de todo el árbol en paralelo, sin red:
+
+    python3 image_manifest.py img/ --workers 8        # tamaño + sha256 + estructura
+    python3 image_manifest.py img/ --quick            # sólo existencia y tamaño
+    python3 image_manifest.py img/ --mark             # marca las dañadas como corrupt
+
+Con ``--mark`` la siguiente descarga de la unidad re-descarga las dañadas. No
+conviene usarlo mientras un worker está descargando esa misma unidad.
+"""
+import os
+import sys
+import json
+import time
+import glob
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_NAME = "manifest.json"
+_CHUNK = 1024 * 1024
+
+
+def image_filename(idx):
+    return f"image_{idx}.jpg"
+
+
+def looks_complete(head, tail):
+    """
+    Comprobación estructural barata a partir del principio y el final del fichero.
+
+    JPEG debe terminar en el marcador EOI (FFD9) y PNG contener IEND; una
+    descarga truncada no los tiene. Otros formatos se aceptan si no están vacíos.
+    """
+    if not head:
+        return False
+    if head.startswith(b"\xff\xd8"):
+        return tail.rstrip(b"\x00\r\n ").endswith(b"\xff\xd9")
+    if head.startswith(b"\x89PNG"):
+        return b"IEND" in tail
+    return True
+
+
+def inspect_file(path, with_hash=True):
+    """Devuelve ``(tamaño, sha256 o None, completo)`` de un fichero, o None si no existe."""
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            head = f.read(16)
+            if with_hash:
+                f.seek(0)
+                digest = hashlib.sha256()
+                for chunk in iter(lambda: f.read(_CHUNK), b""):
+                    digest.update(chunk)
+                sha256 = digest.hexdigest()
+            else:
+                sha256 = None
+            f.seek(max(0, size - 64))
+            tail = f.read(64)
+    except FileNotFoundError:
+        return None
+    return size, sha256, looks_complete(head, tail)
+
+
+class ImageManifest:
+    """Manifiesto de una unidad; se escribe de forma atómica (tmp + ``os.replace``)."""
+
+    def __init__(self, img_dir, page_id=None):
+        self.img_dir = img_dir
+        self.page_id = page_id or os.path.basename(os.path.normpath(img_dir))
+        self.path = os.path.join(img_dir, MANIFEST_NAME)
+        self.images = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.images = json.load(f).get("images", {})
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            # Un manifiesto ilegible se reconstruye verificando los ficheros
+            self.images = {}
+
+    def _entry(self, idx):
+        return self.images.setdefault(str(idx), {"file": image_filename(idx), "status": "pending"})
+
+    def file_path(self, idx):
+        return os.path.join(self.img_dir, self._entry(idx)["file"])
+
+    def set_sources(self, links):
+        """Registra la URL de origen de cada índice (``{idx: url}``)."""
+        for idx, url in links.items():
+            self._entry(idx)["url"] = url
+
+    def sources(self):
+        return {int(idx): e["url"] for idx, e in self.images.items() if e.get("url")}
+
+    def record_ok(self, idx, size, sha256):
+        self._entry(idx).update({"status": "ok", "size": size, "sha256": sha256,
+                                 "updated_at": time.time(), "error": None})
+
+    def record_failed(self, idx, error):
+        self._entry(idx).update({"status": "failed", "error": str(error), "updated_at": time.time()})
+
+    def mark_corrupt(self, idx, reason):
+        self._entry(idx).update({"status": "corrupt", "error": reason, "updated_at": time.time()})
+
+    def is_valid(self, idx):
+        """Comprobación rápida sin red: estado ok y el fichero conserva el tamaño registrado."""
+        entry = self.images.get(str(idx))
+        if not entry or entry.get("status") != "ok":
+            return False
+        try:
+            return os.path.getsize(self.file_path(idx)) == entry.get("size")
+        except OSError:
+            return False
+
+    def adopt(self, idx):
+        """Incorpora un fichero ya en disco sin entrada (descargas anteriores al manifiesto)."""
+        info = inspect_file(self.file_path(idx))
+        if not info:
+            return False
+        size, sha256, complete = info
+        if not complete or size == 0:
+            self.mark_corrupt(idx, "fichero truncado o vacío")
+            return False
+        self.record_ok(idx, size, sha256)
+        return True
+
+    def indices(self, *statuses):
+        return sorted(int(idx) for idx, e in self.images.items() if e.get("status") in statuses)
+
+    def save(self):
+        os.makedirs(self.img_dir, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"page_id": self.page_id, "images": self.images}, f, ensure_ascii=False,
+                      indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def verify_unit(unit_dir, with_hash=True, mark=False):
+    """Verifica los ficheros de una unidad contra su manifiesto; devuelve un resumen."""
+    manifest = ImageManifest(unit_dir)
+    summary = {"ok": 0, "missing": 0, "truncated": 0, "mismatch": 0, "pending": 0, "problems": []}
+    changed = False
+    for idx_str, entry in sorted(manifest.images.items(), key=lambda kv: int(kv[0])):
+        idx = int(idx_str)
+        if entry.get("status") != "ok":
+            summary["pending"] += 1
+            continue
+        info = inspect_file(manifest.file_path(idx), with_hash=with_hash)
+        problem = None
+        if info is None:
+            problem = "missing"
+        else:
+            size, sha256, complete = info
+            if size != entry.get("size"):
+                problem = "truncated" if size < (entry.get("size") or 0) else "mismatch"
+            elif with_hash and entry.get("sha256") and sha256 != entry["sha256"]:
+                problem = "mismatch"
+            elif with_hash and not complete:
+                problem = "truncated"
+        if problem:
+            summary[problem] += 1
+            summary["problems"].append((idx, problem))
+            if mark:
+                manifest.mark_corrupt(idx, problem)
+                changed = True
+        else:
+            summary["ok"] += 1
+    if changed:
+        manifest.save()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verificación offline de las imágenes descargadas')
+    parser.add_argument('img_root', nargs='?', default='img', help='Directorio raíz de imágenes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='Unidades verificadas en paralelo')
+    parser.add_argument('--quick', action='store_true', help='Sólo existencia y tamaño (sin sha256)')
+    parser.add_argument('--mark', action='store_true', help='Marcar las dañadas como corrupt para re-descargarlas')
+    args = parser.parse_args()
+
+    manifests = glob.glob(os.path.join(args.img_root, "*", MANIFEST_NAME))
+    if not manifests:
+        print(f"No hay manifiestos en {args.img_root}")
+        return 0
+    unit_dirs = [os.path.dirname(path) for path in manifests]
+
+    totals = {"ok": 0, "missing": 0, "truncated": 0, "mismatch": 0, "pending": 0}
+    damaged_units = 0
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        results = pool.map(lambda d: (d, verify_unit(d, with_hash=not args.quick, mark=args.mark)), unit_dirs)
+        for unit_dir, summary in results:
+            for key in totals:
+                totals[key] += summary[key]
+            if summary["problems"]:
+                damaged_units += 1
+                detail = ", ".join(f"{idx}:{problem}" for idx, problem in summary["problems"][:10])
+                print(f"{os.path.basename(unit_dir)}: {detail}")
+
+    elapsed = time.time() - start
+    print(f"{len(unit_dirs)} unidades en {elapsed:.1f}s: {totals['ok']} ok, {totals['missing']} ausentes, "
+          f"{totals['truncated']} truncadas, {totals['mismatch']} con hash/tamaño distinto, "
+          f"{totals['pending']} pendientes/fallidas")
+    if args.mark and damaged_units:
+        print(f"{damaged_units} unidades marcadas para re-descarga")
+    return 1 if damaged_units else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
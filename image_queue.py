@@ -0,0 +1,144 @@
+# image_queue.py
+import os
+import json
+import socket
+import logging
+
+
+# Encola un trabajo si su unidad no está ya en cola o en curso.
+# KEYS[1] = lista de trabajos, KEYS[2] = set de unidades encoladas; ARGV = page_id, trabajo
+ENQUEUE_SCRIPT = """
+if redis.call('SADD', KEYS[2], ARGV[1]) == 1 then
+    redis.call('RPUSH', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Devuelve a la cabeza de la cola todo lo que haya en una lista en curso
+REQUEUE_SCRIPT = """
+local moved = 0
+while redis.call('LMOVE', KEYS[1], KEYS[2], 'RIGHT', 'LEFT') do
+    moved = moved + 1
+end
+return moved
+"""
+
+
+class ImageJobQueue:
+    """
+    Cola de descargas de imágenes, separada del frontier de páginas.
+
+    Cada trabajo es una unidad: ``{"page_id", "url", "links", "attempts"}``, con
+    ``links`` la lista de URLs ``ViewImage.do`` (índices desde 1) y ``url`` la
+    ficha de la que salen, que sirve de referer. ``process_description`` sólo
+    encola; las descargas las hacen los procesos de ``image_worker.py``, con
+    su propia concurrencia, presupuesto y circuitos de Tor.
+
+    Claves:
+      - ``image_jobs``: lista de trabajos pendientes (FIFO).
+      - ``image_jobs:queued``: page_ids en cola o en curso; evita encolar dos
+        veces la misma unidad.
+      - ``image_jobs:processing:<worker_id>``: trabajo en curso de cada worker
+        (``BLMOVE``). Si el worker muere, su sucesor en el mismo hueco del
+        pool (mismo ``worker_id``) lo recupera con :meth:`recover`.
+      - ``image_jobs:failed``: unidades que agotaron ``max_attempts``.
+    """
+
+    jobs_key = "image_jobs"
+    queued_key = "image_jobs:queued"
+    failed_key = "image_jobs:failed"
+    processing_prefix = "image_jobs:processing:"
+
+    def __init__(self, r, worker_id=None, max_attempts=3):
+        self.r = r
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.max_attempts = max_attempts
+        self.logger = logging.getLogger('ParesFileScraper.Redis')
+        self._enqueue = self.r.register_script(ENQUEUE_SCRIPT)
+        self._requeue = self.r.register_script(REQUEUE_SCRIPT)
+
+    @property
+    def processing_key(self):
+        return f"{self.processing_prefix}{self.worker_id}"
+
+    @staticmethod
+    def _dump(job):
+        return json.dumps(job, ensure_ascii=False, sort_keys=True)
+
+    def enqueue(self, page_id, links, url=None):
+        """Encola la descarga de una unidad; False si ya estaba en cola o en curso."""
+        if not links:
+            return False
+        job = {"page_id": str(page_id), "url": url, "links": list(links), "attempts": 0}
+        return bool(self._enqueue(keys=[self.jobs_key, self.queued_key], args=[job["page_id"], self._dump(job)]))
+
+    def enqueue_many(self, jobs):
+        """Encola ``(page_id, links, url)`` en un único pipeline; devuelve cuántos eran nuevos."""
+        pipe = self.r.pipeline(transaction=False)
+        for page_id, links, url in jobs:
+            if not links:
+                continue
+            job = {"page_id": str(page_id), "url": url, "links": list(links), "attempts": 0}
+            self._enqueue(keys=[self.jobs_key, self.queued_key], args=[job["page_id"], self._dump(job)], client=pipe)
+        return sum(pipe.execute())
+
+    def dequeue(self, timeout=5):
+        """Mueve el siguiente trabajo a la lista en curso; devuelve ``(raw, job)`` o None."""
+        raw = self.r.blmove(self.jobs_key, self.processing_key, timeout, "LEFT", "RIGHT")
+        if raw is None:
+            return None
+        return raw, json.loads(raw)
+
+    def ack(self, raw, job):
+        """Trabajo terminado: sale de la lista en curso y la unidad puede volver a encolarse."""
+        pipe = self.r.pipeline()
+        pipe.lrem(self.processing_key, 1, raw)
+        pipe.srem(self.queued_key, job["page_id"])
+        pipe.srem(self.failed_key, job["page_id"])
+        pipe.execute()
+
+    def retry(self, raw, job):
+        """
+        Reencola el trabajo al final de la cola; las imágenes ya válidas se saltan
+        sin red gracias al manifiesto. Tras ``max_attempts`` intentos la unidad pasa
+        a ``image_jobs:failed``. Devuelve True si se ha reencolado.
+        """
+        job = dict(job, attempts=job.get("attempts", 0) + 1)
+        pipe = self.r.pipeline()
+        pipe.lrem(self.processing_key, 1, raw)
+        requeued = job["attempts"] < self.max_attempts
+        if requeued:
+            pipe.rpush(self.jobs_key, self._dump(job))
+        else:
+            pipe.srem(self.queued_key, job["page_id"])
+            pipe.sadd(self.failed_key, job["page_id"])
+        pipe.execute()
+        return requeued
+
+    def recover(self):
+        """Devuelve a la cola lo que dejó en curso un worker anterior con el mismo id."""
+        moved = self._requeue(keys=[self.processing_key, self.jobs_key])
+        if moved:
+            self.logger.warning(f"Worker de imágenes {self.worker_id}: {moved} trabajos en curso devueltos a la cola")
+        return moved
+
+    def requeue_all(self):
+        """Devuelve a la cola todos los trabajos en curso (sin workers de imágenes activos)."""
+        return sum(self._requeue(keys=[key, self.jobs_key])
+                   for key in self.r.scan_iter(f"{self.processing_prefix}*"))
+
+    def pending(self):
+        return self.r.llen(self.jobs_key)
+
+    def in_flight(self):
+        pipe = self.r.pipeline(transaction=False)
+        for key in self.r.scan_iter(f"{self.processing_prefix}*"):
+            pipe.llen(key)
+        return sum(pipe.execute())
+
+    def is_drained(self):
+        return self.pending() == 0 and self.in_flight() == 0
+
+    def failed(self):
+        return sorted(page_id.decode() for page_id in self.r.smembers(self.failed_key))
@@ -0,0 +1,263 @@
+# image_worker.py
+"""
+Workers de descarga de imágenes, independientes del rastreo de fichas.
+
+Con ``--image-mode queue`` (por defecto en controller.py) ``process_description``
+sólo encola un trabajo por unidad en ``image_jobs`` (ver image_queue.py) y un
+pool aparte de estos procesos lo consume. Cada proceso atiende ``units``
+unidades a la vez, cada una con su circuito de Tor y sus cookies. El
+presupuesto de imágenes es el suyo propio (``ratelimit:images``). No usan
+navegador: las cookies de sesión se obtienen con una petición HTTP a la ficha.
+
+Descargar más tarde las imágenes de las fichas ya guardadas en description_data.json:
+
+    python3 image_worker.py --backfill --backfill-only   # sólo encolar
+    python3 image_worker.py --backfill --units 4          # encolar y descargar
+"""
+import os
+import time
+import random
+import signal
+import logging
+import argparse
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from iterando import redis_client, USER_AGENTS
+from image_queue import ImageJobQueue
+from image_downloader import ImageDownloader
+from image_manifest import ImageManifest
+from circuit_pool import CircuitPool, parse_ports
+from description_store import DescriptionStore
+from metrics import Metrics
+from rate_limiter import RedisRateLimiter
+
+
+class ImageWorker:
+    """
+    Consume ``image_jobs`` con ``units`` hilos; cada uno descarga una unidad a la vez.
+
+    Una unidad que termina con imágenes pendientes se reencola (las válidas se
+    saltan sin red al reintentar) hasta ``max_attempts`` veces; después queda
+    en ``image_jobs:failed``. Cada hilo tiene su circuito de Tor (ver
+    :class:`CircuitPool`) y lo cambia si el circuito se retira por lento o por
+    errores. Tras un fallo pide cookies nuevas.
+    """
+
+    def __init__(self, worker_id=None, base_url="https://pares.mcu.es", use_tor=True, circuit_mode="auth",
+                 socks_ports=(9050,), units=2, image_concurrency=4, image_global_concurrency=8,
+                 image_rate=4.0, image_max_rate=16.0, html_rate=0.5, html_max_rate=4.0,
+                 idle_timeout=30, dequeue_timeout=5, max_attempts=3, max_retries=3, img_folder="img",
+                 metrics_port=0, metrics_dir=None, stop_event=None):
+        self.logger = logging.getLogger('ParesFileScraper.ImageWorker')
+        self.logger.setLevel(logging.INFO)
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            self.logger.addHandler(handler)
+
+        self.base_url = base_url
+        self.units = max(1, units)
+        self.idle_timeout = idle_timeout
+        self.dequeue_timeout = dequeue_timeout
+        self.max_retries = max_retries
+        self.img_folder = img_folder
+        self.stop_event = stop_event or threading.Event()
+
+        self.r = redis_client()
+        self.queue = ImageJobQueue(self.r, worker_id=worker_id, max_attempts=max_attempts)
+        self.circuits = CircuitPool(circuit_mode, ports=socks_ports) if use_tor else None
+        # Presupuestos globales: imágenes, y páginas HTML para las peticiones que dan cookies
+        self.limiter = RedisRateLimiter(self.r, "images", rate=image_rate, max_rate=image_max_rate)
+        self.html_limiter = RedisRateLimiter(self.r, "html", rate=html_rate, max_rate=html_max_rate)
+        self.downloader = ImageDownloader(
+            self.r,
+            page_concurrency=image_concurrency,
+            global_concurrency=image_global_concurrency,
+            limiter=self.limiter,
+        )
+
+        self.metrics = Metrics()
+        self.metrics.gauge("pares_image_jobs_pending", self.queue.pending)
+        if metrics_port:
+            self.metrics.serve(metrics_port)
+        self.metrics_path = self.metrics.start_file_dump(metrics_dir) if metrics_dir else None
+
+    def _harvest_cookies(self, proxy, user_agent, url):
+        """Cookies de sesión (JSESSIONID) pidiendo la ficha por el mismo circuito."""
+        self.html_limiter.acquire()
+        with requests.Session() as session:
+            if proxy:
+                session.proxies = {"http": proxy, "https": proxy}
+            try:
+                resp = session.get(url or self.base_url, headers={"User-Agent": user_agent}, timeout=60)
+                self.html_limiter.report(None if resp.ok else f"HTTP {resp.status_code}")
+            except Exception as e:
+                self.html_limiter.report(e)
+                self.logger.warning(f"No se pudieron obtener cookies de {url}: {e}")
+            return [{"name": c.name, "value": c.value, "domain": c.domain, "path": c.path}
+                    for c in session.cookies]
+
+    def _count(self, stats):
+        self.metrics.inc("pares_images_downloaded_total", stats["downloaded"])
+        self.metrics.inc("pares_image_bytes_total", stats["bytes"])
+        self.metrics.inc("pares_failed_images_total", stats["failed"])
+        # Tasa de error para el escalado del pool (WorkerSupervisor con stats_prefix="stats:images")
+        pipe = self.r.pipeline(transaction=False)
+        pipe.incrby("stats:images_ok", stats["downloaded"])
+        pipe.incrby("stats:images_failed", stats["failed"])
+        pipe.execute()
+
+    def _lane(self, lane):
+        """Bucle de un hilo: saca unidades de la cola hasta que se vacía o se pide parar."""
+        circuit = self.circuits.acquire() if self.circuits else None
+        cookies, user_agent = None, None
+        processed = 0
+        idle_since = None
+        while not self.stop_event.is_set():
+            item = self.queue.dequeue(timeout=self.dequeue_timeout)
+            if item is None:
+                if idle_since is None:
+                    idle_since = time.time()
+                if time.time() - idle_since >= self.idle_timeout:
+                    self.logger.info(f"[img{lane}] Cola de imágenes vacía, saliendo tras {processed} unidades")
+                    break
+                continue
+            idle_since = None
+            raw, job = item
+            page_id = job["page_id"]
+            proxy = circuit.url() if circuit else None
+            if cookies is None:
+                user_agent = random.choice(USER_AGENTS)
+                cookies = self._harvest_cookies(proxy, user_agent, job.get("url"))
+
+            start = time.monotonic()
+            try:
+                stats = self.downloader.download(
+                    page_id,
+                    job["links"],
+                    os.path.join(self.img_folder, page_id),
+                    cookies=cookies,
+                    user_agent=user_agent,
+                    referer=self.base_url,
+                    max_retries=self.max_retries,
+                    proxy=proxy,
+                )
+            except Exception as e:
+                self.logger.error(f"[img{lane}] Error descargando imágenes de {page_id}: {e}")
+                stats = None
+            elapsed = time.monotonic() - start
+            self.metrics.observe("image_download", elapsed)
+            processed += 1
+
+            ok = stats is not None and stats["missing"] == 0
+            if stats is not None:
+                self._count(stats)
+            if self.circuits:
+                per_image = elapsed / max(1, stats["downloaded"]) if stats else None
+                if self.circuits.record(circuit, ok, per_image):
+                    circuit = self.circuits.acquire(previous=circuit)
+                    cookies = None
+            if ok:
+                self.r.delete(f"last_downloaded_image:{page_id}")
+                self.queue.ack(raw, job)
+            else:
+                cookies = None
+                if self.queue.retry(raw, job):
+                    self.logger.warning(f"[img{lane}] {page_id} incompleta, reencolada "
+                                        f"(intento {job.get('attempts', 0) + 1})")
+                else:
+                    self.logger.error(f"[img{lane}] {page_id} sigue incompleta tras "
+                                      f"{self.queue.max_attempts} intentos: queda en image_jobs:failed")
+        if self.stop_event.is_set():
+            self.logger.info(f"[img{lane}] Parada solicitada, saliendo tras {processed} unidades")
+        return processed
+
+    def run(self):
+        self.queue.recover()
+        start = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=self.units, thread_name_prefix="img") as lanes:
+                processed = sum(f.result() for f in [lanes.submit(self._lane, i) for i in range(self.units)])
+        finally:
+            if self.metrics_path:
+                self.metrics.dump(self.metrics_path)
+            self.metrics.stop()
+        self.logger.info(f"Worker de imágenes {self.queue.worker_id}: {processed} unidades en {time.time() - start:.2f}s")
+        return processed
+
+
+def backfill(queue, description_file="description_data.json", img_folder="img", batch=500):
+    """
+    Encola las unidades de description_data.json (y de los segmentos sin compactar)
+    cuyas imágenes no están completas según su manifiesto. Devuelve ``(encoladas, completas)``.
+
+    Las fichas se leen en streaming (sin cargar el JSON entero); en memoria sólo
+    quedan los ids ya vistos, para que una ficha repetida en un segmento no cuente dos veces.
+    """
+    queued, complete = 0, 0
+    jobs = []
+    seen = set()
+    for page_id, record in DescriptionStore(description_file).iter_records():
+        links = record.get("image_links") or []
+        if not links or page_id in seen:
+            continue
+        seen.add(page_id)
+        manifest = ImageManifest(os.path.join(img_folder, page_id), page_id)
+        if all(manifest.is_valid(idx) for idx in range(1, len(links) + 1)):
+            complete += 1
+            continue
+        jobs.append((page_id, links, record.get("url")))
+        if len(jobs) >= batch:
+            queued += queue.enqueue_many(jobs)
+            jobs = []
+    if jobs:
+        queued += queue.enqueue_many(jobs)
+    return queued, complete
+
+
+def run_image_worker(worker_id=None, tor_disable=False, circuit_mode="auth", socks_ports=(9050,), units=2,
+                     image_concurrency=4, image_global_concurrency=8, image_rate=4.0, image_max_rate=16.0,
+                     html_rate=0.5, html_max_rate=4.0, idle_timeout=30, max_attempts=3,
+                     metrics_port=0, metrics_dir=None, base_url="https://pares.mcu.es"):
+    # SIGTERM (supervisor o kill): terminar las unidades en curso y salir
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    worker = ImageWorker(worker_id=worker_id, base_url=base_url, use_tor=not tor_disable,
+                         circuit_mode=circuit_mode, socks_ports=socks_ports, units=units,
+                         image_concurrency=image_concurrency, image_global_concurrency=image_global_concurrency,
+                         image_rate=image_rate, image_max_rate=image_max_rate,
+                         html_rate=html_rate, html_max_rate=html_max_rate,
+                         idle_timeout=idle_timeout, max_attempts=max_attempts,
+                         metrics_port=metrics_port, metrics_dir=metrics_dir, stop_event=stop_event)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.logger.info("Worker de imágenes interrumpido por el usuario (Ctrl+C)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Worker de descarga de imágenes (cola image_jobs)')
+    parser.add_argument('--backfill', action='store_true',
+                        help='Encolar antes las unidades de description_data.json con imágenes incompletas')
+    parser.add_argument('--backfill-only', action='store_true', help='Sólo encolar, sin descargar')
+    parser.add_argument('--description-file', default='description_data.json')
+    parser.add_argument('--units', type=int, default=2, help='Unidades descargadas a la vez por este proceso')
+    parser.add_argument('--image-concurrency', type=int, default=4, help='Descargas simultáneas por unidad')
+    parser.add_argument('--image-rate', type=float, default=4.0, help='Tasa inicial global de imágenes por segundo')
+    parser.add_argument('--image-max-rate', type=float, default=16.0, help='Tope global de imágenes por segundo')
+    parser.add_argument('--tor-disable', action='store_true', help='Desactiva el uso de Tor (no proxy)')
+    parser.add_argument('--circuit-mode', choices=['auth', 'ports'], default='auth')
+    parser.add_argument('--socks-ports', default='9050')
+    parser.add_argument('--idle-timeout', type=int, default=30,
+                        help='Segundos con la cola vacía antes de terminar')
+    args = parser.parse_args()
+
+    if args.backfill or args.backfill_only:
+        queued, complete = backfill(ImageJobQueue(redis_client()), args.description_file)
+        print(f"{queued} unidades encoladas para descargar imágenes ({complete} ya completas)")
+    if not args.backfill_only:
+        run_image_worker(tor_disable=args.tor_disable, circuit_mode=args.circuit_mode,
+                         socks_ports=parse_ports(args.socks_ports), units=args.units,
+                         image_concurrency=args.image_concurrency, image_rate=args.image_rate,
+                         image_max_rate=args.image_max_rate, idle_timeout=args.idle_timeout)
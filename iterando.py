@@ -3,54 +3,238 @@ import redis
 import socket
 import requests
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin
 import re
 import os
 import json
 import time
 import subprocess
 import random
+import itertools
+import signal
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from playwright.sync_api import sync_playwright
 import logging
 from logging.handlers import RotatingFileHandler
 from datetime import datetime
+from description_store import DescriptionStore
+from work_queue import RedisWorkQueue, SEED_RANGE_RE
+from image_downloader import ImageDownloader
+from image_manifest import ImageManifest
+from image_queue import ImageJobQueue
+from sqlite_export import SqliteSink
+from http_fetcher import HttpFetcher, ChallengeDetected
+from browser_pool import ContextPool
+from circuit_pool import CircuitPool
+from tor_control import TorSupervisor
+from metrics import Metrics
+from rate_limiter import RedisRateLimiter
+from response_cache import ResponseCache, DEFAULT_TTL
+from log_utils import attach_queue_listener, LogAggregator, LogSampler
+from contiene_blocks import (SEARCH_CONTROLLER_PATH, CONTIENE_FORM, CONTIENE_BLOCK_SIZE, CONTIENE_MAX_ATTEMPTS, ContieneBlocks,
+                             progress_key)
+from pares_parser import (extract_page, extract_image_links, parse_ficha, resolve_parser,
+                          sanitizar_texto)
+
+# Redis compartido por controller y workers (p. ej. otra base para bench_e2e.py)
+REDIS_URL = os.environ.get("PARES_REDIS_URL", "redis://localhost:6379/0")
+
+
+def redis_client():
+    return redis.StrictRedis.from_url(REDIS_URL)
+
+
+# User-Agents de diferentes navegadores y dispositivos (también para image_worker.py)
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:112.0) Gecko/20100101 Firefox/112.0",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 15_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.2 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Android 11; Mobile; rv:112.0) Gecko/112.0 Firefox/112.0",
+]
+
 
 class ParesFileScraper:
-    def __init__(self, base_url="https://pares.mcu.es", skip_download=False, rotate_after=200, use_tor=True):
+    def __init__(self, base_url="https://pares.mcu.es", skip_download=False, rotate_after=200, use_tor=True,
+                 reliable_queue=False, idle_timeout=30, dequeue_timeout=5,
+                 image_concurrency=4, image_global_concurrency=8, fetch_mode="browser", contexts=1,
+                 circuit_mode="auth", socks_ports=(9050,), parser="auto",
+                 log_mode="verbose", metrics_port=0, metrics_dir=None,
+                 html_rate=0.5, html_max_rate=4.0, image_rate=4.0, image_max_rate=16.0,
+                 cache_dir=None, cache_ttl=DEFAULT_TTL, replay=False, stop_event=None, frontier="priority",
+                 image_mode="inline", sqlite_path=None, contiene_block_size=CONTIENE_BLOCK_SIZE,
+                 contiene_parallel=4, contiene_page_field=None):
         # Configurar sistema de logging
-        self.setup_logging()
+        self.log_mode = log_mode
+        self.setup_logging(production=log_mode == "production")
         self.logger.info(f"Inicializando ParesFileScraper con base_url={base_url}, skip_download={skip_download}")
 
         self.base_url = base_url
         self.skip_download = skip_download
         self.use_tor = use_tor
         self.rotate_after = rotate_after
-        self.request_count = 0
-        
-        self.current_browser = None  # Se define después
-        self._browser = None
-        self._context = None
-        self._page = None
+        self.contexts = max(1, contexts)
+
+        self.pool = None
         self._pw = None
+        self._local = threading.local()
+        # Al activarse (SIGTERM del supervisor) cada bucle termina su URL y sale
+        self.stop_event = stop_event or threading.Event()
         self.cookie_file = "cookies.json"  # o cualquier nombre que uses para cookies
 
-        self.r = redis.StrictRedis(host='localhost', port=6379, db=0)
+        # fetch_mode="http": el navegador sólo cosecha cookies y las páginas se piden
+        # con un cliente HTTP keep-alive; "browser": todo pasa por Playwright
+        self.fetch_mode = fetch_mode
+        # Backend de BeautifulSoup: "auto" usa lxml si está instalado
+        self.parser = parser
+        # Caché de respuestas; en replay todo el pipeline sale de ella (ni red ni navegador)
+        self.replay = replay
+        self.cache = ResponseCache(cache_dir, ttl=cache_ttl) if cache_dir else None
+        if replay:
+            if not self.cache:
+                raise ValueError("El modo replay necesita un directorio de caché")
+            self.use_tor = use_tor = False
+            self.skip_download = True
+
+        self.r = redis_client()
+        # Cola de trabajo: BLPOP en modo simple, lista en curso + lease en modo fiable
+        self.queue = RedisWorkQueue(self.r, reliable=reliable_queue, frontier=frontier, base_url=base_url)
+        self.idle_timeout = idle_timeout
+        self.dequeue_timeout = dequeue_timeout
+        # Métricas por etapa (Prometheus en metrics_port y/o volcado a metrics_dir)
+        self.metrics = Metrics()
+        self.metrics.gauge("pares_queue_todo", self.queue.pending)
+        self.metrics.gauge("pares_queue_done", self.queue.done_count)
+        if metrics_port:
+            self.metrics.serve(metrics_port)
+        self.metrics_path = self.metrics.start_file_dump(metrics_dir) if metrics_dir else None
+
+        # Supervisor de Tor: comprueba SOCKS/ControlPort en segundo plano y centraliza NEWNYM
+        self.tor = TorSupervisor(r=self.r)
+        if self.use_tor:
+            self.tor.start()
         self.description_file = "description_data.json"
         self.img_folder = "img"
-        self.urls_description = self.load_existing_descriptions()
+        # Presupuestos globales (todos los procesos) para páginas HTML e imágenes
+        self.html_limiter = RedisRateLimiter(self.r, "html", rate=html_rate, max_rate=html_max_rate)
+        self.image_limiter = RedisRateLimiter(self.r, "images", rate=image_rate, max_rate=image_max_rate)
+        self.image_downloader = ImageDownloader(
+            self.r,
+            proxy="socks5h://127.0.0.1:9050" if use_tor else None,
+            page_concurrency=image_concurrency,
+            global_concurrency=image_global_concurrency,
+            limiter=self.image_limiter,
+        )
+        # image_mode="queue": las fichas sólo encolan sus imágenes en image_jobs y las
+        # descargan los procesos de image_worker.py; "inline": se descargan aquí mismo
+        self.image_jobs = ImageJobQueue(self.r) if image_mode == "queue" else None
+        # Las fichas se anexan a un segmento JSONL por proceso; description_data.json
+        # se genera al compactar (ver description_store.py)
+        self.store = DescriptionStore(self.description_file)
+        # Copia al vuelo en SQLite (ver sqlite_export.py); el segmento sigue siendo la fuente
+        self.sqlite = SqliteSink(sqlite_path) if sqlite_path else None
+        # Listados contiene por bloques de contiene_block_size, contiene_parallel a la vez
+        # (ver contiene_blocks.py). Sin campo de página verificado no se pagina: un único
+        # POST como siempre. En modo browser todo pasa por el único hilo de Playwright,
+        # así que los bloques van de uno en uno
+        self.contiene_page_field = contiene_page_field
+        self.contiene_block_size = max(1, contiene_block_size)
+        self.contiene_parallel = max(1, contiene_parallel) if fetch_mode == "http" else 1
+        self._block_executor = ThreadPoolExecutor(max_workers=self.contiene_parallel, thread_name_prefix="contiene")
+        # Totales por tipo (fichas, imágenes, enlaces) para el log de progreso
+        self._progress = Counter()
+        self._progress_lock = threading.Lock()
+
+        # Arrancar Playwright y primera sesión. La API síncrona sólo puede usarse desde el
+        # hilo que la arrancó, así que vive en un hilo propio (ver _on_browser)
+        self._browser_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="playwright")
+        self._browser_thread = self._browser_executor.submit(threading.current_thread).result()
+        self._pw = self._on_browser(lambda: sync_playwright().start())
+        self.pool = ContextPool(
+            self._pw,
+            self.contexts,
+            use_tor,
+            self.get_random_user_agent,
+            http_fetcher_factory=HttpFetcher if fetch_mode == "http" else None,
+            circuit_pool=CircuitPool(circuit_mode, ports=socks_ports),
+        )
+        if not replay:
+            self._on_browser(self._launch_new_session)
+
+    # --- Contexto actual (uno por hilo de rastreo) ---------------------------------
+
+    def _slot(self):
+        return getattr(self._local, "slot", None) or self.pool.slots[0]
+
+    @property
+    def _browser(self):
+        return self.pool.browser
+
+    @property
+    def _context(self):
+        return self._slot().context
 
-        # Arrancar Playwright y primera sesión
-        self._pw = sync_playwright().start()
-        self._launch_new_session()
+    @property
+    def _page(self):
+        return self._slot().page
+
+    @property
+    def current_ua(self):
+        return self._slot().user_agent
+
+    @property
+    def current_browser(self):
+        return self.pool.engine
+
+    @property
+    def http_fetcher(self):
+        return self._slot().http_fetcher
+
+    @property
+    def request_count(self):
+        return self._slot().request_count
+
+    @request_count.setter
+    def request_count(self, value):
+        self._slot().request_count = value
+
+    def _on_browser(self, fn, *args, **kwargs):
+        """Ejecuta ``fn`` en el hilo de Playwright conservando el contexto del hilo llamante."""
+        if threading.current_thread() is self._browser_thread:
+            return fn(*args, **kwargs)
+        slot = getattr(self._local, "slot", None)
+
+        def call():
+            self._local.slot = slot
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._local.slot = None
+        return self._browser_executor.submit(call).result()
+
+    def setup_logging(self, production=False):
+        """
+        Configura los loggers del scraper.
 
-    def setup_logging(self):
+        En modo producción no hay log de depuración, los handlers escriben desde
+        un hilo ``QueueListener`` y los mensajes por URL se agregan en resúmenes
+        periódicos (ver ``_log_hot``).
+        """
         # Crear directorio de logs si no existe
         log_dir = "logs"
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
         
         self.logger = logging.getLogger('ParesFileScraper')
-        self.logger.setLevel(logging.DEBUG)
+        self.image_logger = logging.getLogger('ParesFileScraper.Images')
+        self.redis_logger = logging.getLogger('ParesFileScraper.Redis')
+        self.log_aggregator = LogAggregator(self.logger, interval=60)
+        self.log_sampler = LogSampler(every=100)
+        level = logging.INFO if production else logging.DEBUG
+        for logger in (self.logger, self.image_logger, self.redis_logger):
+            logger.setLevel(level)
         if self.logger.handlers:
             return
 
@@ -70,180 +254,180 @@ class ParesFileScraper:
 
         self.logger.addHandler(gen)
         self.logger.addHandler(err)
-        self.logger.addHandler(dbg)
+        if not production:
+            self.logger.addHandler(dbg)
         self.logger.addHandler(out)
 
         # Logs de imágenes
-        self.image_logger = logging.getLogger('ParesFileScraper.Images')
-        self.image_logger.setLevel(logging.DEBUG)
         img_h = RotatingFileHandler(os.path.join(log_dir, 'image_downloads.log'), maxBytes=20*1024*1024, backupCount=3)
         img_h.setLevel(logging.DEBUG); img_h.setFormatter(formatter)
         self.image_logger.addHandler(img_h)
 
         # Logs de Redis
-        self.redis_logger = logging.getLogger('ParesFileScraper.Redis')
-        self.redis_logger.setLevel(logging.DEBUG)
         redis_h = RotatingFileHandler(os.path.join(log_dir, 'redis_operations.log'), maxBytes=10*1024*1024, backupCount=2)
         redis_h.setLevel(logging.DEBUG); redis_h.setFormatter(formatter)
         self.redis_logger.addHandler(redis_h)
 
-    def ensure_tor_available(self, host="127.0.0.1", port=9050, timeout=5):
-        sock = socket.socket()
-        sock.settimeout(timeout)
+        if production:
+            # Escritura de ficheros fuera del hilo de rastreo
+            for logger in (self.logger, self.image_logger, self.redis_logger):
+                attach_queue_listener(logger)
 
-        try:
-            sock.connect((host, port))
-            self.logger.info(f"Tor SOCKS proxy disponible en {host}:{port}")
-        except Exception as e:
-            self.logger.error(f"Tor no responde en {host}:{port}: {e}")
-            raise RuntimeError("Asegúrate de que Tor esté ejecutándose antes de usar el scraper.")
-        
-        try:
-            # Hacemos la petición usando el mismo contexto de Playwright
-            resp = self._context.request.get("https://api64.ipify.org", timeout=10000)
-            ip = resp.text()
-            self.logger.info(f"IP pública a través de Tor: {ip}")
-        except Exception as e:
-            self.logger.error(f"No se pudo obtener IP pública: {e}")
+    def _log_hot(self, logger, level, key, msg, *args):
+        """
+        Log del camino crítico (una vez por URL o por operación de Redis).
 
-        finally:
-            sock.close()
+        En producción sólo incrementa el contador ``key`` del agregador; en modo
+        detallado se formatea de forma perezosa y sólo si el nivel está activo.
+        """
+        if self.log_mode == "production":
+            self.log_aggregator.count(key)
+        elif logger.isEnabledFor(level):
+            logger.log(level, msg, *args)
+
+    def ensure_tor_available(self, timeout=60):
+        """Consulta el estado que mantiene el supervisor; sólo bloquea si Tor está caído."""
+        if self.tor.healthy:
+            return
+        self.logger.warning(f"Tor no está sano, esperando hasta {timeout}s")
+        if not self.tor.wait_healthy(timeout):
+            self.logger.error(f"Tor no responde en {self.tor.socks_host}:{self.tor.socks_port}")
+            raise RuntimeError("Asegúrate de que Tor esté ejecutándose antes de usar el scraper.")
 
     def _launch_new_session(self):
-        """Lanza un navegador/contexto/página nuevos con motor y UA aleatorios."""
-        types = ["chromium", "firefox", "webkit"]
-        self.current_browser = random.choice(types)
-        launcher = getattr(self._pw, self.current_browser)
-        self.logger.info(f"[SESSION] Lanzando {self.current_browser}")
-
-        # User-Agent aleatorio
-        ua = self.get_random_user_agent()
-        self.current_ua = ua
-        self.logger.debug(f"[SESSION] User-Agent asignado: {ua}")
-
-        # Montamos kwargs para lanzar el navegador
-        launch_kwargs = {"headless": True}
-        if self.use_tor:
-            launch_kwargs["proxy"] = {"server": "socks5://127.0.0.1:9050"}
-        self._browser = launcher.launch(**launch_kwargs)
-
-        # Montamos kwargs para el contexto
-        context_kwargs = {"user_agent": ua}
-        if self.use_tor:
-            context_kwargs["proxy"] = {"server": "socks5://127.0.0.1:9050"}
-        self._context = self._browser.new_context(**context_kwargs)
-
-        self._page = self._context.new_page()
+        """Lanza un navegador nuevo con motor aleatorio y un contexto (UA aleatorio) por slot."""
+        self.pool.launch()
+
+    def refresh_http_cookies(self, url):
+        """Visita ``url`` con el navegador y pasa sus cookies al cliente HTTP."""
+        def harvest():
+            self.logger.info(f"[HTTP] Cosechando cookies con {self.current_browser} desde {url}")
+            self._page.goto(url, timeout=60000, wait_until="domcontentloaded")
+            return self._context.cookies()
+        self.http_fetcher.load_cookies(self._on_browser(harvest), self.current_ua)
+
+    def _http_fetch(self, url, is_contiene, referer, headers, form=None, prime=True):
+        if not self.http_fetcher.has_cookies:
+            self.refresh_http_cookies(url)
+            prime = True
+        if is_contiene:
+            # El POST de SearchController.do depende del estado de sesión que fija la página contiene;
+            # los bloques siguientes de la misma contiene reutilizan ese estado (prime=False)
+            if prime:
+                self.http_fetcher.get(url, headers={"User-Agent": self.current_ua})
+            return self.http_fetcher.post(self.base_url + SEARCH_CONTROLLER_PATH, data=form or CONTIENE_FORM,
+                                          headers=headers)
+        if referer:
+            headers = dict(headers, Referer=referer)
+        return self.http_fetcher.get(url, headers=headers)
+
+    def _fetch_via_http(self, url, is_contiene, referer, headers, form=None, prime=True):
+        """Petición por el cliente HTTP; devuelve None si hay que recurrir al navegador."""
+        try:
+            return self._http_fetch(url, is_contiene, referer, headers, form, prime)
+        except ChallengeDetected as e:
+            self.html_limiter.report(e)
+            self.logger.warning(f"[HTTP] {e}; refrescando cookies con el navegador")
+        self.refresh_http_cookies(url)
+        try:
+            return self._http_fetch(url, is_contiene, referer, headers, form)
+        except ChallengeDetected as e:
+            self.logger.warning(f"[HTTP] {e}; usando el navegador para esta petición")
+            self.metrics.inc("pares_browser_fallbacks_total")
+            return None
 
     def rotate_session(self):
-        """Cierra la sesión actual, solicita NEWNYM a Tor (si aplica) y relanza sesión."""
-        self.logger.info("[ROTATE] Rotando sesión…")
+        """Recicla el contexto actual (UA, cookies, credenciales de proxy) y pide NEWNYM a Tor."""
+        self._on_browser(self._rotate_session)
 
-        # Cerrar browser/context/page
-        for obj in (self._page, self._context, self._browser):
-            try: obj.close()
-            except: pass
-
-        # Sólo solicitar NEWNYM si estamos usando Tor
-        if self.use_tor:
+    def _rotate_session(self):
+        # Otro hilo pudo rotar mientras esperábamos turno en el hilo de Playwright
+        slot = self._slot()
+        if slot.request_count <= self.rotate_after and not slot.needs_rotation:
+            return
+        self.logger.info(f"[ROTATE] Rotando sesión {slot.name}…")
+        self.metrics.inc("pares_rotations_total")
+        start = time.monotonic()
+
+        # Sólo se cierra el contexto: el proceso del navegador sigue caliente
+        self.pool.close_context(slot)
+
+        # Sólo solicitar NEWNYM si estamos usando Tor y el contexto no tiene circuito
+        # aislado propio (NEWNYM cambia los circuitos de todos los workers); se
+        # espera al evento de circuito construido en lugar de dormir un tiempo fijo
+        circuit_time = None
+        isolated = self.pool.http_isolated if self.fetch_mode == "http" else self.pool.circuit_isolated
+        if self.use_tor and not isolated:
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.connect(("127.0.0.1", 9051))
-                    s.sendall(b'AUTHENTICATE "mi_password_control"\r\nSIGNAL NEWNYM\r\nQUIT\r\n')
-                    resp = s.recv(1024).decode()
-                    self.logger.debug(f"[ROTATE] ControlPort respondió: {resp}")
+                circuit_time = self.tor.new_identity(wait_timeout=30)
             except Exception as e:
                 self.logger.error(f"[ROTATE] No se pudo rotar IP en Tor: {e}")
-            time.sleep(3)
-
-        # Relanzar nueva sesión limpia (será con o sin proxy, según use_tor)
-        self._launch_new_session()
-        self.request_count = 0
-        self.logger.info("[ROTATE] Sesión relanzada exitosamente")
-        # Esperar un momento para que Tor aplique el cambio
-        time.sleep(3)
-
-        # Relanzar nueva sesión limpia
-        self._launch_new_session()
-        self.request_count = 0
 
-        self.logger.info("[ROTATE] Sesión rotada exitosamente (navegador + IP + UA)")
+        # Si el slot venía de un fallback directo, vuelve a Tor; los demás slots no se tocan
+        self.pool.open_context(slot)
 
-    def load_existing_descriptions(self):
-        self.logger.info(f"Cargando descripciones existentes desde {self.description_file}")
-        if os.path.exists(self.description_file):
-            try:
-                with open(self.description_file, "r", encoding='utf-8') as desc_file:
-                    data = json.load(desc_file)
-                    self.logger.info(f"Cargadas {len(data)} descripciones existentes")
-                    return data
-            except Exception as e:
-                self.logger.error(f"Error cargando descripciones existentes: {e}")
-                return {}
-        else:
-            self.logger.info("No se encontró archivo de descripciones existente, iniciando con diccionario vacío")
-        return {}
+        elapsed = time.monotonic() - start
+        circuit_msg = f", circuito en {circuit_time:.2f}s" if circuit_time is not None else ""
+        self.metrics.observe("rotation", elapsed)
+        self.logger.info(f"[ROTATE] Sesión {slot.name} rotada en {elapsed:.2f}s{circuit_msg} (contexto + IP + UA)")
 
-    def save_descriptions(self):
+    def save_description(self, page_id, record):
         try:
-            self.logger.debug(f"Guardando {len(self.urls_description)} descripciones en {self.description_file}")
-            with open(self.description_file, "w", encoding='utf-8') as desc_file:
-                json.dump(self.urls_description, desc_file, indent=4, ensure_ascii=False)
-            self.logger.info(f"Descripciones guardadas exitosamente en {self.description_file}")
+            with self.metrics.timer("persist"):
+                self.store.append(page_id, record)
+                if self.sqlite:
+                    self.sqlite.upsert(page_id, record)
+            self.logger.debug(f"Descripción {page_id} anexada al segmento de {self.description_file}")
         except Exception as e:
-            self.logger.error(f"Error guardando descripciones: {e}")
+            self.logger.error(f"Error guardando descripción {page_id}: {e}")
 
     def get_current_ip(self):
-        """Obtiene la IP pública visible a través de Tor."""
-        try:
-            self.logger.debug("Obteniendo IP pública a través de Tor")
-            # Cambia la URL por una de las opciones rápidas
-            response = self.session.get("https://api64.ipify.org")
-            ip = response.text.strip()
-            self.logger.info(f"IP Pública obtenida: {ip}")
-            print(f"IP Pública: {ip}")
-        except Exception as e:
-            self.logger.error(f"Error obteniendo la IP pública: {e}")
-            print(f"Error obteniendo la IP pública: {e}")
+        """Devuelve la IP pública visible a través de Tor (cacheada por el supervisor)."""
+        ip = self.tor.exit_ip
+        if ip is None:
+            self.logger.debug("IP pública aún desconocida; el supervisor la refrescará")
+        else:
+            self.logger.debug("IP pública: %s", ip)
+        return ip
 
     def get_next_url(self):
-        self.redis_logger.debug("Obteniendo siguiente URL de Redis")
-
-        # Verificar si hay URLs disponibles
-        pending_count = self.r.llen("todo_urls")
-        self.redis_logger.debug(f"URLs pendientes en cola: {pending_count}")
-
-        if pending_count == 0:
-            self.redis_logger.info("No hay URLs pendientes en la cola")
-            return None
-
+        # Una sola ida y vuelta: BLPOP/BLMOVE esperan hasta dequeue_timeout segundos
         try:
-            # Usar lpop en lugar de blpop para evitar bloqueos
-            url_bytes = self.r.lpop("todo_urls")
-            if url_bytes:
-                decoded_url = url_bytes.decode()
-                self.redis_logger.info(f"URL obtenida de Redis: {decoded_url}")
-                return decoded_url
-            else:
-                self.redis_logger.debug("No se obtuvo URL de Redis (cola vacía)")
-                return None
+            url = self.queue.dequeue(timeout=self.dequeue_timeout)
+            if url:
+                self._log_hot(self.redis_logger, logging.INFO, "urls_obtenidas", "URL obtenida de Redis: %s", url)
+            return url
         except Exception as e:
             self.redis_logger.error(f"Error obteniendo URL de Redis: {e}")
             return None
 
     def mark_as_done(self, url):
-        # Marca una URL como completada en Redis
+        # Marca una URL como completada en Redis (y la retira de la lista en curso)
         try:
-            self.r.sadd("done_urls", url)
-            self.redis_logger.info(f"URL marcada como completada: {url}")
+            self.queue.ack(url)
+            self._log_hot(self.redis_logger, logging.INFO, "urls_completadas", "URL marcada como completada: %s", url)
         except Exception as e:
             self.redis_logger.error(f"Error marcando URL como completada {url}: {e}")
 
+    def enqueue_urls(self, urls):
+        # Único punto de encolado: dedup contra seen_urls en un solo viaje a Redis
+        try:
+            with self.metrics.timer("enqueue"):
+                pushed = self.queue.enqueue_many(urls)
+            if self.log_mode == "production":
+                self.log_aggregator.count("urls_encoladas", pushed)
+            else:
+                self.redis_logger.debug("Encoladas %d de %d URLs descubiertas", pushed, len(urls))
+            return pushed
+        except Exception as e:
+            self.redis_logger.error(f"Error encolando {len(urls)} URLs: {e}")
+            return 0
+
     def is_done(self, url):
         # Verifica si la URL ya fue procesada
         try:
-            is_done = self.r.sismember("done_urls", url)
-            self.redis_logger.debug(f"Verificación de URL procesada {url}: {is_done}")
+            is_done = self.queue.is_done(url)
+            self.redis_logger.debug("Verificación de URL procesada %s: %s", url, is_done)
             return is_done
         except Exception as e:
             self.redis_logger.error(f"Error verificando si URL está procesada {url}: {e}")
@@ -265,46 +449,7 @@ class ParesFileScraper:
         """
         Parsea el contenido HTML y lo convierte a un diccionario JSON con datos sanitizados.
         """
-        self.logger.debug("Iniciando parseo de HTML a JSON")
-        soup = BeautifulSoup(html_content, 'html.parser')
-        data = {}
-
-        # Buscar el contenedor principal
-        wrapper = soup.find(id="wrapper_ficha")
-        if not wrapper:
-            self.logger.warning("No se encontró wrapper_ficha en el HTML")
-            return data
-
-        # Buscar la sección del área
-        area = wrapper.find(class_="area")
-        if not area:
-            self.logger.warning("No se encontró sección 'area' en el HTML")
-            return data
-
-        # Buscar todas las secciones de información
-        infos = area.find_all(class_="info")
-        self.logger.debug(f"Encontradas {len(infos)} secciones de información")
-        
-        for info in infos:
-            title_element = info.find('h4', class_='aviso')
-            if title_element:
-                title = title_element.get_text(strip=True).rstrip(':')
-                value_element = info.find('p')
-
-                if value_element:
-                    # Sanitizar el texto
-                    value = self.sanitizar_texto(''.join(value_element.stripped_strings))
-                    link = value_element.find('a')
-                    if link:
-                        data[title] = {
-                            'texto': value,
-                            'link': link['href']
-                        }
-                        self.logger.debug(f"Añadido campo con link: {title}")
-                    else:
-                        data[title] = value
-                        self.logger.debug(f"Añadido campo: {title}")
-
+        data = parse_ficha(BeautifulSoup(html_content, resolve_parser(self.parser)))
         self.logger.info(f"Parseo completado, extraídos {len(data)} campos")
         return data
 
@@ -313,147 +458,162 @@ class ParesFileScraper:
         Sanitiza un texto eliminando caracteres innecesarios como saltos de línea,
         tabulaciones y espacios extra. También separa números y palabras si están juntos.
         """
-        self.logger.debug(f"Sanitizando texto de longitud: {len(texto)}")
-        # 1. Eliminar caracteres de espacio, saltos de línea y tabulaciones innecesarias
-        texto_limpio = re.sub(r'\s+', ' ', texto).strip()
+        return sanitizar_texto(texto)
 
-        # 2. Separar palabras y números si están juntos
-        texto_limpio = re.sub(r'(\d+)', r' \1 ', texto_limpio).strip()
+    def extract_page(self, html, with_ficha=True):
+        """Una sola pasada de parseo por página (ver pares_parser.extract_page)."""
+        with self.metrics.timer("parse"):
+            return extract_page(html, self.base_url, parser=self.parser, with_ficha=with_ficha)
 
-        self.logger.debug(f"Texto sanitizado, nueva longitud: {len(texto_limpio)}")
-        return texto_limpio
-    
     def process_find(self, url):
         try:
             self.logger.info(f"Procesando URL find: {url}")
             html = self.curl_request(url, is_contiene=False)
-            time.sleep(2)
             if not html:
                 self.logger.warning(f"No se obtuvo contenido HTML para find URL: {url}")
                 return
 
-            soup = BeautifulSoup(html, 'html.parser')
-            desc_links = soup.find_all('a', href=re.compile(r'/description/\d+'))
-            desc_urls = [urljoin(self.base_url, link['href']) for link in desc_links]
+            desc_urls = self.extract_page(html, with_ficha=False)["descriptions"]
 
             if desc_urls:
-                self.logger.info(f"Encontrados {len(desc_urls)} enlaces de descripción en find: {desc_urls}")
-                for desc_url in desc_urls:
-                    self.r.rpush("todo_urls", desc_url)  # Añade a Redis
-                    self.redis_logger.debug(f"Añadida URL description a Redis: {desc_url}")
+                self.logger.debug("Encontrados %d enlaces de descripción en find: %s", len(desc_urls), desc_urls)
+                self._count_progress("enlaces_find", len(desc_urls))
+                self.enqueue_urls(desc_urls)
             else:
-                self.logger.info(f"No se encontraron enlaces de descripción en find URL: {url}")
+                self.logger.info("No se encontraron enlaces de descripción en find URL: %s", url)
         except Exception as e:
             self.log_error(f"Error processing find URL {url}: {e}")
 
     def process_description(self, url):
+        # Una línea DEBUG por paso; en INFO sólo cuentan los totales del log de progreso
         try:
-            self.logger.info(f"Procesando URL description: {url}")
-            # Obtener cookies para el contexto de "description"
-            # Usar curl con cookies
             html_content = self.curl_request(url, is_contiene=False)
-            time.sleep(2)
             if not html_content:
-                self.logger.warning(f"No se obtuvo contenido HTML para description URL: {url}")
+                self.logger.warning("No se obtuvo contenido HTML para description URL: %s", url)
                 return
 
             match = re.search(r'description/(\d+)', url)
             if match:
                 page_id = match.group(1)
-                self.logger.info(f"Procesando description con ID: {page_id}")
-                soup = BeautifulSoup(html_content, 'html.parser')
+                self.logger.debug("Procesando description %s: %s", page_id, url)
+                page = self.extract_page(html_content)
 
                 # Encola las URLs de "contiene"
-                contiene_links = soup.find_all('a', href=re.compile(r'/contiene/\d+'))
-                contiene_urls = [urljoin(self.base_url, link['href']) for link in contiene_links]
+                contiene_urls = page["contiene"]
                 if contiene_urls:
-                    self.logger.info(f"Encontrados {len(contiene_urls)} enlaces contiene")
-                    for contiene_url in contiene_urls:
-                        self.r.rpush("todo_urls", contiene_url)
-                        self.redis_logger.debug(f"Añadida URL contiene a Redis: {contiene_url}")
+                    self.logger.debug("Encontrados %d enlaces contiene en %s", len(contiene_urls), page_id)
+                    self._count_progress("enlaces_contiene", len(contiene_urls))
+                    self.enqueue_urls(contiene_urls)
 
                 # Procesa el enlace "show" y genera links de descarga
                 has_image = False
                 img_download_links = []
-                show_link = soup.find('a', href=re.compile(r'/show/\d+'))
-                if show_link:
+                show_url = page["show"]
+                if show_url:
                     has_image = True
-                    show_url = urljoin(self.base_url, show_link['href'])
-                    self.logger.info(f"Procesando show URL: {show_url}")
                     show_content = self.curl_request(show_url, is_contiene=False, referer=url)
                     if show_content:
-                        dbcodes = re.findall(
-                            r'VisorController.do?.*txt_id_imagen=(\d*)&txt_rotar=0&txt_contraste=0&appOrigen=&dbCode=(\d*)',
-                            show_content
-                        )
-                        img_download_links = [
-                            f"https://pares.mcu.es/ParesBusquedas20/ViewImage.do?accion=42"
-                            f"&txt_zoom=10&txt_contraste=0&txt_polarizado=&txt_brillo=10.0"
-                            f"&txt_contrast=1.0&txt_transformacion=-1&txt_descarga=1"
-                            f"&dbCode={dbcode[1]}&txt_id_imagen={dbcode[0]}"
-                            for dbcode in dbcodes
-                        ]
-                        count = len(img_download_links)
-                        self.logger.info(f"Generados {len(img_download_links)} enlaces de descarga de imágenes")
-                        self.image_logger.info(f"Enlaces de descarga generados para page_id {page_id}: {count}")
-
-                        if not self.skip_download:
-                            self.logger.info(f"Iniciando descarga de imágenes para page_id: {page_id}")
-                            self.download_images(page_id, img_download_links)
+                        img_download_links = extract_image_links(show_content, self.base_url)
+                        self.image_logger.debug("Enlaces de descarga generados para page_id %s: %d",
+                                                page_id, len(img_download_links))
+                        self._count_progress("imagenes", len(img_download_links))
+
+                        if self.skip_download:
+                            self.image_logger.debug("Descarga de imágenes omitida para %s", page_id)
+                        elif self.image_jobs:
+                            queued = self.image_jobs.enqueue(page_id, img_download_links, url=url)
+                            self.logger.debug("Imágenes de page_id %s %s", page_id,
+                                              "encoladas en image_jobs" if queued else "ya estaban en cola")
                         else:
-                            self.logger.info("Descarga de imágenes omitida (skip_download=True)")
+                            self.download_images(page_id, img_download_links)
                 else:
-                    self.logger.info(f"No se encontró enlace show para page_id: {page_id}")
+                    self.logger.debug("No se encontró enlace show para page_id: %s", page_id)
 
-                description_data = self.parse_html_to_json(html_content)
-                self.urls_description[page_id] = {
+                description_data = page["ficha"]
+                self.save_description(page_id, {
                     "url": url,
                     "additional_data": description_data,
                     "has_image": has_image,
                     "image_links": img_download_links,
-                }
-                self.save_descriptions()
-                self.logger.info(f"Procesamiento de description completado para page_id: {page_id}")
+                })
+                self._count_progress("fichas")
+                self.logger.debug("Description %s completada: %d campos, %d imágenes",
+                                  page_id, len(description_data), len(img_download_links))
             else:
-                self.logger.error(f"No se pudo extraer page_id de la URL: {url}")
+                self.logger.error("No se pudo extraer page_id de la URL: %s", url)
         except Exception as e:
             self.log_error(f"Error processing description URL {url}: {e}")
 
     def log_error(self, message):
+        # El StreamHandler ya lo saca por consola
         self.logger.error(message)
-        print(message)  # Mantenemos el print original para compatibilidad
 
     def get_random_user_agent(self):
-        # Lista de User-Agents de diferentes navegadores y dispositivos
-        user_agents = [
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:112.0) Gecko/20100101 Firefox/112.0",
-            "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/130.0.0.0 Safari/537.36",
-            "Mozilla/5.0 (iPhone; CPU iPhone OS 15_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.2 Mobile/15E148 Safari/604.1",
-            "Mozilla/5.0 (Android 11; Mobile; rv:112.0) Gecko/112.0 Firefox/112.0",
-        ]
-        selected_ua = random.choice(user_agents)
-        self.logger.debug(f"User-Agent seleccionado: {selected_ua}")
+        selected_ua = random.choice(USER_AGENTS)
+        self.logger.debug("User-Agent seleccionado: %s", selected_ua)
         return selected_ua
 
-    def curl_request(self, url, is_contiene=False, referer=None, max_retries=3):
+    def curl_request(self, url, is_contiene=False, referer=None, max_retries=3, form=None, prime=True):
+        """
+        Devuelve el HTML de ``url``, de la caché si está y no ha caducado.
+
+        Las respuestas descargadas se guardan en la caché; en modo replay nunca
+        se sale a la red y un fallo de caché devuelve "". ``form`` sustituye a
+        ``CONTIENE_FORM`` (un bloque del listado) y forma parte de la clave de caché.
+        """
+        return self._cached_fetch(url, is_contiene, referer, max_retries, form, prime)[0]
+
+    def _cached_fetch(self, url, is_contiene=False, referer=None, max_retries=3, form=None, prime=True):
+        """Como :meth:`curl_request`, pero devuelve ``(html, fetched)``: ``fetched`` si fue a la red."""
+        body = (form or CONTIENE_FORM) if is_contiene else None
+        if self.cache:
+            html = self.cache.get(url, body, ignore_ttl=self.replay)
+            if html is not None:
+                self.metrics.inc("pares_cache_hits_total")
+                self._log_hot(self.logger, logging.DEBUG, "paginas_cache", "Página servida desde caché: %s", url)
+                return html, False
+            self.metrics.inc("pares_cache_misses_total")
+            if self.replay:
+                self.logger.warning(f"[REPLAY] {url} no está en la caché")
+                return "", False
+
+        html = self._fetch_page(url, is_contiene, referer, max_retries, form, prime)
+        if html and self.cache:
+            try:
+                self.cache.put(url, html, body)
+            except OSError as e:
+                self.logger.error(f"[CACHE] No se pudo guardar {url}: {e}")
+        return html, True
+
+    def _fetch_page(self, url, is_contiene=False, referer=None, max_retries=3, form=None, prime=True):
         """
         Realiza una petición con Playwright usando Tor + UA aleatorio.
         Rotando sesión cada self.rotate_after peticiones.
         Si Tor no conecta, hace fallback directo (sin proxy) una sola vez.
+        Con ``prime=False`` una contiene no vuelve a cargar su página antes del POST
+        (otro bloque ya la cargó); los reintentos sí la cargan.
         """
-        # Aseguramos que Tor esté disponible antes de empezar
+        # Aseguramos que Tor esté disponible (flag en memoria del supervisor)
         if self.use_tor:
             self.ensure_tor_available()
 
         for attempt in range(1, max_retries + 1):
+            circuit = None
             try:
-                # Rotar sesión si toca
+                # Rotar sesión si toca (o si su circuito ha sido retirado)
                 self.request_count += 1
-                if self.request_count > self.rotate_after:
+                if self.request_count > self.rotate_after or self._slot().needs_rotation:
                     self.rotate_session()
                     self.request_count = 1
+                    prime = True
+                # Un reintento puede venir de una sesión nueva: vuelve a cargar la contiene
+                prime = prime or attempt > 1
+                slot = self._slot()
+                # El cliente HTTP puede ir por un circuito distinto del navegador (ver ContextPool)
+                circuit = slot.http_circuit if self.http_fetcher else slot.circuit
+                # Cortesía con el servidor: ficha del presupuesto HTML compartido
+                self.metrics.observe("rate_wait", self.html_limiter.acquire())
+                fetch_start = time.monotonic()
 
                 # Cabeceras comunes
                 headers = {
@@ -464,82 +624,132 @@ class ParesFileScraper:
                     "sec-ch-ua-platform": '"Windows"'
                 }
 
-                if is_contiene:
-                    # Petición AJAX “contiene”
-                    headers.update({
-                        "Accept": "text/html, */*; q=0.01",
-                        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-                        "X-Requested-With": "XMLHttpRequest",
-                        "Origin": self.base_url,
-                        "Referer": referer or url,
-                        "Cache-Control": "max-age=0",
-                        "Connection": "keep-alive"
-                    })
-                    self._page.goto(url, timeout=60000, wait_until="domcontentloaded")
-                    self._page.wait_for_load_state("networkidle", timeout=10000)
-                    response = self._page.request.post(
-                        "https://pares.mcu.es/ParesBusquedas20/catalogo/contiene/SearchController.do",
-                        headers=headers,
-                        data={"tambloque": "10000", "orderBy": "0"}
-                    )
-                else:
-                    # Petición GET normal
-                    headers.update({
-                        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                        "Cache-Control": "max-age=0",
-                        "Connection": "keep-alive",
-                        "Upgrade-Insecure-Requests": "1"
-                    })
-                    response = self._page.goto(url, timeout=60000, wait_until="domcontentloaded")
-
-                # Si responde OK, devolver HTML
-                if response and getattr(response, "ok", True):
-                    html = response.text()
-                    self.logger.info(f"Página obtenida: {url} (Intento {attempt}/{max_retries})")
-                    return html
-                else:
-                    raise Exception(f"Status inválido: {getattr(response, 'status', None)}")
+                if self.http_fetcher:
+                    http_headers = dict(headers)
+                    if is_contiene:
+                        http_headers.update({
+                            "Accept": "text/html, */*; q=0.01",
+                            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+                            "X-Requested-With": "XMLHttpRequest",
+                            "Origin": self.base_url,
+                            "Referer": referer or url,
+                        })
+                    else:
+                        http_headers["Accept"] = "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"
+                    html = self._fetch_via_http(url, is_contiene, referer, http_headers, form, prime)
+                    if html is not None:
+                        self._score_circuit(circuit, True, time.monotonic() - fetch_start)
+                        self.html_limiter.feedback(True)
+                        self._count_page(True)
+                        self.metrics.observe("fetch", time.monotonic() - fetch_start)
+                        self._log_hot(self.logger, logging.INFO, "paginas_http",
+                                      "Página obtenida por HTTP: %s (Intento %d/%d)", url, attempt, max_retries)
+                        return html
+
+                # Si se llega aquí desde el cliente HTTP, el navegador no ha cargado la contiene
+                circuit = slot.circuit
+                html = self._on_browser(self._browser_fetch, url, is_contiene, referer, headers, form,
+                                        prime or self.http_fetcher is not None)
+                self._score_circuit(circuit, True, time.monotonic() - fetch_start)
+                self.html_limiter.feedback(True)
+                self._count_page(True)
+                self.metrics.observe("fetch", time.monotonic() - fetch_start)
+                self._log_hot(self.logger, logging.INFO, "paginas_navegador",
+                              "Página obtenida: %s (Intento %d/%d)", url, attempt, max_retries)
+                return html
 
             except Exception as e:
                 msg = str(e)
+                self._score_circuit(circuit, False)
+                self._count_page(False)
+                # 429/5xx/timeouts reducen la tasa global de todos los workers
+                self.html_limiter.report(e)
                 # Detectamos el fallo de Tor y hacemos fallback DIRECTO una sola vez
                 if "Host unreachable through SOCKSv5" in msg:
                     self.logger.warning("[curl_request] Tor inaccesible, reintentando DIRECTO (sin proxy)")
-                    # Cerrar sesión proxy
-                    for obj in (self._page, self._context, self._browser):
-                        try: obj.close()
-                        except: pass
-
-                    # Relanzar sin proxy
-                    launcher = getattr(self._pw, self.current_browser)
-                    self._browser = launcher.launch(headless=True)
-                    self._context = self._browser.new_context(user_agent=self.current_ua)
-                    self._page = self._context.new_page()
-
-                    # Sólo un retry directo
-                    try:
-                        response2 = self._page.goto(url, timeout=60000, wait_until="domcontentloaded")
-                        self._page.wait_for_load_state("networkidle", timeout=30000)
-                        if response2 and getattr(response2, "ok", True):
-                            html2 = response2.text()
-                            self.logger.info(f"[curl_request] Página obtenida DIRECTO: {url}")
-                            return html2
-                        else:
-                            self.logger.error(f"[curl_request] Falla DIRECTO: status {getattr(response2,'status',None)}")
-                            return ""
-                    except Exception as e2:
-                        self.logger.error(f"[curl_request] Excepción DIRECTO: {e2}")
-                        return ""
+                    self.metrics.inc("pares_tor_fallbacks_total")
+                    self.html_limiter.acquire()
+                    return self._on_browser(self._direct_fetch, url)
 
-            # Si no es Tor o ya agotó proxies, backoff normal
+            # Si no es Tor, se reintenta; la espera la marca el limitador al pedir ficha
             self.logger.warning(f"[Intento {attempt}] Error en curl_request({url}): {msg}")
             if attempt < max_retries:
-                time.sleep(5)
+                self.metrics.inc("pares_retries_total")
             else:
                 self.logger.error(f"Fallo después de {max_retries} intentos: {url}")
                 return ""
 
+    def _count_page(self, ok):
+        """Contadores globales de páginas; el supervisor calcula con ellos la tasa de error."""
+        try:
+            self.r.incr("stats:pages_ok" if ok else "stats:pages_failed")
+        except redis.RedisError as e:
+            self.logger.debug(f"No se pudo actualizar stats de páginas: {e}")
+
+    def _score_circuit(self, circuit, ok, latency=None):
+        """Puntúa el circuito del contexto actual; si se retira, el contexto rotará."""
+        if not self.use_tor or circuit is None or not self._slot().proxied:
+            return
+        if self.pool.record(circuit, ok, latency):
+            self._slot().needs_rotation = True
+
+    def _browser_fetch(self, url, is_contiene, referer, headers, form=None, prime=True):
+        """Petición con la página de Playwright del contexto actual; devuelve el HTML."""
+        if is_contiene:
+            # Petición AJAX “contiene”
+            headers.update({
+                "Accept": "text/html, */*; q=0.01",
+                "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+                "X-Requested-With": "XMLHttpRequest",
+                "Origin": self.base_url,
+                "Referer": referer or url,
+                "Cache-Control": "max-age=0",
+                "Connection": "keep-alive"
+            })
+            if prime:
+                self._page.goto(url, timeout=60000, wait_until="domcontentloaded")
+                self._page.wait_for_load_state("networkidle", timeout=10000)
+            response = self._page.request.post(self.base_url + SEARCH_CONTROLLER_PATH, headers=headers,
+                                               data=form or CONTIENE_FORM)
+        else:
+            # Petición GET normal
+            headers.update({
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                "Cache-Control": "max-age=0",
+                "Connection": "keep-alive",
+                "Upgrade-Insecure-Requests": "1"
+            })
+            response = self._page.goto(url, timeout=60000, wait_until="domcontentloaded")
+
+        # Si responde OK, devolver HTML
+        if response and getattr(response, "ok", True):
+            return response.text()
+        raise Exception(f"Status inválido: {getattr(response, 'status', None)}")
+
+    def _direct_fetch(self, url):
+        """Reabre el contexto actual sin proxy y reintenta ``url`` una sola vez."""
+        # Sólo este slot sale directo hasta su próxima rotación; el navegador compartido sigue con Tor
+        slot = self._slot()
+        self.pool.close_context(slot)
+        self.pool.open_context(slot, direct=True)
+
+        # Sólo un retry directo
+        try:
+            response2 = self._page.goto(url, timeout=60000, wait_until="domcontentloaded")
+            self._page.wait_for_load_state("networkidle", timeout=30000)
+            if response2 and getattr(response2, "ok", True):
+                html2 = response2.text()
+                self.logger.info(f"[curl_request] Página obtenida DIRECTO: {url}")
+                return html2
+            else:
+                self.logger.error(f"[curl_request] Falla DIRECTO: status {getattr(response2,'status',None)}")
+                return ""
+        except Exception as e2:
+            self.logger.error(f"[curl_request] Excepción DIRECTO: {e2}")
+            return ""
+
     def download_images(self, page_id, img_links, max_retries=3):
+        """``img_links``: lista de URLs (índices desde 1) o ``{índice: url}`` para un subconjunto."""
         self.image_logger.info(f"Descargando {len(img_links)} imágenes para page_id {page_id}")
 
         # Contar todo el lote como 1 petición
@@ -549,217 +759,273 @@ class ParesFileScraper:
             self.request_count = 1
 
         img_dir = os.path.join(self.img_folder, page_id)
-        os.makedirs(img_dir, exist_ok=True)
-
-        last = int(self.r.get(f"last_downloaded_image:{page_id}") or 0)
-        for idx, img_url in enumerate(img_links[last:], start=last + 1):
-            if self.r.sismember(f"images:{page_id}", idx):
-                continue
-
-            img_path = os.path.join(img_dir, f"image_{idx}.jpg")
-            for intento in range(1, max_retries + 1):
-                try:
-                    self.image_logger.info(f"  → Imagen {idx} (intento {intento}/{max_retries})")
-                    # Petición desde el mismo contexto, con Referer y cabeceras “navegador real”
-                    headers = {
-                        "Referer": self.base_url,
-                        "Accept": "image/avif,image/webp,image/apng,*/*;q=0.8",
-                        "User-Agent": self.current_ua,
-                    }
-                    resp = self._context.request.get(img_url, headers=headers, timeout=30000)
-                    if not resp.ok:
-                        raise Exception(f"HTTP {resp.status}")
-                    # Guardar fichero
-                    with open(img_path, "wb") as f:
-                        f.write(resp.body())
-                    self.image_logger.info(f"    ✔ Guardada ({os.path.getsize(img_path)} bytes)")
-                    self.r.sadd(f"images:{page_id}", idx)
-                    self.r.set(f"last_downloaded_image:{page_id}", str(idx))
-                    break
-                except Exception as e:
-                    self.image_logger.warning(f"    ✖ Error: {e}")
-                    time.sleep(1)
-            else:
-                self.image_logger.error(f"  ✖ No descargada tras {max_retries} intentos")
-                self.r.sadd(f"failed_images:{page_id}", idx)
+        download_start = time.monotonic()
+        # Descarga concurrente con las cookies/UA de la sesión actual de Playwright
+        stats = self.image_downloader.download(
+            page_id,
+            img_links,
+            img_dir,
+            cookies=self._on_browser(lambda: self._context.cookies()),
+            user_agent=self.current_ua,
+            referer=self.base_url,
+            max_retries=max_retries,
+            proxy=self._slot().proxy_url() if self._slot().proxied else None,
+        )
+        self.metrics.observe("image_download", time.monotonic() - download_start)
+        self.metrics.inc("pares_images_downloaded_total", stats["downloaded"])
+        self.metrics.inc("pares_image_bytes_total", stats["bytes"])
+        self.metrics.inc("pares_failed_images_total", stats["failed"])
 
-        # Limpieza si acabó
-        total = len(img_links)
-        done = self.r.scard(f"images:{page_id}")
-        if done == total:
+        # Limpieza si acabó (según el manifiesto, no según los contadores de Redis)
+        if stats["missing"] == 0:
             self.r.delete(f"last_downloaded_image:{page_id}")
             self.image_logger.info("✔ Todas las imágenes descargadas.")
         else:
-            self.image_logger.warning(f"⚠ Faltan {total-done} imágenes.")
+            self.image_logger.warning(f"⚠ Faltan {stats['missing']} imágenes.")
+        return stats
 
     def retry_failed_image_downloads(self, page_id):
         self.image_logger.info(f"Reintentando descargas fallidas para page_id: {page_id}")
-        failed_urls = self.r.smembers(f"failed_images:{page_id}")
-        
-        if failed_urls:
-            failed_count = len(failed_urls)
-            self.image_logger.info(f"Reintentando descargar {failed_count} imágenes fallidas para {page_id}")
-            print(f"Reintentando descargar {failed_count} imágenes fallidas...")
-            # Convertir a lista para pasar a download_images
-            self.download_images(page_id, list(failed_urls))
-            # Limpiar la lista de imágenes fallidas después del reintento
-            self.r.delete(f"failed_images:{page_id}")
-            self.image_logger.info(f"Limpiada lista de imágenes fallidas para {page_id}")
+        # failed_images guarda índices: las URLs de origen salen del manifiesto
+        manifest = ImageManifest(os.path.join(self.img_folder, page_id), page_id)
+        sources = manifest.sources()
+        failed = {int(idx) for idx in self.r.smembers(f"failed_images:{page_id}")}
+        failed |= set(manifest.indices("failed", "corrupt"))
+        failed_links = {idx: sources[idx] for idx in sorted(failed) if idx in sources}
+        unknown = failed - set(failed_links)
+        if unknown:
+            self.image_logger.warning(f"Sin URL de origen en el manifiesto para {page_id}: {sorted(unknown)}")
+
+        if failed_links:
+            failed_count = len(failed_links)
+            self.image_logger.info("Reintentando descargar %d imágenes fallidas para %s", failed_count, page_id)
+            # Las que se descarguen salen de failed_images al volcar el progreso
+            stats = self.download_images(page_id, failed_links)
+            self.image_logger.info(f"Reintento de {page_id}: {stats['downloaded']} recuperadas, {stats['failed']} siguen fallando")
         else:
             self.image_logger.info(f"No hay imágenes fallidas para reintentar en {page_id}")
 
     def verify_images_downloaded(self, page_id, total_images):
         self.image_logger.info(f"Verificando imágenes descargadas para {page_id}. Total esperado: {total_images}")
-        downloaded_count = self.r.scard(f"images:{page_id}")
+        # Se comprueban los ficheros (existencia y tamaño del manifiesto), no sólo el contador
+        manifest = ImageManifest(os.path.join(self.img_folder, page_id), page_id)
+        valid_indices = {idx for idx in range(1, total_images + 1) if manifest.is_valid(idx)}
+        downloaded_count = len(valid_indices)
         
         if downloaded_count == total_images:
-            self.image_logger.info(f"Verificación exitosa: Todas las imágenes ({total_images}) de {page_id} descargadas")
-            print(f"Todas las imágenes ({total_images}) de la página {page_id} han sido descargadas.")
+            self.image_logger.info("Verificación exitosa: Todas las imágenes (%d) de %s descargadas", total_images, page_id)
             return True
         else:
             missing_count = total_images - downloaded_count
-            self.image_logger.warning(f"Verificación falló: Faltan {missing_count} imágenes para {page_id}")
-            print(f"Faltan {missing_count} imágenes para la página {page_id}.")
+            self.image_logger.warning("Verificación falló: Faltan %d imágenes para %s", missing_count, page_id)
             
             # Opcional: Listado de imágenes faltantes
             all_indices = set(range(1, total_images + 1))
-            downloaded_indices = {int(idx) for idx in self.r.smembers(f"images:{page_id}")}
-            missing_indices = all_indices - downloaded_indices
+            missing_indices = all_indices - valid_indices
             
-            self.image_logger.debug(f"Índices de imágenes faltantes para {page_id}: {missing_indices}")
-            print(f"Índices de imágenes faltantes: {missing_indices}")
+            self.image_logger.debug("Índices de imágenes faltantes para %s: %s", page_id, missing_indices)
             
             return False
 
-    def process_contiene(self, url):
-        try:
-            self.logger.info(f"Procesando URL contiene: {url}")
-
-            # DEBUGGING: Guardar HTML para inspección
-            html = self.curl_request(url, is_contiene=True)
+    def _fetch_contiene_block(self, url, blocks, block, prime, slot=None):
+        """
+        Descarga y parsea un bloque.
 
-            time.sleep(2)
+        Devuelve ``(urls, primed)``: las URLs description (None si ha fallado) y si
+        la petición salió a la red con la contiene cargada, de modo que los
+        siguientes bloques ya pueden ir sin ``prime``.
+        """
+        if slot is not None:
+            # Hilo del pool de bloques: mismo contexto (cookies, circuito) que la contiene
+            self._local.slot = slot
+        try:
+            html, fetched = self._cached_fetch(url, is_contiene=True, form=blocks.form(block), prime=prime)
             if not html:
-                self.logger.warning(f"No se obtuvo contenido HTML para contiene URL: {url}")
-                return
-
-            # DEBUGGING: Mostrar primeros caracteres del HTML
-            self.logger.info(f"HTML recibido (primeros 500 chars): {html[:500]}")
-
-            soup = BeautifulSoup(html, 'html.parser')
-
-            # AMPLIADO: Buscar diferentes patrones de enlaces
-            patterns_to_search = [
-                r'/description/\d+',
-                r'description/\d+',
-                r'/catalogo/description/\d+',
-                r'catalogo/description/\d+'
-            ]
-
-            all_desc_links = []
-            for pattern in patterns_to_search:
-                desc_links = soup.find_all('a', href=re.compile(pattern))
-                self.logger.debug(f"Patrón '{pattern}' encontró {len(desc_links)} enlaces")
-                all_desc_links.extend(desc_links)
-
-            # Remover duplicados manteniendo orden
-            seen = set()
-            unique_desc_links = []
-            for link in all_desc_links:
-                href = link['href']
-                if href not in seen:
-                    seen.add(href)
-                    unique_desc_links.append(link)
-
-            desc_urls = [urljoin(self.base_url, link['href']) for link in unique_desc_links]
-
-            # DEBUGGING: Mostrar todos los enlaces encontrados
-            all_links = soup.find_all('a')
-            self.logger.info(f"Total de enlaces <a> encontrados en contiene: {len(all_links)}")
-
-            # Mostrar una muestra de enlaces para debugging
-            sample_links = all_links[:10]  # Primeros 10 enlaces
-            for i, link in enumerate(sample_links):
-                href = link.get('href', 'SIN HREF')
-                text = link.get_text(strip=True)[:50]  # Primeros 50 caracteres del texto
-                self.logger.debug(f"Enlace {i+1}: href='{href}' text='{text}'")
-
-            # NUEVO: Buscar también en JavaScript/JSON embebido
-            script_tags = soup.find_all('script')
-            self.logger.info(f"Scripts encontrados: {len(script_tags)}")
-
-            for i, script in enumerate(script_tags):
-                script_content = script.get_text()
-                if 'description' in script_content.lower():
-                    self.logger.debug(f"Script {i+1} contiene 'description': {script_content[:200]}")
-
-                    # Buscar patrones de URLs en JavaScript
-                    js_desc_matches = re.findall(r'description[/\\](\d+)', script_content)
-                    if js_desc_matches:
-                        self.logger.info(f"IDs de description encontrados en JavaScript: {js_desc_matches}")
-                        for desc_id in js_desc_matches:
-                            desc_url = f"{self.base_url}/ParesBusquedas20/catalogo/description/{desc_id}"
-                            if desc_url not in desc_urls:
-                                desc_urls.append(desc_url)
+                return None, False
+            if self.logger.isEnabledFor(logging.DEBUG) and self.log_sampler.should_log("html_contiene"):
+                self.logger.debug("HTML recibido (bloque %d, primeros 500 chars): %s", block, html[:500])
+            return self.extract_page(html, with_ficha=False)["descriptions"], fetched and prime
+        except Exception as e:
+            self.log_error(f"Error en el bloque {block} de contiene {url}: {e}")
+            return None, False
+        finally:
+            if slot is not None:
+                self._local.slot = None
 
-            if desc_urls:
-                self.logger.info(f"Encontrados {len(desc_urls)} enlaces de descripción en contiene: {desc_urls}")
-                for desc_url in desc_urls:
-                    # VERIFICAR que no esté ya procesada
-                    if not self.is_done(desc_url):
-                        self.r.rpush("todo_urls", desc_url)
-                        self.redis_logger.debug(f"Añadida URL description desde contiene a Redis: {desc_url}")
-                    else:
-                        self.logger.debug(f"URL description ya procesada, no se añade: {desc_url}")
-            else:
-                self.logger.warning(f"No se encontraron enlaces de descripción en contiene URL: {url}")
+    def process_contiene(self, url):
+        """
+        Recorre el listado de una contiene por bloques (ver contiene_blocks.py).
+
+        Sin ``contiene_page_field`` es un único POST de ``CONTIENE_BLOCK_SIZE``. Con
+        él, los bloques se piden de ``contiene_parallel`` en ``contiene_parallel``, las
+        descripciones de cada uno se encolan en cuanto llega y el progreso queda en
+        ``contiene_blocks:<id>``: si un bloque falla (o repite otro) la contiene se
+        reencola y la siguiente pasada sólo pide los que faltan. Devuelve False si
+        quedan bloques pendientes.
+        """
+        try:
+            self.logger.debug("Procesando URL contiene: %s", url)
+            blocks = ContieneBlocks(url, self.r.hgetall(progress_key(url)), self.contiene_block_size,
+                                    self.contiene_page_field)
+            if blocks.done:
+                self.logger.info(f"Reanudando contiene {url}: {len(blocks.done)} bloques ya hechos")
+
+            slot = getattr(self._local, "slot", None)
+            pushed = 0
+            primed = False
+            while True:
+                window = blocks.next_window(self.contiene_parallel)
+                if not window:
+                    break
+                results = []
+                while window and not primed:
+                    # Hasta que un bloque salga a la red cargando la página contiene (estado
+                    # de sesión) se piden de uno en uno; los servidos de caché no cuentan
+                    block = window.pop(0)
+                    desc_urls, primed = self._fetch_contiene_block(url, blocks, block, True)
+                    results.append((block, desc_urls))
+                futures = {self._block_executor.submit(self._fetch_contiene_block, url, blocks, block, False, slot): block
+                           for block in window}
+                results = itertools.chain(results, ((futures[f], f.result()[0]) for f in as_completed(futures)))
+                for block, desc_urls in results:
+                    fields = blocks.record(block, desc_urls)
+                    if fields is None:
+                        if block in blocks.repeated:
+                            # El servidor ignora el campo de página: no es el fin del listado
+                            self.logger.error("Contiene %s: el bloque %d repite el bloque %d; el servidor no "
+                                              "pagina con '%s'", url, block, blocks.repeated[block],
+                                              self.contiene_page_field)
+                            if self.cache and not self.replay:
+                                self.cache.discard(url, blocks.form(block))
+                        continue
+                    self.metrics.inc("pares_contiene_blocks_total")
+                    if desc_urls:
+                        # Dedup contra seen_urls/done_urls y encolado en un único pipeline
+                        pushed += self.enqueue_urls(desc_urls)
+                    self.r.hset(blocks.key, mapping=fields)
+
+            self.logger.info(f"Contiene {url}: {blocks.found} descripciones en {blocks.blocks} bloques, "
+                             f"{pushed} URLs nuevas encoladas")
+            pipe = self.r.pipeline(transaction=False)
+            outcome = blocks.finish(pipe)
+            pipe.execute()
+            if outcome == "done":
+                if blocks.found == 0:
+                    self.logger.warning(f"No se encontraron enlaces de descripción en contiene URL: {url}")
+                if blocks.truncated:
+                    self.logger.warning(f"Contiene {url}: {blocks.found} descripciones, el listado puede estar "
+                                        f"truncado (sin --contiene-page-field no se pagina); anotada en contiene_truncated")
+                return True
+            if outcome == "failed":
+                self.log_error(f"Contiene {url}: bloques {sorted(blocks.failed)} fallidos tras "
+                               f"{blocks.attempts} intentos")
+                return True
+            self.logger.warning(f"Contiene {url}: bloques {sorted(blocks.failed)} fallidos, se reencola "
+                                f"(intento {blocks.attempts}/{CONTIENE_MAX_ATTEMPTS})")
+            return False
 
         except Exception as e:
             self.log_error(f"Error processing contiene URL {url}: {e}")
+            return True
 
     def process_archive(self):
-        self.logger.info("Iniciando procesamiento del archivo")
-        processed_count = 0
+        self.logger.info(f"Iniciando procesamiento del archivo ({self.contexts} contextos)")
+        self._processed = itertools.count(1)
+        with self._progress_lock:
+            self._progress.clear()
         start_time = time.time()
-        
+
+        self.queue.register()
+        self.queue.reap_expired()
+        try:
+            if self.contexts == 1:
+                processed_count = self._crawl_loop(self.pool.slots[0], start_time)
+            else:
+                # Un hilo de rastreo por contexto; las llamadas a Playwright se serializan
+                # en su hilo y el resto (HTTP, parseo, Redis, imágenes) va en paralelo
+                with ThreadPoolExecutor(max_workers=self.contexts, thread_name_prefix="crawl") as crawlers:
+                    results = [crawlers.submit(self._crawl_loop, slot, start_time) for slot in self.pool.slots]
+                    processed_count = sum(r.result() for r in results)
+        finally:
+            self.queue.unregister()
+
+        self.log_aggregator.flush()
+        if self.metrics_path:
+            # Último volcado para que las ejecuciones cortas también dejen sus métricas
+            self.metrics.dump(self.metrics_path)
+        total_elapsed = time.time() - start_time
+        self.logger.info(f"Procesamiento completado. {processed_count} URLs procesadas en {total_elapsed:.2f}s")
+
+    def _crawl_loop(self, slot, start_time):
+        """Bucle de rastreo de un contexto; devuelve cuántas URLs ha procesado."""
+        self._local.slot = slot
+        processed_count = 0
+        idle_since = None
         while True:
+            if self.stop_event.is_set():
+                self.logger.info(f"[{slot.name}] Parada solicitada, saliendo tras {processed_count} URLs")
+                break
             url = self.get_next_url()
             if not url:
-                self.logger.info("No hay más URLs para procesar")
-                break
+                # Cola vacía: esperamos mientras otros workers puedan generar trabajo
+                if idle_since is None:
+                    idle_since = time.time()
+                idle = time.time() - idle_since
+                if self.queue.is_drained() and idle >= self.idle_timeout:
+                    self.logger.info(f"[{slot.name}] No hay más URLs para procesar")
+                    break
+                self.logger.debug(f"[{slot.name}] Cola vacía, esperando trabajo ({idle:.0f}s inactivo)")
+                continue
+            idle_since = None
 
             if self.is_done(url):
-                self.logger.debug(f"URL ya procesada, saltando: {url}")
-                print(f"Skipping processed URL: {url}")
+                self._log_hot(self.logger, logging.DEBUG, "urls_ya_hechas", "URL ya procesada, saltando: %s", url)
+                self._count_progress("saltadas")
+                self.mark_as_done(url)
                 continue
 
-            self.logger.info(f"Procesando URL #{processed_count + 1}: {url}")
-            
-            url_start_time = time.time()
-            
-            if "description/" in url:
-                self.process_description(url)
-            elif "contiene/" in url:
-                self.process_contiene(url)
-            elif "catalogo/find" in url:
-                self.process_find(url)
-            else:
-                self.logger.warning(f"Tipo de URL no reconocido: {url}")
-            
-            url_elapsed = time.time() - url_start_time
-            self.mark_as_done(url)
             processed_count += 1
-            
-            self.logger.info(f"URL procesada en {url_elapsed:.2f}s. Total procesadas: {processed_count}")
-            
-            # Log de progreso cada 10 URLs
-            if processed_count % 10 == 0:
-                total_elapsed = time.time() - start_time
-                avg_time_per_url = total_elapsed / processed_count
-                self.logger.info(f"Progreso: {processed_count} URLs procesadas en {total_elapsed:.2f}s (Promedio: {avg_time_per_url:.2f}s/URL)")
-        
-        total_elapsed = time.time() - start_time
-        self.logger.info(f"Procesamiento completado. {processed_count} URLs procesadas en {total_elapsed:.2f}s")
+            self._process_url(url, next(self._processed), start_time)
+        return processed_count
+
+    def _process_url(self, url, processed_count, start_time):
+        self._log_hot(self.logger, logging.INFO, "urls_procesadas", "Procesando URL #%d: %s", processed_count, url)
+
+        url_start_time = time.time()
+
+        complete = True
+        if "description/" in url:
+            self.process_description(url)
+        elif "contiene/" in url:
+            complete = self.process_contiene(url)
+        elif "catalogo/find" in url:
+            self.process_find(url)
+        else:
+            self.logger.warning(f"Tipo de URL no reconocido: {url}")
+
+        url_elapsed = time.time() - url_start_time
+        if complete:
+            self.mark_as_done(url)
+        else:
+            # Contiene con bloques pendientes: vuelve al final de su nivel sin marcarse como hecha
+            self.queue.retry(url)
+        self.metrics.inc("pares_urls_processed_total")
+
+        self._log_hot(self.logger, logging.INFO, "urls_terminadas",
+                      "URL procesada en %.2fs. Total procesadas: %d", url_elapsed, processed_count)
+
+        # Log de progreso cada 10 URLs, con los totales de lo encontrado por el camino
+        if processed_count % 10 == 0:
+            total_elapsed = time.time() - start_time
+            with self._progress_lock:
+                totals = ", ".join(f"{k}={v}" for k, v in sorted(self._progress.items()))
+            self.logger.info("Progreso: %d URLs procesadas en %.2fs (Promedio: %.2fs/URL) %s",
+                             processed_count, total_elapsed, total_elapsed / processed_count, totals)
+
+    def _count_progress(self, key, n=1):
+        """Suma ``n`` al total ``key`` que se publica con el log de progreso."""
+        with self._progress_lock:
+            self._progress[key] += n
 
     def __del__(self):
         self.logger.info("Destruyendo instancia de ParesFileScraper")
@@ -774,14 +1040,44 @@ class ParesFileScraper:
     def __del__(self):
         """Cerrar limpio de Playwright al destruir la instancia."""
         self.logger.info("[CLEANUP] Cerrando Playwright…")
-        for obj in (self._page, self._context, self._browser):
-            try: obj.close()
-            except: pass
+        try: self.store.close()
+        except: pass
         try:
+            if self.sqlite:
+                self.sqlite.close()
+        except: pass
+        try: self.tor.stop()
+        except: pass
+        try: self.metrics.stop()
+        except: pass
+
+        def shutdown():
+            if self.pool:
+                self.pool.close()
             self._pw.stop()
+        try:
+            self._on_browser(shutdown)
+        except: pass
+        try:
+            self._browser_executor.shutdown(wait=False)
+        except: pass
+        try:
+            self._block_executor.shutdown(wait=False)
         except: pass
 
-def initialize_redis(todo_file):
+def initialize_redis(todo_file, frontier="priority", merge=False, chunk_size=10000):
+    """
+    Carga las semillas de ``todo_file`` en el frontier.
+
+    El fichero se lee en lotes de ``chunk_size`` líneas y cada lote se deduplica y
+    encola en dos idas y vueltas. Además de URLs admite rangos de ids
+    (``description:1000-250000``, ``contiene:5-10``), que sólo se registran y se
+    expanden por tramos cuando el frontier se vacía (ver ``RedisWorkQueue.refill``).
+
+    Con el frontier vacío se encolan las semillas no hechas aunque ya se hubieran
+    visto. Si no está vacío el fichero se ignora, salvo con ``merge=True``: entonces
+    sólo se añaden las semillas que nunca se han visto.
+    """
     # Configurar logger para la función de inicialización
     logger = logging.getLogger('ParesFileScraper.Redis.Init')
     logger.setLevel(logging.INFO)
@@ -791,38 +1087,77 @@ def initialize_redis(todo_file):
         handler.setFormatter(formatter)
         logger.addHandler(handler)
     logger.info(f"Inicializando Redis con archivo: {todo_file}")
-    r = redis.StrictRedis(host='localhost', port=6379, db=0)
-    # Verifica si la lista 'todo_urls' ya tiene elementos
-    current_count = r.llen("todo_urls")
-    if current_count > 0:
-        logger.info(f"Redis 'todo_urls' ya contiene {current_count} elementos. Ignorando el archivo.")
+    r = redis_client()
+    queue = RedisWorkQueue(r, frontier=frontier)
+    # Verifica si el frontier (todo_urls, sus niveles de prioridad y rangos) ya tiene elementos
+    current_count = queue.pending()
+    if current_count > 0 and not merge:
+        logger.info(f"Redis 'todo_urls' ya contiene {current_count} elementos. Ignorando el archivo "
+                    f"(--seed-merge para añadirlo).")
         print("Redis 'todo_urls' ya contiene datos. Ignorando el archivo.")
         return
-    # Añade URLs del archivo si 'todo_urls' está vacío
-    added_count = 0
-    skipped_count = 0
+    # Marcas de esta carga para no encolar dos veces una semilla repetida en otro lote
+    load_key = f"seed_load:{os.getpid()}"
+    added_count = skipped_count = ranges = 0
+    start = time.time()
+
+    def flush(batch):
+        if merge:
+            # Frontier en marcha: sólo lo nunca visto (el script también descarta lo hecho)
+            added = queue.enqueue_many(batch)
+            return added, len(batch) - added
+        return queue.seed(batch, load_key=load_key)
+
     try:
+        batch = []
         with open(todo_file, "r") as f:
-            for line_num, line in enumerate(f, 1):
-                url = line.strip()
-                if url:  # Solo procesar líneas no vacías
-                    if not r.sismember("done_urls", url):  # Verifica que no esté procesada
-                        r.rpush("todo_urls", url)
-                        added_count += 1
-                        logger.debug(f"Añadida URL línea {line_num}: {url}")
-                    else:
-                        skipped_count += 1
-                        logger.debug(f"URL ya procesada, saltando línea {line_num}: {url}")
-        logger.info(f"Carga completada: {added_count} URLs añadidas, {skipped_count} saltadas")
-        print("URLs cargadas en Redis desde 'todo_urls.txt'.")
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                match = SEED_RANGE_RE.match(line)
+                if match:
+                    start_id = int(match.group("start"))
+                    end_id = int(match.group("end") or start_id)
+                    if queue.add_range(match.group("kind"), start_id, end_id):
+                        ranges += 1
+                    continue
+                batch.append(line)
+                if len(batch) >= chunk_size:
+                    added, skipped = flush(batch)
+                    added_count += added
+                    skipped_count += skipped
+                    batch = []
+        if batch:
+            added, skipped = flush(batch)
+            added_count += added
+            skipped_count += skipped
+        logger.info(f"Carga completada en {time.time() - start:.2f}s: {added_count} URLs añadidas, "
+                    f"{skipped_count} saltadas, {ranges} rangos de ids registrados "
+                    f"({queue.ranges_remaining()} ids por expandir)")
+        print(f"URLs cargadas en Redis desde '{todo_file}'.")
     except FileNotFoundError:
         logger.error(f"Archivo no encontrado: {todo_file}")
         print(f"Error: No se encontró el archivo {todo_file}")
     except Exception as e:
         logger.error(f"Error cargando URLs desde archivo: {e}")
         print(f"Error cargando URLs: {e}")
+    finally:
+        for key in r.scan_iter(f"{load_key}:*"):
+            r.delete(key)
+
+def run_scraper(skip_download=False, tor_disable=False, reliable_queue=False, idle_timeout=30,
+                image_concurrency=4, image_global_concurrency=8, fetch_mode="browser", contexts=1,
+                circuit_mode="auth", socks_ports=(9050,), parser="auto",
+                log_mode="verbose", metrics_port=0, metrics_dir=None,
+                html_rate=0.5, html_max_rate=4.0, image_rate=4.0, image_max_rate=16.0,
+                cache_dir=None, cache_ttl=DEFAULT_TTL, replay=False, base_url="https://pares.mcu.es",
+                frontier="priority", image_mode="inline", sqlite_path=None, contiene_block_size=CONTIENE_BLOCK_SIZE,
+                contiene_parallel=4, contiene_page_field=None):
+    # SIGTERM (supervisor o kill): terminar la URL en curso y salir limpiamente
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
 
-def run_scraper(skip_download=False, tor_disable=False):
     # Configurar logger para la función principal
     logger = logging.getLogger('ParesFileScraper.Main')
     logger.setLevel(logging.INFO)
@@ -837,7 +1172,21 @@ def run_scraper(skip_download=False, tor_disable=False):
     start_time = time.time()
     
     try:
-        scraper = ParesFileScraper(skip_download=skip_download, use_tor=not tor_disable)
+        scraper = ParesFileScraper(base_url=base_url, skip_download=skip_download, use_tor=not tor_disable,
+                                   reliable_queue=reliable_queue, idle_timeout=idle_timeout,
+                                   image_concurrency=image_concurrency,
+                                   image_global_concurrency=image_global_concurrency,
+                                   fetch_mode=fetch_mode, contexts=contexts,
+                                   circuit_mode=circuit_mode, socks_ports=socks_ports,
+                                   parser=parser, log_mode=log_mode,
+                                   metrics_port=metrics_port, metrics_dir=metrics_dir,
+                                   html_rate=html_rate, html_max_rate=html_max_rate,
+                                   image_rate=image_rate, image_max_rate=image_max_rate,
+                                   cache_dir=cache_dir, cache_ttl=cache_ttl, replay=replay,
+                                   stop_event=stop_event, frontier=frontier, image_mode=image_mode,
+                                   sqlite_path=sqlite_path, contiene_block_size=contiene_block_size,
+                                   contiene_parallel=contiene_parallel,
+                                   contiene_page_field=contiene_page_field)
         logger.info("Scraper inicializado exitosamente")
         scraper.process_archive()
         
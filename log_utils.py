@@ -0,0 +1,74 @@
+# log_utils.py
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+
+def attach_queue_listener(logger):
+    """
+    Mueve los handlers de ``logger`` a un hilo ``QueueListener``.
+
+    El hilo de rastreo sólo encola el ``LogRecord``; el formateo y la escritura
+    en los ``RotatingFileHandler`` ocurren fuera del camino crítico. Cada
+    handler conserva su nivel (``respect_handler_level``).
+    """
+    handlers = [h for h in logger.handlers if not isinstance(h, QueueHandler)]
+    if not handlers:
+        return None
+    log_queue = queue.SimpleQueue()
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+class LogAggregator:
+    """
+    Sustituye la charla por URL por contadores que se vuelcan de vez en cuando.
+
+    ``count("clave")`` es una suma en memoria; cada ``interval`` segundos (o al
+    llamar a :meth:`flush`) se emite un único registro con los totales.
+    """
+
+    def __init__(self, logger, interval=60, level=logging.INFO):
+        self.logger = logger
+        self.interval = interval
+        self.level = level
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def count(self, key, n=1):
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + n
+            due = time.monotonic() - self._last_flush >= self.interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            elapsed = time.monotonic() - self._last_flush
+            self._last_flush = time.monotonic()
+        if counts and self.logger.isEnabledFor(self.level):
+            summary = ", ".join(f"{k}={v}" for k, v in sorted(counts.items()))
+            self.logger.log(self.level, "Resumen últimos %.0fs: %s", elapsed, summary)
+
+
+class LogSampler:
+    """Deja pasar 1 de cada ``every`` eventos de una clave (p. ej. volcados de HTML)."""
+
+    def __init__(self, every=100):
+        self.every = max(1, every)
+        self._seen = {}
+
+    def should_log(self, key):
+        n = self._seen.get(key, 0)
+        self._seen[key] = n + 1
+        return n % self.every == 0
@@ -0,0 +1,175 @@
+# metrics.py
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HELP = {
+    "pares_stage_seconds": "Duración de cada etapa (fetch, parse, enqueue, persist, image_download, rotation, rate_wait)",
+    "pares_urls_processed_total": "URLs procesadas",
+    "pares_retries_total": "Reintentos de peticiones de páginas",
+    "pares_tor_fallbacks_total": "Peticiones repetidas sin Tor (fallback directo)",
+    "pares_browser_fallbacks_total": "Peticiones HTTP que tuvieron que repetirse con el navegador",
+    "pares_rotations_total": "Rotaciones de sesión/contexto",
+    "pares_failed_images_total": "Imágenes no descargadas tras todos los reintentos",
+    "pares_images_downloaded_total": "Imágenes descargadas",
+    "pares_image_bytes_total": "Bytes de imágenes descargados",
+    "pares_cache_hits_total": "Páginas servidas desde la caché de respuestas",
+    "pares_cache_misses_total": "Páginas que no estaban (o habían caducado) en la caché",
+    "pares_queue_todo": "URLs pendientes en el frontier (todas las prioridades)",
+    "pares_queue_done": "URLs hechas (bitmaps done_ids:* + done_urls)",
+    "pares_contiene_blocks_total": "Bloques de listados contiene descargados",
+    "pares_urls_in_flight": "URLs en vuelo en un worker del motor asyncio",
+    "pares_image_jobs_pending": "Unidades pendientes en la cola de imágenes (image_jobs)",
+}
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Metrics:
+    """
+    Métricas del scraper en formato de texto de Prometheus, sin dependencias.
+
+    Todas las series llevan la etiqueta ``pid`` del worker. Se pueden exponer
+    en ``http://127.0.0.1:<port>/metrics`` (:meth:`serve`) o volcar cada
+    ``interval`` segundos a un fichero ``.prom`` (:meth:`start_file_dump`,
+    compatible con el textfile collector de node_exporter).
+    """
+
+    def __init__(self, pid=None):
+        self.pid = str(pid or os.getpid())
+        self.logger = logging.getLogger('ParesFileScraper')
+        self._lock = threading.Lock()
+        self._histograms = {}   # (name, stage) -> Histogram
+        self._counters = {}     # name -> valor
+        self._gauges = {}       # name -> callable
+        self._server = None
+        self._stop_event = threading.Event()
+
+    # --- Registro ----------------------------------------------------------------
+
+    def observe(self, stage, seconds, name="pares_stage_seconds"):
+        with self._lock:
+            hist = self._histograms.get((name, stage))
+            if hist is None:
+                hist = self._histograms[(name, stage)] = Histogram()
+            hist.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - start)
+
+    def inc(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def gauge(self, name, fn):
+        """Registra un gauge calculado al exportar (p. ej. ``llen todo_urls``)."""
+        self._gauges[name] = fn
+
+    # --- Exportación -------------------------------------------------------------
+
+    def render(self):
+        pid = self.pid
+        lines = []
+        with self._lock:
+            histograms = {k: (list(h.counts), h.sum, h.count, h.buckets) for k, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        names = sorted({name for name, _ in histograms})
+        for name in names:
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for (hname, stage), (counts, total, count, buckets) in sorted(histograms.items()):
+                if hname != name:
+                    continue
+                labels = f'pid="{pid}",stage="{stage}"'
+                for bound, c in zip(buckets, counts):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {c}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {total:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {count}")
+
+        for name, value in sorted(counters.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f'{name}{{pid="{pid}"}} {value}')
+
+        for name, fn in sorted(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception as e:
+                self.logger.debug(f"[METRICS] Gauge {name} no disponible: {e}")
+                continue
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f'{name}{{pid="{pid}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.logger.info(f"[METRICS] Exportando métricas en http://{host}:{port}/metrics")
+
+    def dump(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def start_file_dump(self, directory, interval=15):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"pares_{self.pid}.prom")
+
+        def loop():
+            while not self._stop_event.wait(interval):
+                try:
+                    self.dump(path)
+                except Exception as e:
+                    self.logger.error(f"[METRICS] Error volcando métricas en {path}: {e}")
+        threading.Thread(target=loop, daemon=True).start()
+        self.logger.info(f"[METRICS] Volcando métricas cada {interval}s en {path}")
+        return path
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server:
+            self._server.shutdown()
@@ -0,0 +1,133 @@
+# pares_parser.py
+import re
+import logging
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger('ParesFileScraper.Parser')
+
+try:
+    import lxml  # noqa: F401
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+CONTIENE_RE = re.compile(r'/contiene/\d+')
+DESCRIPTION_RE = re.compile(r'description/\d+')
+SHOW_RE = re.compile(r'/show/\d+')
+SCRIPT_DESCRIPTION_RE = re.compile(r'description[/\\](\d+)')
+DBCODE_RE = re.compile(
+    r'VisorController.do?.*txt_id_imagen=(\d*)&txt_rotar=0&txt_contraste=0&appOrigen=&dbCode=(\d*)'
+)
+_SPACES_RE = re.compile(r'\s+')
+_DIGITS_RE = re.compile(r'(\d+)')
+
+
+def resolve_parser(name="auto"):
+    """Devuelve el backend de BeautifulSoup a usar: lxml si está instalado, si no html.parser."""
+    if name == "auto":
+        return "lxml" if HAS_LXML else "html.parser"
+    if name == "lxml" and not HAS_LXML:
+        logger.warning("lxml no está instalado, usando html.parser")
+        return "html.parser"
+    return name
+
+
+def sanitizar_texto(texto):
+    """
+    Sanitiza un texto eliminando caracteres innecesarios como saltos de línea,
+    tabulaciones y espacios extra. También separa números y palabras si están juntos.
+    """
+    # 1. Eliminar caracteres de espacio, saltos de línea y tabulaciones innecesarias
+    texto_limpio = _SPACES_RE.sub(' ', texto).strip()
+    # 2. Separar palabras y números si están juntos
+    return _DIGITS_RE.sub(r' \1 ', texto_limpio).strip()
+
+
+def parse_ficha(soup):
+    """Extrae los campos de ``#wrapper_ficha .area .info`` (h4.aviso -> primer <p>)."""
+    data = {}
+    wrapper = soup.find(id="wrapper_ficha")
+    if not wrapper:
+        return data
+    area = wrapper.find(class_="area")
+    if not area:
+        return data
+
+    for info in area.find_all(class_="info"):
+        title_element = info.find('h4', class_='aviso')
+        if not title_element:
+            continue
+        value_element = info.find('p')
+        if not value_element:
+            continue
+        title = title_element.get_text(strip=True).rstrip(':')
+        value = sanitizar_texto(''.join(value_element.stripped_strings))
+        link = value_element.find('a')
+        if link:
+            data[title] = {'texto': value, 'link': link['href']}
+        else:
+            data[title] = value
+    return data
+
+
+def extract_page(html, base_url, parser="auto", with_ficha=True):
+    """
+    Extrae en una sola pasada todo lo que el scraper necesita de una página.
+
+    Devuelve un dict con:
+      - ``contiene``: URLs ``/contiene/<id>`` en orden de aparición.
+      - ``descriptions``: URLs ``description/<id>`` únicas, de los enlaces y de
+        los ``<script>`` embebidos.
+      - ``show``: primera URL ``/show/<id>`` o None.
+      - ``ficha``: campos de la ficha (sólo si ``with_ficha``).
+      - ``links``: número total de enlaces ``<a>``.
+    """
+    soup = BeautifulSoup(html, resolve_parser(parser))
+    contiene, descriptions, show = [], [], None
+    seen_desc = set()
+    links = 0
+
+    def add_description(desc_url):
+        if desc_url not in seen_desc:
+            seen_desc.add(desc_url)
+            descriptions.append(desc_url)
+
+    # Un solo recorrido del árbol para enlaces y scripts
+    for tag in soup.find_all(["a", "script"]):
+        if tag.name == "a":
+            links += 1
+            href = tag.get("href")
+            if not href:
+                continue
+            if CONTIENE_RE.search(href):
+                contiene.append(urljoin(base_url, href))
+            elif DESCRIPTION_RE.search(href):
+                add_description(urljoin(base_url, href))
+            elif show is None and SHOW_RE.search(href):
+                show = urljoin(base_url, href)
+        else:
+            script_content = tag.string or tag.get_text()
+            if 'description' not in script_content.lower():
+                continue
+            for desc_id in SCRIPT_DESCRIPTION_RE.findall(script_content):
+                add_description(f"{base_url}/ParesBusquedas20/catalogo/description/{desc_id}")
+
+    return {
+        "contiene": contiene,
+        "descriptions": descriptions,
+        "show": show,
+        "ficha": parse_ficha(soup) if with_ficha else {},
+        "links": links,
+    }
+
+
+def extract_image_links(show_html, base_url="https://pares.mcu.es"):
+    """Genera los enlaces ``ViewImage.do`` de descarga a partir del HTML del visor ``show``."""
+    return [
+        f"{base_url}/ParesBusquedas20/ViewImage.do?accion=42"
+        f"&txt_zoom=10&txt_contraste=0&txt_polarizado=&txt_brillo=10.0"
+        f"&txt_contrast=1.0&txt_transformacion=-1&txt_descarga=1"
+        f"&dbCode={dbcode[1]}&txt_id_imagen={dbcode[0]}"
+        for dbcode in DBCODE_RE.findall(show_html)
+    ]
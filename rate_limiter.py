@@ -0,0 +1,120 @@
+# rate_limiter.py
+import re
+import time
+import logging
+
+# Token bucket compartido: KEYS[1] = hash {tokens, ts}, KEYS[2] = tasa actual (req/s)
+# ARGV = tasa inicial, ráfaga máxima. Devuelve 0 si hay ficha o los ms a esperar.
+ACQUIRE_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local rate = tonumber(redis.call('GET', KEYS[2]) or ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], 3600)
+return wait
+"""
+
+# AIMD sobre la tasa compartida: KEYS[1] = tasa, KEYS[2] = marca de la última reducción
+# ARGV = ok, tasa inicial, mínima, máxima, incremento, factor, cooldown (ms)
+FEEDBACK_SCRIPT = """
+local rate = tonumber(redis.call('GET', KEYS[1]) or ARGV[2])
+local min_rate, max_rate = tonumber(ARGV[3]), tonumber(ARGV[4])
+if ARGV[1] == '1' then
+    rate = math.min(max_rate, rate + tonumber(ARGV[5]) / math.max(rate, 1))
+elseif redis.call('SET', KEYS[2], '1', 'NX', 'PX', ARGV[7]) then
+    rate = math.max(min_rate, rate * tonumber(ARGV[6]))
+end
+redis.call('SET', KEYS[1], tostring(rate))
+return tostring(rate)
+"""
+
+# 429, 5xx y timeouts indican que el servidor (o Tor) va saturado
+THROTTLE_RE = re.compile(r'\b(429|5\d\d)\b|timeout|timed out', re.IGNORECASE)
+
+
+def is_throttle_error(error):
+    """Cierto si el error (excepción o mensaje) es una señal de sobrecarga."""
+    return bool(THROTTLE_RE.search(str(error)))
+
+
+class RedisRateLimiter:
+    """
+    Token bucket compartido por todos los procesos a través de Redis.
+
+    La tasa ``rate`` (peticiones/s para todo el clúster) se adapta con AIMD:
+    cada éxito la sube aditivamente hasta ``max_rate`` y cada 429/5xx/timeout
+    la multiplica por ``decrease`` (como mucho una vez cada ``cooldown``
+    segundos, para que una ráfaga de errores de varios workers no la hunda).
+    Añadir workers reparte el mismo presupuesto en lugar de multiplicar la carga.
+
+    Claves: ``ratelimit:<name>`` (fichas), ``ratelimit:<name>:rate`` (tasa) y
+    ``ratelimit:<name>:backoff`` (cooldown de la última reducción).
+    """
+
+    def __init__(self, r, name, rate, max_rate, min_rate=None, burst=None,
+                 increase=0.05, decrease=0.5, cooldown=10):
+        self.r = r
+        self.name = name
+        self.initial_rate = rate
+        self.max_rate = max(rate, max_rate)
+        self.min_rate = min_rate if min_rate is not None else min(rate, 0.05)
+        self.burst = burst or max(1, int(round(rate)))
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown_ms = int(cooldown * 1000)
+        self.bucket_key = f"ratelimit:{name}"
+        self.rate_key = f"ratelimit:{name}:rate"
+        self.backoff_key = f"ratelimit:{name}:backoff"
+        self.logger = logging.getLogger('ParesFileScraper')
+        self._acquire = r.register_script(ACQUIRE_SCRIPT)
+        self._feedback = r.register_script(FEEDBACK_SCRIPT)
+
+    def try_acquire(self):
+        """Toma una ficha si hay; si no, devuelve los ms a esperar (0 = ficha obtenida)."""
+        return int(self._acquire(keys=[self.bucket_key, self.rate_key], args=[self.initial_rate, self.burst]))
+
+    def acquire(self, max_wait=None):
+        """Bloquea hasta obtener una ficha; devuelve los segundos esperados."""
+        start = time.monotonic()
+        while True:
+            wait_ms = self.try_acquire()
+            if not wait_ms:
+                return time.monotonic() - start
+            waited = time.monotonic() - start
+            if max_wait is not None and waited >= max_wait:
+                return waited
+            time.sleep(min(int(wait_ms) / 1000, 5))
+
+    def feedback(self, ok):
+        """Ajusta la tasa compartida tras una petición; devuelve la tasa nueva."""
+        rate = float(self._feedback(
+            keys=[self.rate_key, self.backoff_key],
+            args=["1" if ok else "0", self.initial_rate, self.min_rate, self.max_rate,
+                  self.increase, self.decrease, self.cooldown_ms],
+        ))
+        if not ok:
+            self.logger.debug(f"[RATE] {self.name}: sobrecarga, tasa global {rate:.2f} req/s")
+        return rate
+
+    def report(self, error=None):
+        """``feedback`` a partir de un error: sólo 429/5xx/timeouts reducen la tasa."""
+        if error is None:
+            return self.feedback(True)
+        if is_throttle_error(error):
+            return self.feedback(False)
+        return None
+
+    def current_rate(self):
+        return float(self.r.get(self.rate_key) or self.initial_rate)
@@ -0,0 +1,80 @@
+# response_cache.py
+import os
+import json
+import gzip
+import time
+import hashlib
+import logging
+import threading
+from urllib.parse import urlencode
+
+# Una semana: pasado ese tiempo una página se vuelve a pedir
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+class ResponseCache:
+    """
+    Caché en disco de las respuestas HTML, comprimidas con gzip.
+
+    La clave es la URL más el cuerpo del POST (el ``SearchController.do`` de
+    las páginas contiene devuelve cosas distintas según el formulario). Cada
+    entrada guarda la hora de descarga; con ``ttl`` (segundos) las entradas
+    más antiguas se consideran caducadas y se vuelven a pedir (por defecto
+    ``DEFAULT_TTL``). ``ttl=None`` no caduca nunca; el modo replay lee con
+    ``ignore_ttl`` y aprovecha todo lo guardado.
+
+    Estructura: ``<directory>/<2 hex>/<sha256>.json.gz``. Las escrituras son
+    atómicas (fichero temporal + ``os.replace``), así que varios procesos
+    pueden compartir el directorio.
+    """
+
+    def __init__(self, directory="cache", ttl=DEFAULT_TTL, compresslevel=6):
+        self.directory = directory
+        self.ttl = ttl or None
+        self.compresslevel = compresslevel
+        self.logger = logging.getLogger('ParesFileScraper')
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(url, body=None):
+        if isinstance(body, dict):
+            body = urlencode(sorted(body.items()))
+        raw = url if not body else f"{url}\n{body}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def get(self, url, body=None, ignore_ttl=False):
+        """Devuelve el HTML guardado o None si no está o ha caducado."""
+        path = self._path(self.key(url, body))
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"[CACHE] Entrada corrupta para {url}: {e}")
+            return None
+        if not ignore_ttl and self.ttl and time.time() - entry.get("fetched_at", 0) > self.ttl:
+            return None
+        return entry["html"]
+
+    def put(self, url, html, body=None):
+        key = self.key(url, body)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if isinstance(body, dict):
+            body = urlencode(sorted(body.items()))
+        entry = {"url": url, "body": body, "fetched_at": time.time(), "html": html}
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=self.compresslevel) as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def discard(self, url, body=None):
+        """Borra la entrada de ``url`` (p. ej. una respuesta que resultó no ser válida)."""
+        try:
+            os.remove(self._path(self.key(url, body)))
+        except FileNotFoundError:
+            pass
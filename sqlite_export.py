@@ -0,0 +1,245 @@
+# sqlite_export.py
+"""
+Exportación incremental de las fichas a SQLite.
+
+Tablas:
+
+    units         una fila por unidad: título, nivel, fechas (texto y años), código,
+                  URL, imágenes y hash del registro
+    fields        ``additional_data`` normalizado: (page_id, key, name, value)
+    image_links   enlaces de descarga de cada unidad
+    units_fts     índice de texto completo (FTS5) sobre título y campos saneados;
+                  su rowid es el de la unidad en ``units``
+
+Hay índices por nivel, año inicial/final, código de referencia y
+``fields(key, value)``. Cada unidad guarda el hash de su registro, así que
+una reexportación sólo escribe las unidades nuevas o cambiadas.
+
+    python3 sqlite_export.py                         # pares.sqlite desde description_data.json y segmentos
+    python3 sqlite_export.py --db pares.sqlite --full
+    sqlite3 pares.sqlite "SELECT page_id, title FROM units_fts WHERE units_fts MATCH 'carta NEAR sevilla'"
+
+Con ``controller.py --sqlite pares.sqlite`` cada worker escribe además sus
+fichas al vuelo (:class:`SqliteSink`).
+"""
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+import unicodedata
+from description_store import DescriptionStore
+from pares_parser import sanitizar_texto
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    page_id        TEXT PRIMARY KEY,
+    url            TEXT,
+    title          TEXT,
+    level          TEXT,
+    date_text      TEXT,
+    year_start     INTEGER,
+    year_end       INTEGER,
+    reference_code TEXT,
+    signatura      TEXT,
+    has_image      INTEGER NOT NULL DEFAULT 0,
+    image_count    INTEGER NOT NULL DEFAULT 0,
+    record_hash    TEXT NOT NULL,
+    updated_at     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS units_level ON units(level);
+CREATE INDEX IF NOT EXISTS units_year_start ON units(year_start);
+CREATE INDEX IF NOT EXISTS units_year_end ON units(year_end);
+CREATE INDEX IF NOT EXISTS units_reference_code ON units(reference_code);
+
+CREATE TABLE IF NOT EXISTS fields (
+    page_id TEXT NOT NULL REFERENCES units(page_id) ON DELETE CASCADE,
+    key     TEXT NOT NULL,
+    name    TEXT NOT NULL,
+    value   TEXT,
+    PRIMARY KEY (page_id, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS fields_key_value ON fields(key, value);
+
+CREATE TABLE IF NOT EXISTS image_links (
+    page_id TEXT NOT NULL REFERENCES units(page_id) ON DELETE CASCADE,
+    idx     INTEGER NOT NULL,
+    url     TEXT NOT NULL,
+    PRIMARY KEY (page_id, idx)
+) WITHOUT ROWID;
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS units_fts USING fts5(
+    page_id UNINDEXED, title, body, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+_YEAR_RE = re.compile(r'\b(1\d{3}|20\d{2})\b')
+_KEY_RE = re.compile(r'[^a-z0-9]+')
+
+
+def field_key(name):
+    """``"Level of description"`` -> ``"level_of_description"`` (sin tildes)."""
+    ascii_name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    return _KEY_RE.sub('_', ascii_name.lower()).strip('_')
+
+
+def record_hash(record):
+    return hashlib.sha1(json.dumps(record, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def year_range(date_text):
+    """Años extremos de un texto de fecha de Pares (``"1520-03-15 - 1530"`` -> ``(1520, 1530)``)."""
+    years = [int(y) for y in _YEAR_RE.findall(date_text or "")]
+    return (min(years), max(years)) if years else (None, None)
+
+
+class SqliteExporter:
+    """
+    Escribe fichas en la base ``path`` por lotes de ``batch`` unidades por transacción.
+
+    La base va en modo WAL para que varios procesos (workers con :class:`SqliteSink`
+    y lectores) puedan usarla a la vez. Si el SQLite de Python no tiene FTS5 se
+    exporta todo menos ``units_fts``.
+    """
+
+    def __init__(self, path="pares.sqlite", batch=500):
+        self.path = path
+        self.batch = batch
+        self.logger = logging.getLogger('ParesFileScraper.Store')
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        try:
+            self.conn.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError as e:
+            self.fts = False
+            self.logger.warning(f"[SQLITE] FTS5 no disponible ({e}): se exporta sin índice de texto")
+        self._lock = threading.Lock()
+        self._hashes = None
+
+    def _known_hashes(self):
+        if self._hashes is None:
+            self._hashes = dict(self.conn.execute("SELECT page_id, record_hash FROM units"))
+        return self._hashes
+
+    def _write(self, page_id, record, digest):
+        data = record.get("additional_data") or {}
+        date_text = data.get("Date of creation")
+        year_start, year_end = year_range(date_text)
+        title = data.get("Supplied Title") or data.get("Formal Title")
+        links = record.get("image_links") or []
+        cur = self.conn.cursor()
+        # UPSERT conserva el rowid de la unidad, que es también el de su fila en units_fts
+        cur.execute(
+            "INSERT INTO units (page_id, url, title, level, date_text, year_start, year_end, reference_code,"
+            " signatura, has_image, image_count, record_hash, updated_at) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)"
+            " ON CONFLICT(page_id) DO UPDATE SET url=excluded.url, title=excluded.title, level=excluded.level,"
+            " date_text=excluded.date_text, year_start=excluded.year_start, year_end=excluded.year_end,"
+            " reference_code=excluded.reference_code, signatura=excluded.signatura, has_image=excluded.has_image,"
+            " image_count=excluded.image_count, record_hash=excluded.record_hash, updated_at=excluded.updated_at",
+            (page_id, record.get("url"), title, data.get("Level of description"), date_text, year_start, year_end,
+             data.get("Reference code"), data.get("Reference number"), int(bool(record.get("has_image"))),
+             len(links), digest, time.time()),
+        )
+        rowid = cur.execute("SELECT rowid FROM units WHERE page_id = ?", (page_id,)).fetchone()[0]
+        cur.execute("DELETE FROM fields WHERE page_id = ?", (page_id,))
+        cur.execute("DELETE FROM image_links WHERE page_id = ?", (page_id,))
+        fields = {}
+        for name, value in data.items():
+            if not isinstance(value, str):
+                value = json.dumps(value, ensure_ascii=False)
+            fields[field_key(name) or name] = (name, value)
+        cur.executemany("INSERT INTO fields (page_id, key, name, value) VALUES (?,?,?,?)",
+                        [(page_id, key, name, value) for key, (name, value) in fields.items()])
+        cur.executemany("INSERT INTO image_links (page_id, idx, url) VALUES (?,?,?)",
+                        [(page_id, idx, url) for idx, url in enumerate(links, start=1)])
+        if self.fts:
+            cur.execute("DELETE FROM units_fts WHERE rowid = ?", (rowid,))
+            body = " ".join(sanitizar_texto(value) for _, value in fields.values())
+            cur.execute("INSERT INTO units_fts (rowid, page_id, title, body) VALUES (?,?,?,?)",
+                        (rowid, page_id, sanitizar_texto(title or ""), body))
+
+    def upsert(self, page_id, record, commit=True):
+        """Escribe una ficha si es nueva o ha cambiado; devuelve True si se ha escrito."""
+        page_id = str(page_id)
+        digest = record_hash(record)
+        with self._lock:
+            hashes = self._known_hashes()
+            if hashes.get(page_id) == digest:
+                return False
+            self._write(page_id, record, digest)
+            hashes[page_id] = digest
+            if commit:
+                self.conn.commit()
+        return True
+
+    def export(self, records):
+        """
+        Exporta un iterable de ``(page_id, ficha)``; devuelve ``(escritas, sin_cambios)``.
+
+        Se hace commit cada ``batch`` fichas escritas, así que una exportación
+        interrumpida conserva lo ya escrito y la siguiente sigue donde se quedó.
+        """
+        start = time.time()
+        written = unchanged = 0
+        pending = 0
+        for page_id, record in records:
+            if self.upsert(page_id, record, commit=False):
+                written += 1
+                pending += 1
+                if pending >= self.batch:
+                    with self._lock:
+                        self.conn.commit()
+                    pending = 0
+            else:
+                unchanged += 1
+        with self._lock:
+            self.conn.commit()
+        self.logger.info(f"[SQLITE] {written} fichas escritas, {unchanged} sin cambios en {self.path} "
+                         f"({time.time() - start:.2f}s)")
+        return written, unchanged
+
+    def clear(self):
+        with self._lock:
+            # fields e image_links se borran en cascada
+            self.conn.execute("DELETE FROM units")
+            if self.fts:
+                self.conn.execute("DELETE FROM units_fts")
+            self.conn.commit()
+            self._hashes = {}
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class SqliteSink(SqliteExporter):
+    """Escritura al vuelo desde ``process_description``: una transacción por ficha."""
+
+    def __init__(self, path="pares.sqlite"):
+        super().__init__(path, batch=1)
+        # Otros workers escriben en la misma base: no se cachean sus hashes
+        self._hashes = {}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Exporta las fichas a SQLite de forma incremental')
+    parser.add_argument('--description-file', default='description_data.json')
+    parser.add_argument('--db', default='pares.sqlite', help='Base de datos SQLite de salida')
+    parser.add_argument('--batch', type=int, default=500, help='Fichas por transacción')
+    parser.add_argument('--full', action='store_true', help='Vaciar la base y exportar todo de nuevo')
+    args = parser.parse_args()
+    exporter = SqliteExporter(args.db, batch=args.batch)
+    if args.full:
+        exporter.clear()
+    exporter.export(DescriptionStore(args.description_file).iter_records())
+    exporter.close()
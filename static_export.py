@@ -0,0 +1,193 @@
+# static_export.py
+"""
+Exportación estática para ``index.html``: fichas paginadas e índice de búsqueda precalculado.
+
+``index.html`` no descarga ``description_data.json`` entero ni sondea las
+imágenes con ``HEAD``. Lee ``export/meta.json`` y pide por demanda:
+
+    export/meta.json                  totales, tamaño de página, niveles y versión
+    export/shards/shard-00000.json    ``page_size`` fichas, ordenadas por id
+    export/index/<xx>.json            índice invertido de los tokens que empiezan por <xx>
+    export/levels/level-000.json      fichas de cada nivel de descripción
+
+Cada ficha lleva su lista de imágenes verificadas (del manifiesto de la
+unidad, ver image_manifest.py). Las listas del índice son posiciones en el
+orden de exportación (shard = posición // page_size), en orden creciente y
+codificadas por diferencias.
+
+    python3 static_export.py                      # export/ desde description_data.json y segmentos
+    python3 static_export.py --page-size 1000 --out export
+
+La exportación se escribe en un directorio temporal y sustituye a la
+anterior de golpe, así que se puede regenerar con el visor abierto.
+"""
+import os
+import re
+import json
+import time
+import shutil
+import logging
+import argparse
+import unicodedata
+from description_store import DescriptionStore
+from image_manifest import ImageManifest, MANIFEST_NAME
+
+FORMAT_VERSION = 1
+PREFIX_LEN = 2
+# Palabras vacías que aparecerían en casi todas las fichas y sólo engordan el índice
+STOPWORDS = frozenset("de del la las el los en y e o a al por para con sin se su sus un una".split())
+
+_COMBINING_RE = re.compile('[\u0300-\u036f]')
+_SPLIT_RE = re.compile(r'[^a-z0-9]+')
+_IMAGE_RE = re.compile(r'^image_(\d+)\.\w+$')
+
+
+def normalize(text):
+    """Minúsculas y sin tildes; igual que ``normalize`` en index.html."""
+    return _COMBINING_RE.sub('', unicodedata.normalize('NFD', text)).lower()
+
+
+def tokenize(text):
+    return {token for token in _SPLIT_RE.split(normalize(text))
+            if len(token) >= PREFIX_LEN and token not in STOPWORDS}
+
+
+def summarize(page_id, record):
+    """Los campos que muestra ``index.html``, con los mismos valores por defecto."""
+    data = record.get("additional_data") or {}
+    return {
+        "id": page_id,
+        "title": data.get("Supplied Title") or data.get("Formal Title") or "Sin título",
+        "date": data.get("Date of creation") or "Desconocida",
+        "signatura": data.get("Reference number") or "Desconocida",
+        "code": data.get("Reference code") or "Desconocido",
+        "level": data.get("Level of description") or "Desconocido",
+        "url": record.get("url"),
+        "has_image": bool(record.get("has_image")),
+    }
+
+
+def list_images(unit_dir, expected=0):
+    """
+    Ficheros de imagen de una unidad en orden de índice.
+
+    Con manifiesto, sólo las que siguen siendo válidas (estado ok y mismo tamaño);
+    sin él (descargas anteriores), las ``image_<n>.*`` que haya en el directorio.
+    """
+    if os.path.exists(os.path.join(unit_dir, MANIFEST_NAME)):
+        manifest = ImageManifest(unit_dir)
+        indices = range(1, max(expected, max(manifest.indices("ok"), default=0)) + 1)
+        return [os.path.basename(manifest.file_path(idx)) for idx in indices if manifest.is_valid(idx)]
+    try:
+        names = os.listdir(unit_dir)
+    except FileNotFoundError:
+        return []
+    found = [(int(m.group(1)), name) for name in names for m in [_IMAGE_RE.match(name)] if m]
+    return [name for _, name in sorted(found)]
+
+
+def encode_postings(positions):
+    """Posiciones crecientes -> diferencias (``[3, 5, 9]`` -> ``[3, 2, 4]``)."""
+    previous = 0
+    deltas = []
+    for position in positions:
+        deltas.append(position - previous)
+        previous = position
+    return deltas
+
+
+def _sort_key(page_id):
+    return (0, int(page_id), "") if page_id.isdigit() else (1, 0, page_id)
+
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def export(records, out_dir="export", img_folder="img", page_size=500):
+    """
+    Escribe la exportación de ``records`` (``{page_id: ficha}``) en ``out_dir``.
+
+    Devuelve el contenido de ``meta.json``.
+    """
+    logger = logging.getLogger('ParesFileScraper')
+    start = time.time()
+    tmp_dir = f"{out_dir.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    for sub in ("shards", "index", "levels"):
+        os.makedirs(os.path.join(tmp_dir, sub))
+
+    postings = {}   # token -> [posiciones]
+    levels = {}     # nivel -> [posiciones]
+    shards = []
+    shard = []
+    images_total = 0
+    page_ids = sorted(records, key=_sort_key)
+    for position, page_id in enumerate(page_ids):
+        record = records[page_id]
+        entry = summarize(page_id, record)
+        if entry["has_image"]:
+            entry["images"] = list_images(os.path.join(img_folder, page_id), len(record.get("image_links") or []))
+            images_total += len(entry["images"])
+        shard.append(entry)
+        for token in tokenize(f"{entry['title']} {entry['date']}"):
+            postings.setdefault(token, []).append(position)
+        levels.setdefault(entry["level"], []).append(position)
+        if len(shard) == page_size:
+            shards.append(f"shard-{len(shards):05d}.json")
+            _write_json(os.path.join(tmp_dir, "shards", shards[-1]), shard)
+            shard = []
+    if shard:
+        shards.append(f"shard-{len(shards):05d}.json")
+        _write_json(os.path.join(tmp_dir, "shards", shards[-1]), shard)
+
+    # Índice invertido repartido por los PREFIX_LEN primeros caracteres del token
+    by_prefix = {}
+    for token, positions in postings.items():
+        by_prefix.setdefault(token[:PREFIX_LEN], {})[token] = encode_postings(positions)
+    for prefix, tokens in by_prefix.items():
+        _write_json(os.path.join(tmp_dir, "index", f"{prefix}.json"), tokens)
+
+    level_meta = []
+    for i, (level, positions) in enumerate(sorted(levels.items())):
+        name = f"level-{i:03d}.json"
+        _write_json(os.path.join(tmp_dir, "levels", name), encode_postings(positions))
+        level_meta.append({"name": level, "count": len(positions), "file": name})
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "total": len(page_ids),
+        "page_size": page_size,
+        "shards": shards,
+        "prefix_len": PREFIX_LEN,
+        "index_prefixes": sorted(by_prefix),
+        "stopwords": sorted(STOPWORDS),
+        "levels": level_meta,
+        "images": images_total,
+    }
+    _write_json(os.path.join(tmp_dir, "meta.json"), meta)
+
+    # Sustitución de la exportación anterior
+    old_dir = f"{out_dir.rstrip(os.sep)}.old-{os.getpid()}"
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    logger.info(f"Exportación en {out_dir}: {len(page_ids)} fichas en {len(shards)} shards, "
+                f"{len(postings)} tokens en {len(by_prefix)} ficheros de índice, "
+                f"{len(levels)} niveles, {images_total} imágenes ({time.time() - start:.2f}s)")
+    return meta
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Exporta las fichas en shards e índice para index.html')
+    parser.add_argument('--description-file', default='description_data.json')
+    parser.add_argument('--img-folder', default='img')
+    parser.add_argument('--out', default='export', help='Directorio de salida (junto a index.html)')
+    parser.add_argument('--page-size', type=int, default=500, help='Fichas por shard')
+    args = parser.parse_args()
+    export(DescriptionStore(args.description_file).load_all(), args.out, args.img_folder, args.page_size)
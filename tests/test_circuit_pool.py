@@ -0,0 +1,243 @@
+"""
+Aislamiento de circuitos contra un servidor SOCKS5 de pega.
+
+El servidor acepta usuario/contraseña (RFC 1929), anota las credenciales de cada
+conexión y responde a la petición HTTP sin salir a la red.
+"""
+import socket
+import socketserver
+import struct
+import threading
+import unittest
+
+import requests
+
+from browser_pool import ContextPool
+from circuit_pool import CircuitPool
+from http_fetcher import HttpFetcher
+
+
+class _StubSocksHandler(socketserver.BaseRequestHandler):
+    def _read(self, n):
+        data = b""
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("conexión cerrada")
+            data += chunk
+        return data
+
+    def handle(self):
+        _, nmethods = self._read(2)
+        methods = self._read(nmethods)
+        credentials = None
+        if 0x02 in methods:
+            self.request.sendall(b"\x05\x02")
+            _, ulen = self._read(2)
+            username = self._read(ulen).decode()
+            plen, = self._read(1)
+            password = self._read(plen).decode()
+            credentials = (username, password)
+            self.request.sendall(b"\x01\x00")
+        else:
+            self.request.sendall(b"\x05\x00")
+
+        _, _, _, atyp = self._read(4)
+        if atyp == 0x01:
+            self._read(4)
+        elif atyp == 0x03:
+            self._read(self._read(1)[0])
+        else:
+            self._read(16)
+        self._read(2)
+        self.request.sendall(b"\x05\x00\x00\x01" + socket.inet_aton("0.0.0.0") + struct.pack(">H", 0))
+
+        self.server.seen.append((self.server.server_address[1], credentials))
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = self.request.recv(4096)
+            if not chunk:
+                break
+            request += chunk
+        self.request.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nContent-Length: 2\r\n"
+                             b"Connection: close\r\n\r\nok")
+
+
+class _StubSocksServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _StubSocksHandler)
+        self.seen = []
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _fetch_through(circuit):
+    proxies = {"http": circuit.url(), "https": circuit.url()}
+    response = requests.get("http://pares.test/", proxies=proxies, timeout=5)
+    response.raise_for_status()
+
+
+class _FakeContext:
+    def __init__(self, kwargs):
+        self.kwargs = kwargs
+        self.closed = False
+
+    def new_page(self):
+        return self
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeBrowser:
+    def __init__(self, kwargs):
+        self.kwargs = kwargs
+        self.contexts = []
+        self.closed = False
+
+    def new_context(self, **kwargs):
+        context = _FakeContext(kwargs)
+        self.contexts.append(context)
+        return context
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeLauncher:
+    def launch(self, **kwargs):
+        return _FakeBrowser(kwargs)
+
+
+class _FakePlaywright:
+    chromium = firefox = webkit = _FakeLauncher()
+
+
+class AuthModeTest(unittest.TestCase):
+    def setUp(self):
+        self.server = _StubSocksServer()
+        self.addCleanup(self.server.stop)
+
+    def test_each_slot_gets_its_own_credentials(self):
+        pool = CircuitPool("auth", ports=(self.server.port,))
+        circuits = [pool.acquire() for _ in range(4)]
+        for circuit in circuits:
+            _fetch_through(circuit)
+
+        seen = [credentials for _, credentials in self.server.seen]
+        self.assertEqual(seen, [c.auth for c in circuits])
+        self.assertEqual(len(set(seen)), len(circuits))
+
+    def test_retired_circuit_is_replaced_with_new_credentials(self):
+        pool = CircuitPool("auth", ports=(self.server.port,), min_samples=1, max_error_rate=0.2)
+        circuit = pool.acquire()
+        self.assertTrue(pool.record(circuit, ok=False, latency=1.0))
+        replacement = pool.acquire(circuit)
+        _fetch_through(circuit)
+        _fetch_through(replacement)
+
+        first, second = (credentials for _, credentials in self.server.seen)
+        self.assertNotEqual(first, second)
+
+
+class EngineFallbackTest(unittest.TestCase):
+    def _pool(self, engine, ports, http_fetcher_factory=None):
+        circuits = CircuitPool("auth", ports=ports)
+        pool = ContextPool(_FakePlaywright(), 3, True, lambda: "UA", circuit_pool=circuits,
+                           http_fetcher_factory=http_fetcher_factory)
+        pool.ENGINES = [engine]
+        pool.launch()
+        return pool
+
+    def test_firefox_contexts_use_auth_circuits(self):
+        pool = self._pool("firefox", (9050,))
+        usernames = [c.kwargs["proxy"]["username"] for c in pool.browser.contexts]
+        self.assertEqual(len(set(usernames)), 3)
+        self.assertTrue(pool.circuit_isolated)
+
+    def test_chromium_falls_back_to_one_port_per_context(self):
+        pool = self._pool("chromium", (9060, 9061, 9062))
+        proxies = [c.kwargs["proxy"] for c in pool.browser.contexts]
+        self.assertTrue(all("username" not in proxy for proxy in proxies))
+        self.assertEqual(sorted(p["server"] for p in proxies),
+                         [f"socks5://127.0.0.1:{port}" for port in (9060, 9061, 9062)])
+        self.assertEqual(pool.circuits.mode, "ports")
+        self.assertTrue(pool.circuit_isolated)
+
+    def test_chromium_with_a_single_port_is_not_isolated(self):
+        pool = self._pool("chromium", (9050,))
+        self.assertEqual([slot.circuit.users for slot in pool.slots], [3, 3, 3])
+        self.assertFalse(pool.circuit_isolated)
+
+    def test_http_mode_on_chromium_keeps_auth_circuits_for_the_http_client(self):
+        server = _StubSocksServer()
+        self.addCleanup(server.stop)
+        pool = self._pool("chromium", (server.port,), http_fetcher_factory=HttpFetcher)
+        self.assertTrue(all("username" not in c.kwargs["proxy"] for c in pool.browser.contexts))
+        self.assertFalse(pool.circuit_isolated)
+        self.assertTrue(pool.http_isolated)
+
+        for slot in pool.slots:
+            self.assertEqual(slot.http_fetcher.get("http://pares.test/"), "ok")
+        seen = [credentials for _, credentials in server.seen]
+        self.assertEqual(seen, [slot.http_circuit.auth for slot in pool.slots])
+        self.assertEqual(len(set(seen)), len(pool.slots))
+
+    def test_http_circuit_is_released_on_rotation(self):
+        pool = self._pool("chromium", (9050,), http_fetcher_factory=HttpFetcher)
+        slot = pool.slots[0]
+        previous = slot.http_circuit
+        pool.close_context(slot)
+        pool.open_context(slot)
+        self.assertEqual(previous.users, 0)
+        self.assertIsNot(slot.http_circuit, previous)
+        self.assertNotEqual(slot.http_circuit.auth, previous.auth)
+        self.assertEqual(sum(c.users for c in pool.circuit_pool.circuits), len(pool.slots))
+        self.assertTrue(pool.record(slot.http_circuit, ok=True, latency=1.0) is False)
+        self.assertEqual(slot.http_circuit.samples, 1)
+
+
+class DirectFallbackTest(unittest.TestCase):
+    def test_direct_fallback_only_reopens_its_own_slot(self):
+        pool = ContextPool(_FakePlaywright(), 3, True, lambda: "UA", circuit_pool=CircuitPool("auth", ports=(9050,)),
+                           http_fetcher_factory=HttpFetcher)
+        pool.ENGINES = ["firefox"]
+        pool.launch()
+        browser = pool.browser
+        slot, *others = pool.slots
+        kept = [(other.context, dict(other.http_fetcher.session.proxies)) for other in others]
+
+        pool.close_context(slot)
+        pool.open_context(slot, direct=True)
+        self.assertIs(pool.browser, browser)
+        self.assertFalse(browser.closed)
+        self.assertEqual([(other.context, other.http_fetcher.session.proxies) for other in others], kept)
+        self.assertTrue(all(not other.context.closed for other in others))
+        self.assertNotIn("proxy", pool.direct_browser.kwargs)
+        self.assertNotIn("proxy", slot.context.kwargs)
+        self.assertFalse(slot.proxied)
+        self.assertEqual(slot.http_fetcher.session.proxies, {})
+
+        # La rotación lo devuelve a Tor y el navegador directo ya no hace falta
+        direct = pool.direct_browser
+        pool.close_context(slot)
+        pool.open_context(slot)
+        self.assertTrue(slot.proxied)
+        self.assertIn("proxy", slot.context.kwargs)
+        self.assertTrue(direct.closed)
+        self.assertIsNone(pool.direct_browser)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Listados contiene por bloques contra el Pares simulado de bench_e2e.
+
+Cada pasada hace lo mismo que ``process_contiene`` de los motores: GET de la
+página contiene (fija la sesión), POST de cada bloque y progreso en un Redis
+de pega.
+"""
+import re
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+
+import fakeredis
+import requests
+
+from bench_e2e import CATALOGO, StandInPares, make_handler
+from contiene_blocks import (SEARCH_CONTROLLER_PATH, CONTIENE_BLOCK_SIZE, CONTIENE_FAILED_KEY,
+                             CONTIENE_MAX_ATTEMPTS, CONTIENE_TRUNCATED_KEY, ContieneBlocks, contiene_form,
+                             progress_key)
+
+_DESCRIPTION_RE = re.compile(r'href="([^"]*/description/\d+)"')
+
+
+class ContieneBlocksTest(unittest.TestCase):
+    def _serve(self, children, page_field):
+        self.site = StandInPares(units=1, children=children, images=0, image_kb=0, page_field=page_field)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(self.site))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        self.url = f"{self.base_url}{CATALOGO}/contiene/1"
+        self.r = fakeredis.FakeStrictRedis()
+
+    def _crawl(self, block_size, page_field, fail=()):
+        """Una pasada; devuelve el recorrido, el resultado y los bloques pedidos."""
+        session = requests.Session()
+        session.get(self.url, timeout=5).raise_for_status()
+        blocks = ContieneBlocks(self.url, self.r.hgetall(progress_key(self.url)), block_size, page_field)
+        requested = []
+        while True:
+            window = blocks.next_window(2)
+            if not window:
+                break
+            for block in window:
+                requested.append(block)
+                desc_urls = None
+                if block not in fail:
+                    response = session.post(self.base_url + SEARCH_CONTROLLER_PATH, data=blocks.form(block), timeout=5)
+                    desc_urls = _DESCRIPTION_RE.findall(response.text)
+                fields = blocks.record(block, desc_urls)
+                if fields is not None:
+                    self.r.hset(blocks.key, mapping=fields)
+        pipe = self.r.pipeline(transaction=False)
+        outcome = blocks.finish(pipe)
+        pipe.execute()
+        return blocks, outcome, requested
+
+    def test_server_that_pages_returns_the_whole_listing(self):
+        self._serve(children=10, page_field="pagina")
+        blocks, outcome, requested = self._crawl(4, "pagina")
+        self.assertEqual(outcome, "done")
+        self.assertEqual(blocks.found, 10)
+        self.assertEqual(requested, [1, 2, 3, 4])
+        self.assertEqual(blocks.last, 3)
+        self.assertFalse(self.r.exists(progress_key(self.url)))
+
+    def test_server_that_ignores_the_page_field_ends_in_contiene_failed(self):
+        self._serve(children=10, page_field=None)
+        outcomes = []
+        for _ in range(CONTIENE_MAX_ATTEMPTS):
+            blocks, outcome, requested = self._crawl(4, "pagina")
+            outcomes.append(outcome)
+            # Los bloques siguientes repiten el 1: no se toman por el fin del listado
+            self.assertIn(2, blocks.repeated)
+            self.assertEqual(set(blocks.repeated.values()), {1})
+            self.assertIsNone(blocks.last)
+        self.assertEqual(outcomes, ["retry"] * (CONTIENE_MAX_ATTEMPTS - 1) + ["failed"])
+        self.assertTrue(self.r.sismember(CONTIENE_FAILED_KEY, self.url))
+        self.assertFalse(self.r.exists(progress_key(self.url)))
+
+    def test_resume_requests_only_the_missing_blocks(self):
+        self._serve(children=10, page_field="pagina")
+        _, outcome, requested = self._crawl(4, "pagina", fail={2})
+        self.assertEqual(outcome, "retry")
+        self.assertEqual(requested, [1, 2])
+
+        blocks, outcome, requested = self._crawl(4, "pagina")
+        self.assertEqual(outcome, "done")
+        self.assertEqual(requested, [2, 3])
+        self.assertEqual(blocks.found, 10)
+
+    def test_without_page_field_a_single_request_is_made(self):
+        self._serve(children=10, page_field="pagina")
+        blocks, outcome, requested = self._crawl(4, None)
+        self.assertEqual(outcome, "done")
+        self.assertEqual(requested, [1])
+        self.assertEqual(blocks.found, 10)
+        self.assertEqual(self.site.counts["contiene"], 1)
+        self.assertFalse(blocks.truncated)
+
+    def test_full_single_block_is_flagged_as_truncated(self):
+        self.r = fakeredis.FakeStrictRedis()
+        url = "https://pares.mcu.es/ParesBusquedas20/catalogo/contiene/7"
+        blocks = ContieneBlocks(url, {}, 500)
+        self.assertEqual(blocks.next_window(4), [1])
+        self.assertIsNotNone(blocks.record(1, [f"{url}/{n}" for n in range(CONTIENE_BLOCK_SIZE)]))
+        pipe = self.r.pipeline(transaction=False)
+        self.assertEqual(blocks.finish(pipe), "done")
+        pipe.execute()
+        self.assertTrue(blocks.truncated)
+        self.assertTrue(self.r.sismember(CONTIENE_TRUNCATED_KEY, url))
+
+    def test_first_block_form_is_unchanged(self):
+        self.assertEqual(contiene_form(1, page_field="pagina"), contiene_form(1))
+        with self.assertRaises(ValueError):
+            contiene_form(2)
+
+
+if __name__ == "__main__":
+    unittest.main()
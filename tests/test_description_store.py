@@ -0,0 +1,52 @@
+"""
+Segmentos y compactación de DescriptionStore en un directorio temporal.
+"""
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from description_store import DescriptionStore
+
+
+class CompactTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.description_file = os.path.join(tmp.name, "description_data.json")
+        self.store = DescriptionStore(self.description_file, segment_dir=os.path.join(tmp.name, "descriptions"))
+        self.addCleanup(self.store.close)
+
+    def _consolidated(self):
+        with open(self.description_file, encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_segments_are_merged_and_removed(self):
+        self.store.append("1", {"url": "a"})
+        self.store.append("2", {"url": "b"})
+        self.assertEqual(self.store.compact(), 2)
+        self.store.append("1", {"url": "c"})
+        self.assertEqual(self.store.compact(), 2)
+        self.assertEqual(self._consolidated(), {"1": {"url": "c"}, "2": {"url": "b"}})
+        self.assertEqual(self.store.segment_files(), [])
+
+    def test_compaction_waits_for_the_one_in_progress(self):
+        self.store.append("1", {"url": "a"})
+        # Otra compactación (de cualquier proceso) tiene el cerrojo
+        with open(self.store.compact_lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            worker = threading.Thread(target=self.store.compact)
+            worker.start()
+            worker.join(0.3)
+            self.assertTrue(worker.is_alive())
+            self.assertFalse(os.path.exists(self.description_file))
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        worker.join(5)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(self._consolidated(), {"1": {"url": "a"}})
+
+
+if __name__ == "__main__":
+    unittest.main()
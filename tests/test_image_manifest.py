@@ -0,0 +1,109 @@
+"""
+Reanudación de descargas con el manifiesto, contra un servidor de imágenes local.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fakeredis
+
+from image_downloader import ImageDownloader
+from image_manifest import ImageManifest, image_filename, verify_unit
+
+
+def _jpeg(n):
+    return b"\xff\xd8" + bytes([n]) * 2048 + b"\xff\xd9"
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        n = int(self.path.rsplit("=", 1)[1])
+        self.server.hits.append(n)
+        body = _jpeg(n)
+        if n in self.server.truncate:
+            body = body[:-2]
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ManifestResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _ImageHandler)
+        self.server.hits = []
+        self.server.truncate = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.unit_dir = os.path.join(tmp.name, "img", "42")
+        base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.links = [f"{base}/ViewImage.do?n={n}" for n in range(1, 4)]
+        self.r = fakeredis.FakeStrictRedis()
+        self.downloader = ImageDownloader(self.r, page_concurrency=2)
+
+    def _download(self):
+        return self.downloader.download("42", self.links, self.unit_dir, cookies=[], user_agent="UA",
+                                        referer="http://pares.test/", max_retries=1)
+
+    def test_valid_images_are_skipped_without_network(self):
+        stats = self._download()
+        self.assertEqual((stats["downloaded"], stats["skipped"], stats["missing"]), (3, 0, 0))
+        manifest = ImageManifest(self.unit_dir)
+        self.assertEqual(manifest.indices("ok"), [1, 2, 3])
+        self.assertEqual(manifest.images["2"]["sha256"], hashlib.sha256(_jpeg(2)).hexdigest())
+        self.assertEqual(self.r.get("last_downloaded_image:42"), b"3")
+
+        self.server.hits.clear()
+        stats = self._download()
+        self.assertEqual((stats["downloaded"], stats["skipped"]), (0, 3))
+        self.assertEqual(self.server.hits, [])
+
+    def test_only_damaged_images_are_fetched_again(self):
+        self._download()
+        with open(os.path.join(self.unit_dir, image_filename(2)), "r+b") as f:
+            f.truncate(100)
+        self.server.hits.clear()
+        stats = self._download()
+        self.assertEqual((stats["downloaded"], stats["skipped"]), (1, 2))
+        self.assertEqual(self.server.hits, [2])
+
+    def test_truncated_response_is_recorded_as_failed(self):
+        self.server.truncate.add(3)
+        stats = self._download()
+        self.assertEqual((stats["downloaded"], stats["failed"], stats["missing"]), (2, 1, 1))
+        self.assertEqual(ImageManifest(self.unit_dir).indices("failed"), [3])
+        self.assertFalse(os.path.exists(os.path.join(self.unit_dir, image_filename(3))))
+        self.assertEqual(self.r.smembers("failed_images:42"), {b"3"})
+        self.assertEqual(self.r.get("last_downloaded_image:42"), b"2")
+
+    def test_files_from_before_the_manifest_are_adopted(self):
+        os.makedirs(self.unit_dir)
+        for n in (1, 2):
+            with open(os.path.join(self.unit_dir, image_filename(n)), "wb") as f:
+                f.write(_jpeg(n) if n == 1 else _jpeg(n)[:-2])
+        stats = self._download()
+        self.assertEqual((stats["downloaded"], stats["skipped"]), (2, 1))
+        self.assertEqual(sorted(self.server.hits), [2, 3])
+
+    def test_verify_marks_changed_files_as_corrupt(self):
+        self._download()
+        with open(os.path.join(self.unit_dir, image_filename(1)), "r+b") as f:
+            f.seek(10)
+            f.write(b"\x00")
+        summary = verify_unit(self.unit_dir, mark=True)
+        self.assertEqual((summary["ok"], summary["mismatch"]), (2, 1))
+        self.assertEqual(ImageManifest(self.unit_dir).indices("corrupt"), [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+Exportación incremental a SQLite en una base temporal.
+"""
+import os
+import tempfile
+import unittest
+
+from sqlite_export import SqliteExporter, SqliteSink, field_key, year_range
+
+
+def _record(title, date="1520-03-15 - 1530", links=("a", "b")):
+    return {
+        "url": f"https://pares.mcu.es/{title}",
+        "additional_data": {"Supplied Title": title, "Date of creation": date,
+                            "Level of description": "Unidad documental simple", "Área de identificación": "x"},
+        "has_image": bool(links),
+        "image_links": list(links),
+    }
+
+
+class SqliteExportTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "pares.sqlite")
+        self.exporter = SqliteExporter(self.path, batch=2)
+        self.addCleanup(self.exporter.close)
+
+    def _query(self, sql, *args):
+        return self.exporter.conn.execute(sql, args).fetchall()
+
+    def test_records_are_normalized_into_tables(self):
+        self.assertEqual(self.exporter.export(iter([("1", _record("Carta de Sevilla"))])), (1, 0))
+        self.assertEqual(self._query("SELECT title, year_start, year_end, image_count FROM units"),
+                         [("Carta de Sevilla", 1520, 1530, 2)])
+        self.assertEqual(self._query("SELECT value FROM fields WHERE key = 'area_de_identificacion'"), [("x",)])
+        self.assertEqual(self._query("SELECT idx, url FROM image_links ORDER BY idx"), [(1, "a"), (2, "b")])
+        if self.exporter.fts:
+            self.assertEqual(self._query("SELECT page_id FROM units_fts WHERE units_fts MATCH 'sevilla'"), [("1",)])
+
+    def test_reexport_only_writes_changed_records(self):
+        records = [(str(n), _record(f"Unidad {n}")) for n in range(5)]
+        self.assertEqual(self.exporter.export(iter(records)), (5, 0))
+        records[3] = ("3", _record("Unidad cambiada", links=()))
+        self.assertEqual(self.exporter.export(iter(records)), (1, 4))
+        self.assertEqual(self._query("SELECT COUNT(*) FROM image_links WHERE page_id = '3'"), [(0,)])
+        if self.exporter.fts:
+            self.assertEqual(self._query("SELECT COUNT(*) FROM units_fts"), [(5,)])
+            self.assertEqual(self._query("SELECT page_id FROM units_fts WHERE units_fts MATCH 'cambiada'"),
+                             [("3",)])
+
+    def test_a_new_exporter_resumes_from_stored_hashes(self):
+        self.exporter.export(iter([("1", _record("Uno")), ("2", _record("Dos"))]))
+        resumed = SqliteExporter(self.path)
+        self.addCleanup(resumed.close)
+        self.assertEqual(resumed.export(iter([("1", _record("Uno")), ("3", _record("Tres"))])), (1, 1))
+
+    def test_sink_writes_each_record_immediately(self):
+        sink = SqliteSink(self.path)
+        self.addCleanup(sink.close)
+        self.assertTrue(sink.upsert(7, _record("Siete")))
+        self.assertEqual(self._query("SELECT page_id FROM units"), [("7",)])
+
+    def test_helpers(self):
+        self.assertEqual(field_key("Level of description"), "level_of_description")
+        self.assertEqual(year_range("s. XVI"), (None, None))
+        self.assertEqual(year_range("1601-01-01"), (1601, 1601))
+
+
+if __name__ == "__main__":
+    unittest.main()
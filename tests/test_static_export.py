@@ -0,0 +1,90 @@
+"""
+Exportación estática (shards + índice invertido) en un directorio temporal.
+"""
+import json
+import os
+import tempfile
+import unittest
+
+from image_manifest import ImageManifest, image_filename
+from static_export import encode_postings, export, tokenize
+
+
+def _record(title, date, level="Unidad documental simple", links=()):
+    return {
+        "url": f"https://pares.mcu.es/{title}",
+        "additional_data": {"Supplied Title": title, "Date of creation": date, "Level of description": level},
+        "has_image": bool(links),
+        "image_links": list(links),
+    }
+
+
+class StaticExportTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.out = os.path.join(tmp.name, "export")
+        self.img = os.path.join(tmp.name, "img")
+        self.records = {
+            "10": _record("Carta de Sevilla", "1520", links=["a", "b"]),
+            "9": _record("Pleito en Sevilla", "1601", level="Expediente"),
+            "100": _record("Real cédula", "1520"),
+        }
+
+    def _read(self, *parts):
+        with open(os.path.join(self.out, *parts), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _decode(self, deltas):
+        positions, total = [], 0
+        for delta in deltas:
+            total += delta
+            positions.append(total)
+        return positions
+
+    def test_shards_are_sorted_by_numeric_id(self):
+        meta = export(self.records, self.out, self.img, page_size=2)
+        self.assertEqual(meta["total"], 3)
+        self.assertEqual(meta["shards"], ["shard-00000.json", "shard-00001.json"])
+        ids = [entry["id"] for name in meta["shards"] for entry in self._read("shards", name)]
+        self.assertEqual(ids, ["9", "10", "100"])
+
+    def test_index_finds_records_by_normalized_token(self):
+        meta = export(self.records, self.out, self.img, page_size=2)
+        self.assertIn("se", meta["index_prefixes"])
+        sevilla = self._decode(self._read("index", "se.json")["sevilla"])
+        self.assertEqual(sevilla, [0, 1])
+        # "cédula" se indexa sin tilde; "de" y "en" son palabras vacías
+        self.assertEqual(self._decode(self._read("index", "ce.json")["cedula"]), [2])
+        self.assertNotIn("de", tokenize("Carta de Sevilla"))
+        self.assertEqual(encode_postings([3, 5, 9]), [3, 2, 4])
+
+    def test_levels_and_verified_images(self):
+        unit_dir = os.path.join(self.img, "10")
+        os.makedirs(unit_dir)
+        manifest = ImageManifest(unit_dir)
+        for idx in (1, 2):
+            with open(os.path.join(unit_dir, image_filename(idx)), "wb") as f:
+                f.write(b"x" * 10)
+            manifest.record_ok(idx, 10 if idx == 1 else 99, None)
+        manifest.save()
+
+        meta = export(self.records, self.out, self.img)
+        levels = {level["name"]: level for level in meta["levels"]}
+        self.assertEqual(levels["Expediente"]["count"], 1)
+        self.assertEqual(self._decode(self._read("levels", levels["Unidad documental simple"]["file"])), [1, 2])
+        # Sólo las imágenes que siguen cuadrando con el manifiesto
+        entry = self._read("shards", "shard-00000.json")[1]
+        self.assertEqual(entry["images"], [image_filename(1)])
+        self.assertEqual(meta["images"], 1)
+
+    def test_new_export_replaces_the_previous_one(self):
+        export(self.records, self.out, self.img, page_size=1)
+        export({"1": _record("Otra", "1700")}, self.out, self.img, page_size=1)
+        self.assertEqual(os.listdir(os.path.join(self.out, "shards")), ["shard-00000.json"])
+        self.assertEqual(self._read("meta.json")["total"], 1)
+        self.assertEqual(sorted(os.listdir(os.path.dirname(self.out))), ["export"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+"""
+Frontier en Redis contra fakeredis (con lupa, así que los scripts Lua se ejecutan).
+"""
+import unittest
+
+import fakeredis
+import fakeredis.aioredis
+
+from work_queue import AsyncRedisWorkQueue, RedisWorkQueue
+
+BASE = "https://pares.mcu.es"
+
+
+def description(n):
+    return f"{BASE}/ParesBusquedas20/catalogo/description/{n}"
+
+
+def contiene(n):
+    return f"{BASE}/ParesBusquedas20/catalogo/contiene/{n}"
+
+
+class _QueueTest(unittest.TestCase):
+    def setUp(self):
+        self.r = fakeredis.FakeStrictRedis()
+
+    def queue(self, **kwargs):
+        return RedisWorkQueue(self.r, **kwargs)
+
+
+class ReliableQueueTest(_QueueTest):
+    def _worker(self, worker_id):
+        queue = self.queue(reliable=True, worker_id=worker_id)
+        # Alta sin hilo de heartbeat: el lease se renueva a mano
+        queue.heartbeat()
+        return queue
+
+    def test_dequeued_url_stays_in_flight_until_ack(self):
+        worker = self._worker("w1")
+        worker.enqueue_many([description(1), description(2)])
+        self.assertEqual(worker.dequeue(timeout=0.1), description(1))
+        self.assertEqual(self.r.lrange("processing:w1", 0, -1), [b"d:1"])
+        self.assertEqual(worker.in_flight(), 1)
+        worker.ack(description(1))
+        self.assertEqual(self.r.llen("processing:w1"), 0)
+        self.assertTrue(worker.is_done(description(1)))
+        self.assertFalse(worker.is_drained())
+
+    def test_expired_lease_returns_urls_to_the_queue(self):
+        worker = self._worker("w1")
+        worker.enqueue_many([description(1), description(2)])
+        worker.dequeue(timeout=0.1)
+        worker.dequeue(timeout=0.1)
+        reaper = self.queue(reliable=True, worker_id="controller")
+        # Lease vivo: el reaper no toca nada
+        self.assertEqual(reaper.reap_expired(), 0)
+        self.r.delete("lease:w1")
+        self.assertEqual(reaper.reap_expired(), 2)
+        self.assertEqual(self.r.llen("processing:w1"), 0)
+        self.assertFalse(self.r.sismember("queue_workers", "w1"))
+        self.assertEqual([reaper.dequeue(timeout=0.1) for _ in range(2)], [description(1), description(2)])
+
+    def test_unregister_requeues_unfinished_work(self):
+        worker = self._worker("w1")
+        worker.enqueue_many([description(1)])
+        worker.dequeue(timeout=0.1)
+        worker.unregister()
+        self.assertEqual(self.r.lrange("todo_urls:description", 0, -1), [b"d:1"])
+        self.assertFalse(self.r.exists("lease:w1"))
+
+
+class EnqueueTest(_QueueTest):
+    def test_batch_is_deduplicated_within_and_across_calls(self):
+        queue = self.queue()
+        find = f"{BASE}/ParesBusquedas20/catalogo/find?nm=1"
+        self.assertEqual(queue.enqueue_many([description(1), description(1), find, find]), 2)
+        self.assertEqual(queue.enqueue_many([description(1), description(2), find]), 1)
+        self.assertEqual(queue.pending(), 3)
+
+    def test_large_batch_is_split_into_script_chunks(self):
+        queue = self.queue()
+        urls = [description(n) for n in range(1, 26)]
+        self.assertEqual(queue.enqueue_many(urls, chunk_size=10), 25)
+        self.assertEqual(self.r.lrange("todo_urls:description", 0, -1), [f"d:{n}".encode() for n in range(1, 26)])
+        self.assertEqual(queue.enqueue_many(urls, chunk_size=10), 0)
+
+    def test_done_url_is_not_enqueued_even_if_unseen(self):
+        queue = self.queue()
+        self.r.setbit("done_ids:d", 4, 1)
+        self.r.sadd("done_urls", f"{BASE}/find?q=x")
+        self.assertEqual(queue.enqueue_many([description(4), f"{BASE}/find?q=x", description(5)]), 1)
+        self.assertEqual(queue.dequeue(timeout=0.1), description(5))
+
+
+class FrontierTest(_QueueTest):
+    FIND = f"{BASE}/ParesBusquedas20/catalogo/find?nm=1"
+
+    def _drain(self, queue):
+        urls = []
+        while True:
+            url = queue.dequeue(timeout=0.1)
+            if url is None:
+                return urls
+            urls.append(url)
+
+    def test_priority_serves_descriptions_then_contiene_then_find(self):
+        queue = self.queue(frontier="priority")
+        queue.enqueue_many([self.FIND, contiene(1), description(1), contiene(2), description(2)])
+        self.assertEqual(self._drain(queue), [description(1), description(2), contiene(1), contiene(2), self.FIND])
+
+    def test_fifo_keeps_discovery_order(self):
+        queue = self.queue(frontier="fifo")
+        queue.enqueue_many([self.FIND, contiene(1), description(1)])
+        self.assertEqual(self._drain(queue), [self.FIND, contiene(1), description(1)])
+
+    def test_depth_finishes_the_latest_batch_first_in_page_order(self):
+        queue = self.queue(frontier="depth")
+        queue.enqueue_many([description(1), description(2)])
+        queue.enqueue_many([description(3), description(4)])
+        self.assertEqual(self._drain(queue), [description(3), description(4), description(1), description(2)])
+
+    def test_reaped_urls_go_back_to_their_own_lane(self):
+        worker = self.queue(reliable=True, worker_id="w1")
+        worker.heartbeat()
+        worker.enqueue_many([description(1), contiene(2), self.FIND])
+        for _ in range(3):
+            worker.dequeue(timeout=0.1)
+        self.r.delete("lease:w1")
+        self.assertEqual(self.queue(reliable=True).reap_expired(), 3)
+        self.assertEqual(self.r.lrange("todo_urls:description", 0, -1), [b"d:1"])
+        self.assertEqual(self.r.lrange("todo_urls:contiene", 0, -1), [b"c:2"])
+        self.assertEqual(self.r.lrange("todo_urls:find", 0, -1), [self.FIND.encode()])
+        self.assertFalse(self.r.exists("todo_urls"))
+
+    def test_seed_ranges_fill_their_lane_skipping_seen_ids(self):
+        queue = self.queue()
+        queue.enqueue_many([description(3)])
+        queue.add_range("description", 1, 5)
+        queue.add_range("contiene", 10, 11)
+        self.assertEqual(queue.pending(), 1 + 5 + 2)
+        self.assertEqual(queue.refill(batch=3), 2)
+        self.assertEqual(self.r.lrange("todo_urls:description", 0, -1), [b"d:3", b"d:1", b"d:2"])
+        urls = self._drain(queue)
+        self.assertEqual(urls[:5], [description(n) for n in (3, 1, 2, 4, 5)])
+        self.assertEqual(urls[5:], [contiene(10), contiene(11)])
+        self.assertEqual(queue.ranges_remaining(), 0)
+
+
+class BitmapStateTest(_QueueTest):
+    def test_ids_live_in_bitmaps_not_sets(self):
+        queue = self.queue()
+        self.assertEqual(queue.enqueue_many([description(5), contiene(7), f"{BASE}/find?q=x"]), 3)
+        self.assertEqual(self.r.getbit("seen_ids:d", 5), 1)
+        self.assertEqual(self.r.getbit("seen_ids:c", 7), 1)
+        self.assertEqual(self.r.smembers("seen_urls"), {f"{BASE}/find?q=x".encode()})
+        self.assertEqual(self.r.lrange("todo_urls:description", 0, -1), [b"d:5"])
+        self.assertEqual(queue.seen_count(), 3)
+
+    def test_seen_and_done_ids_are_not_enqueued_again(self):
+        queue = self.queue()
+        queue.enqueue_many([description(1), description(2)])
+        self.assertEqual(queue.dequeue(timeout=0.1), description(1))
+        queue.ack(description(1))
+        self.assertEqual(queue.enqueue_many([description(1), description(2), description(3)]), 1)
+        self.assertEqual(queue.are_done([description(1), description(2)]), [True, False])
+        self.assertEqual(queue.done_count(), 1)
+
+    def test_urls_from_another_host_are_kept_whole(self):
+        queue = self.queue()
+        other = "https://otro.example/ParesBusquedas20/catalogo/description/9"
+        self.assertEqual(queue.encode(other), other)
+        self.assertEqual(queue.decode(queue.encode(description(9))), description(9))
+
+    def test_seed_skips_done_ids_but_requeues_seen_ones(self):
+        queue = self.queue()
+        queue.enqueue_many([description(1), description(2)])
+        queue.ack(description(1))
+        self.assertEqual(queue.seed([description(1), description(2)]), (1, 1))
+
+
+class MigrateLegacyTest(_QueueTest):
+    def _legacy_state(self):
+        self.r.sadd("done_urls", description(1), f"{BASE}/find?q=x")
+        self.r.sadd("seen_urls", description(1), description(2), contiene(3))
+        self.r.rpush("todo_urls:description", *[description(n) for n in range(2, 9)])
+        self.r.rpush("processing:w1", contiene(3))
+
+    def test_legacy_state_is_converted_in_batches(self):
+        self._legacy_state()
+        queue = self.queue()
+        self.assertEqual(queue.migrate_legacy(batch=3), 1 + 3 + 7 + 1)
+        self.assertEqual(self.r.lrange("todo_urls:description", 0, -1),
+                         [f"d:{n}".encode() for n in range(2, 9)])
+        self.assertEqual(self.r.lrange("processing:w1", 0, -1), [b"c:3"])
+        self.assertEqual(self.r.smembers("done_urls"), {f"{BASE}/find?q=x".encode()})
+        self.assertEqual(self.r.getbit("done_ids:d", 1), 1)
+        self.assertEqual(self.r.getbit("seen_ids:c", 3), 1)
+        self.assertFalse(self.r.exists("todo_urls:description:migrating"))
+
+    def test_marker_skips_later_starts(self):
+        queue = self.queue()
+        self.assertEqual(queue.migrate_legacy(), 0)
+        self.assertEqual(int(self.r.get(queue.schema_key)), queue.schema_version)
+        # Ya migrado: no se vuelve a recorrer nada aunque aparezcan URLs completas
+        self.r.rpush("todo_urls:description", description(4))
+        self.assertEqual(queue.migrate_legacy(), 0)
+        self.assertEqual(self.r.lrange("todo_urls:description", 0, -1), [description(4).encode()])
+
+
+class AsyncQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.r = fakeredis.aioredis.FakeRedis()
+        self.queue = AsyncRedisWorkQueue(self.r)
+        await self.queue.enqueue_many([description(1), description(2)])
+
+    async def asyncTearDown(self):
+        await self.r.aclose()
+
+    async def test_failed_url_is_requeued_until_attempts_run_out(self):
+        for attempt in range(1, 3):
+            self.assertEqual(await self.queue.dequeue(timeout=0.1), description(attempt))
+            self.assertTrue(await self.queue.fail(description(attempt), max_attempts=2))
+        self.assertEqual(await self.queue.dequeue(timeout=0.1), description(1))
+        self.assertFalse(await self.queue.fail(description(1), max_attempts=2))
+        self.assertTrue(await self.queue.is_done(description(1)))
+        self.assertEqual(await self.r.smembers("failed_urls"), {b"d:1"})
+        self.assertEqual(await self.r.hgetall("url_attempts"), {b"d:2": b"1"})
+
+    async def test_not_drained_while_urls_are_in_flight(self):
+        first = await self.queue.dequeue(timeout=0.1)
+        second = await self.queue.dequeue(timeout=0.1)
+        self.assertEqual(await self.queue.pending(), 0)
+        self.assertFalse(await self.queue.is_drained())
+        await self.queue.ack(first)
+        await self.queue.retry(second)
+        self.assertFalse(await self.queue.is_drained())
+        await self.queue.ack(await self.queue.dequeue(timeout=0.1))
+        self.assertTrue(await self.queue.is_drained())
+
+
+if __name__ == "__main__":
+    unittest.main()
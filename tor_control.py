@@ -0,0 +1,266 @@
+# tor_control.py
+import os
+import time
+import socket
+import logging
+import threading
+import requests
+
+
+class TorControlError(Exception):
+    pass
+
+
+class TorControl:
+    """
+    Cliente mínimo del ControlPort de Tor (sin dependencias externas).
+
+    Sirve para pedir ``SIGNAL NEWNYM`` y esperar a que Tor construya un
+    circuito nuevo escuchando los eventos ``CIRC ... BUILT``, en lugar de
+    dormir un tiempo fijo.
+    """
+
+    def __init__(self, host="127.0.0.1", port=9051, password="mi_password_control", timeout=10):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.logger = logging.getLogger('ParesFileScraper')
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        reader = sock.makefile("r", encoding="utf-8", newline="\r\n")
+        self._send(sock, f'AUTHENTICATE "{self.password}"')
+        self._expect_ok(reader, "AUTHENTICATE")
+        return sock, reader
+
+    @staticmethod
+    def _send(sock, line):
+        sock.sendall(line.encode() + b"\r\n")
+
+    @staticmethod
+    def _read_reply(reader):
+        """Lee una respuesta completa (líneas ``NNN-`` ... ``NNN ``) y devuelve sus líneas."""
+        lines = []
+        while True:
+            line = reader.readline()
+            if not line:
+                raise TorControlError("ControlPort cerró la conexión")
+            line = line.rstrip("\r\n")
+            lines.append(line)
+            if len(line) >= 4 and line[3] == " ":
+                return lines
+
+    def _expect_ok(self, reader, what):
+        lines = self._read_reply(reader)
+        if not lines[-1].startswith("250"):
+            raise TorControlError(f"{what} falló: {' | '.join(lines)}")
+        return lines
+
+    def command(self, cmd):
+        """Envía un comando suelto y devuelve las líneas de la respuesta."""
+        sock, reader = self._connect()
+        try:
+            self._send(sock, cmd)
+            return self._expect_ok(reader, cmd)
+        finally:
+            sock.close()
+
+    def new_identity(self, wait_timeout=30):
+        """
+        Pide NEWNYM y espera hasta ``wait_timeout`` segundos a que se construya un circuito.
+
+        Devuelve los segundos que tardó el circuito, o None si venció el plazo.
+        """
+        sock, reader = self._connect()
+        try:
+            self._send(sock, "SETEVENTS CIRC")
+            self._expect_ok(reader, "SETEVENTS")
+            start = time.monotonic()
+            self._send(sock, "SIGNAL NEWNYM")
+            got_ok = False
+            deadline = start + wait_timeout
+            while time.monotonic() < deadline:
+                sock.settimeout(max(0.1, deadline - time.monotonic()))
+                try:
+                    line = reader.readline()
+                except socket.timeout:
+                    break
+                if not line:
+                    break
+                line = line.rstrip("\r\n")
+                if line.startswith("650 CIRC") and " BUILT" in line:
+                    if got_ok:
+                        return time.monotonic() - start
+                elif line.startswith("250"):
+                    got_ok = True
+                elif line[:1] in ("4", "5"):
+                    raise TorControlError(f"NEWNYM rechazado: {line}")
+            self.logger.warning(f"[TOR] Sin circuito nuevo tras {wait_timeout}s desde NEWNYM")
+            return None
+        finally:
+            try:
+                self._send(sock, "QUIT")
+            except Exception:
+                pass
+            sock.close()
+
+
+class TorSupervisor:
+    """
+    Vigila Tor en segundo plano para que la ruta de descarga no tenga que sondearlo.
+
+    Cada ``interval`` segundos comprueba el puerto SOCKS y el ControlPort
+    (``status/circuit-established``); con menos frecuencia refresca la IP de
+    salida. Un hilo aparte escucha los eventos ``CIRC`` para contar circuitos
+    construidos y fallidos. La ruta de descarga sólo consulta :attr:`healthy`,
+    un booleano en memoria. Los NEWNYM pasan por :meth:`new_identity`, que
+    respeta el límite de Tor (uno cada ``newnym_interval`` segundos) entre
+    todos los procesos mediante una clave de Redis si se le pasa ``r``.
+    """
+
+    def __init__(self, socks_host="127.0.0.1", socks_port=9050, control=None, r=None,
+                 interval=15, ip_interval=300, newnym_interval=10):
+        self.logger = logging.getLogger('ParesFileScraper')
+        self.socks_host = socks_host
+        self.socks_port = socks_port
+        self.control = control or TorControl()
+        self.r = r
+        self.interval = interval
+        self.ip_interval = ip_interval
+        self.newnym_interval = newnym_interval
+
+        self.healthy = False
+        self.exit_ip = None
+        self.circuits_built = 0
+        self.circuits_failed = 0
+        self.last_check = None
+        self._last_ip_check = 0
+        self._last_newnym = 0
+        self._healthy_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    # --- Comprobaciones ----------------------------------------------------------
+
+    def _socks_alive(self):
+        try:
+            with socket.create_connection((self.socks_host, self.socks_port), timeout=5):
+                return True
+        except OSError as e:
+            self.logger.error(f"[TOR] SOCKS no responde en {self.socks_host}:{self.socks_port}: {e}")
+            return False
+
+    def _circuit_established(self):
+        try:
+            lines = self.control.command("GETINFO status/circuit-established")
+            return any(line.endswith("circuit-established=1") for line in lines)
+        except Exception as e:
+            # Sin ControlPort seguimos pudiendo navegar: no lo consideramos caída
+            self.logger.debug(f"[TOR] ControlPort no disponible: {e}")
+            return True
+
+    def _refresh_exit_ip(self):
+        try:
+            proxy = f"socks5h://{self.socks_host}:{self.socks_port}"
+            resp = requests.get("https://api64.ipify.org", proxies={"http": proxy, "https": proxy}, timeout=15)
+            self.exit_ip = resp.text.strip()
+            self.logger.info(f"[TOR] IP pública a través de Tor: {self.exit_ip}")
+        except Exception as e:
+            self.logger.warning(f"[TOR] No se pudo obtener IP pública: {e}")
+
+    def check(self):
+        """Ejecuta una ronda de comprobaciones y actualiza :attr:`healthy`."""
+        healthy = self._socks_alive() and self._circuit_established()
+        if healthy != self.healthy:
+            self.logger.info(f"[TOR] Estado: {'sano' if healthy else 'caído'}")
+        self.healthy = healthy
+        self.last_check = time.time()
+        if healthy:
+            self._healthy_event.set()
+            if time.time() - self._last_ip_check >= self.ip_interval:
+                self._last_ip_check = time.time()
+                self._refresh_exit_ip()
+        else:
+            self._healthy_event.clear()
+        return healthy
+
+    def wait_healthy(self, timeout=60):
+        """Bloquea hasta que Tor esté sano o venza ``timeout``; devuelve el estado."""
+        if self.healthy:
+            return True
+        return self._healthy_event.wait(timeout)
+
+    # --- Hilos -------------------------------------------------------------------
+
+    def start(self):
+        self.check()
+        for target in (self._check_loop, self._event_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _check_loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.error(f"[TOR] Error comprobando Tor: {e}")
+
+    def _event_loop(self):
+        """Cuenta circuitos construidos/fallidos; se reconecta si cae el ControlPort."""
+        while not self._stop_event.is_set():
+            try:
+                sock, reader = self.control._connect()
+                sock.settimeout(None)
+                try:
+                    self.control._send(sock, "SETEVENTS CIRC")
+                    self.control._expect_ok(reader, "SETEVENTS")
+                    for line in reader:
+                        if self._stop_event.is_set():
+                            break
+                        if not line.startswith("650 CIRC"):
+                            continue
+                        if " BUILT" in line:
+                            self.circuits_built += 1
+                        elif " FAILED" in line:
+                            self.circuits_failed += 1
+                            self.logger.debug(f"[TOR] Circuito fallido: {line.strip()}")
+                finally:
+                    sock.close()
+            except Exception as e:
+                self.logger.debug(f"[TOR] Escucha de eventos interrumpida: {e}")
+            self._stop_event.wait(self.interval)
+
+    # --- NEWNYM ------------------------------------------------------------------
+
+    def _acquire_newnym_slot(self):
+        now = time.time()
+        if now - self._last_newnym < self.newnym_interval:
+            return False
+        if self.r is not None:
+            try:
+                if not self.r.set("tor:newnym", os.getpid(), nx=True, ex=self.newnym_interval):
+                    return False
+            except Exception as e:
+                self.logger.debug(f"[TOR] No se pudo coordinar NEWNYM en Redis: {e}")
+        self._last_newnym = now
+        return True
+
+    def new_identity(self, wait_timeout=30):
+        """
+        Pide NEWNYM si lo permite el límite de Tor y espera al circuito nuevo.
+
+        Devuelve los segundos hasta el circuito construido, o None si se omitió
+        por el límite o venció la espera.
+        """
+        if not self._acquire_newnym_slot():
+            self.logger.info("[TOR] NEWNYM omitido: otro se pidió hace menos de "
+                             f"{self.newnym_interval}s")
+            return None
+        self.exit_ip = None
+        self._last_ip_check = 0
+        return self.control.new_identity(wait_timeout=wait_timeout)
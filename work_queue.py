@@ -0,0 +1,760 @@
+# work_queue.py
+import os
+import re
+import time
+import socket
+import logging
+import threading
+
+
+# Niveles del frontier por tipo de URL, de mayor a menor prioridad. Las descripciones
+# van primero: cierran unidades (ficha + imágenes) y sólo generan sus contiene, así
+# que una contiene con miles de hijos se vacía antes de expandir la siguiente.
+PRIORITY_LEVELS = (
+    ("description", "description/"),
+    ("contiene", "contiene/"),
+    ("find", "catalogo/find"),
+)
+
+FRONTIER_MODES = ("fifo", "priority", "depth")
+
+# Las URLs de description/contiene se guardan como "<tipo>:<id>" (p. ej. "d:2199655")
+# y su estado hecho/visto en bitmaps por tipo, indexados por id. El resto de URLs
+# (find, otros hosts) siguen como cadena completa en done_urls/seen_urls.
+TYPE_CODES = {"description": "d", "contiene": "c"}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+_URL_RE = re.compile(r'^(?P<base>.+?)/ParesBusquedas20/catalogo/(?P<kind>description|contiene)/(?P<id>\d+)$')
+_TOKEN_RE = re.compile(r'^(?P<code>[a-z]):(?P<id>\d+)$')
+# Semillas compactas: "description:1000-250000" (rango de ids) o "contiene:123"
+SEED_RANGE_RE = re.compile(r'^(?P<kind>description|contiene):(?P<start>\d+)(?:-(?P<end>\d+))?$')
+
+
+# Devuelve a la cabeza de su nivel lo que un worker muerto tenía en curso.
+# KEYS = en curso, workers, lease, todo_urls y las listas de cada nivel; ARGV =
+# worker y, por nivel, el código de token y el fragmento de URL que lo eligen
+# (como ``todo_key_for``; si nada encaja, todo_urls). Se comprueba el lease
+# dentro del script para que un heartbeat concurrente no pierda la carrera
+# contra el reaper.
+REAP_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return -1
+end
+local moved = 0
+local item = redis.call('RPOP', KEYS[1])
+while item do
+    local target = KEYS[4]
+    local code = string.match(item, '^(%l):%d+$')
+    for i = 5, #KEYS do
+        local lane_code, pattern = ARGV[2 * (i - 4)], ARGV[2 * (i - 4) + 1]
+        if (code and code == lane_code) or (not code and string.find(item, pattern, 1, true)) then
+            target = KEYS[i]
+            break
+        end
+    end
+    redis.call('LPUSH', target, item)
+    moved = moved + 1
+    item = redis.call('RPOP', KEYS[1])
+end
+redis.call('SREM', KEYS[2], ARGV[1])
+return moved
+"""
+
+
+# Dedup + encolado atómico de un lote: sólo se encolan las URLs que no estaban
+# ya vistas ni hechas. KEYS = lista destino, sets vistos/hechos de URLs completas
+# y, por cada código de ARGV[2] (p. ej. "dc"), sus bitmaps vistos y hechos. Todas
+# las claves que toca el script van en KEYS. ARGV[1] es RPUSH (cola) o LPUSH
+# (pila, modo depth) y el lote empieza en ARGV[3]. Devuelve cuántas se han encolado.
+ENQUEUE_SCRIPT = """
+local bitmaps = {}
+for j = 1, #ARGV[2] do
+    bitmaps[string.sub(ARGV[2], j, j)] = {KEYS[2 + 2 * j], KEYS[3 + 2 * j]}
+end
+local pushed = 0
+for i = 3, #ARGV do
+    local item = ARGV[i]
+    local code, id = string.match(item, '^(%l):(%d+)$')
+    local new
+    if code and bitmaps[code] then
+        new = redis.call('SETBIT', bitmaps[code][1], id, 1) == 0
+            and redis.call('GETBIT', bitmaps[code][2], id) == 0
+    else
+        new = redis.call('SADD', KEYS[2], item) == 1 and redis.call('SISMEMBER', KEYS[3], item) == 0
+    end
+    if new then
+        redis.call(ARGV[1], KEYS[1], item)
+        pushed = pushed + 1
+    end
+end
+return pushed
+"""
+
+
+# Expande el siguiente tramo de un rango semilla. KEYS[1] = hash de rangos
+# ("<tipo>:<inicio>-<fin>" -> siguiente id), y luego lista destino, bitmap de
+# vistos y de hechos de description (KEYS[2..4]) y de contiene (KEYS[5..7]).
+# ARGV = tamaño del tramo y RPUSH/LPUSH. Tomar el tramo y encolarlo en el mismo
+# script evita perder ids si el worker muere.
+# Devuelve {ids tomados, ids encolados} o false si no quedan rangos.
+RANGE_SCRIPT = """
+local codes = {description = 'd', contiene = 'c'}
+local lanes = {description = 2, contiene = 5}
+local fields = redis.call('HGETALL', KEYS[1])
+for i = 1, #fields, 2 do
+    local field = fields[i]
+    local kind, last = string.match(field, '^(%l+):%d+%-(%d+)$')
+    local first = tonumber(fields[i + 1])
+    last = tonumber(last)
+    local upto = math.min(last, first + tonumber(ARGV[1]) - 1)
+    if upto >= last then
+        redis.call('HDEL', KEYS[1], field)
+    else
+        redis.call('HSET', KEYS[1], field, upto + 1)
+    end
+    local code, lane = codes[kind], lanes[kind]
+    local pushed = 0
+    for id = first, upto do
+        if redis.call('SETBIT', KEYS[lane + 1], id, 1) == 0
+                and redis.call('GETBIT', KEYS[lane + 2], id) == 0 then
+            redis.call(ARGV[2], KEYS[lane], code .. ':' .. string.format('%d', id))
+            pushed = pushed + 1
+        end
+    end
+    return {math.max(0, upto - first + 1), pushed}
+end
+return false
+"""
+
+
+# Modo fiable: mueve a la lista en curso (último KEY) la cabeza de la primera
+# lista no vacía, en orden de prioridad.
+DEQUEUE_SCRIPT = """
+for i = 1, #KEYS - 1 do
+    local url = redis.call('LMOVE', KEYS[i], KEYS[#KEYS], 'LEFT', 'RIGHT')
+    if url then
+        return url
+    end
+end
+return false
+"""
+
+
+class RedisWorkQueue:
+    """
+    Cola de trabajo (frontier) sobre Redis.
+
+    Según ``frontier``:
+      - ``fifo``: la lista ``todo_urls`` de siempre.
+      - ``priority``: una lista por tipo de URL, ``todo_urls:description``,
+        ``todo_urls:contiene`` y ``todo_urls:find``, que se atienden en ese
+        orden (ver ``PRIORITY_LEVELS``). Dentro de cada nivel, FIFO.
+      - ``depth``: como ``priority`` pero cada nivel es una pila, así que
+        se termina el subárbol descubierto más reciente antes de seguir con
+        los anteriores.
+    En todos los modos se leen todas las listas (``todo_urls`` la primera en
+    fifo y la última en los demás), así que cambiar de modo entre ejecuciones
+    no pierde nada.
+
+    Las URLs de description y contiene viajan codificadas como ``d:<id>`` /
+    ``c:<id>`` (ver :meth:`encode`) y su estado vive en los bitmaps
+    ``seen_ids:<tipo>`` y ``done_ids:<tipo>``: un bit por id en lugar de
+    una cadena de ~70 bytes por URL en un set.
+
+    En modo simple se saca con ``BLPOP`` sobre todas las listas (una sola ida y
+    vuelta, espera bloqueante y prioridad por orden de claves). En modo fiable cada URL se
+    mueve de forma atómica a ``processing:<worker_id>`` y sólo se elimina de ahí
+    al confirmarla con :meth:`ack`; mientras tanto el worker renueva su lease
+    ``lease:<worker_id>``. Si el lease caduca (worker o navegador muertos),
+    :meth:`reap_expired` devuelve sus URLs a la cabeza de la lista más prioritaria.
+    """
+
+    todo_key = "todo_urls"
+    done_key = "done_urls"
+    seen_key = "seen_urls"
+    workers_key = "queue_workers"
+    seen_ids_prefix = "seen_ids:"
+    done_ids_prefix = "done_ids:"
+    ranges_key = "seed_ranges"
+    attempts_key = "url_attempts"
+    failed_key = "failed_urls"
+    # Versión del formato del estado: 2 = tokens d:/c: y bitmaps (ver migrate_legacy)
+    schema_key = "queue_schema"
+    schema_version = 2
+
+    def __init__(self, r, reliable=False, lease_ttl=120, worker_id=None, frontier="priority",
+                 base_url="https://pares.mcu.es"):
+        if frontier not in FRONTIER_MODES:
+            raise ValueError(f"Modo de frontier desconocido: {frontier}")
+        self.r = r
+        self.base_url = base_url.rstrip("/")
+        self.reliable = reliable
+        self.frontier = frontier
+        level_keys = [f"{self.todo_key}:{name}" for name, _ in PRIORITY_LEVELS]
+        if frontier == "fifo":
+            self.todo_keys = [self.todo_key] + level_keys
+        else:
+            self.todo_keys = level_keys + [self.todo_key]
+        self.lease_ttl = lease_ttl
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.logger = logging.getLogger('ParesFileScraper.Redis')
+        self._reap = self.r.register_script(REAP_SCRIPT)
+        self._enqueue = self.r.register_script(ENQUEUE_SCRIPT)
+        self._dequeue = self.r.register_script(DEQUEUE_SCRIPT)
+        self._take_range = self.r.register_script(RANGE_SCRIPT)
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat_thread = None
+
+    @property
+    def processing_key(self):
+        return self.processing_key_for(self.worker_id)
+
+    @staticmethod
+    def processing_key_for(worker_id):
+        return f"processing:{worker_id}"
+
+    @staticmethod
+    def lease_key_for(worker_id):
+        return f"lease:{worker_id}"
+
+    # --- Ciclo de vida del worker -------------------------------------------------
+
+    def register(self):
+        """Da de alta el worker y arranca el heartbeat del lease (sólo modo fiable)."""
+        if not self.reliable:
+            return
+        pipe = self.r.pipeline()
+        pipe.sadd(self.workers_key, self.worker_id)
+        pipe.set(self.lease_key_for(self.worker_id), 1, ex=self.lease_ttl)
+        pipe.execute()
+        self._heartbeat_stop.clear()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._heartbeat_thread.start()
+        self.logger.info(f"Worker {self.worker_id} registrado (lease {self.lease_ttl}s)")
+
+    def unregister(self):
+        """Para el heartbeat y devuelve a la cola lo que quede en curso."""
+        if not self.reliable:
+            return
+        self._heartbeat_stop.set()
+        if self._heartbeat_thread:
+            self._heartbeat_thread.join(timeout=5)
+        self.r.delete(self.lease_key_for(self.worker_id))
+        moved = self._requeue(self.worker_id)
+        if moved:
+            self.logger.info(f"Worker {self.worker_id}: {moved} URLs devueltas a la cola al salir")
+
+    def heartbeat(self):
+        # Si el reaper nos dio por muertos (pausa larga) volvemos a darnos de alta
+        pipe = self.r.pipeline()
+        pipe.sadd(self.workers_key, self.worker_id)
+        pipe.set(self.lease_key_for(self.worker_id), 1, ex=self.lease_ttl)
+        pipe.execute()
+
+    def _heartbeat_loop(self):
+        interval = max(1, self.lease_ttl / 3)
+        while not self._heartbeat_stop.wait(interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                self.logger.error(f"Error renovando lease de {self.worker_id}: {e}")
+
+    # --- Codificación de URLs -------------------------------------------------
+
+    def encode(self, url):
+        """``.../catalogo/description/123`` -> ``d:123``; el resto de URLs se dejan tal cual."""
+        match = _URL_RE.match(url)
+        if match and match.group("base") == self.base_url:
+            return f"{TYPE_CODES[match.group('kind')]}:{match.group('id')}"
+        return url
+
+    def decode(self, item):
+        match = _TOKEN_RE.match(item)
+        if match:
+            kind = TYPE_NAMES[match.group("code")]
+            return f"{self.base_url}/ParesBusquedas20/catalogo/{kind}/{match.group('id')}"
+        return item
+
+    def _state(self, item, prefix, set_key):
+        """(comando, clave, argumento) con el que se consulta/marca ``item`` en un estado."""
+        match = _TOKEN_RE.match(item)
+        if match:
+            return "bit", f"{prefix}{match.group('code')}", int(match.group("id"))
+        return "set", set_key, item
+
+    # --- Operaciones de cola ---------------------------------------------------
+
+    def todo_key_for(self, url):
+        """Lista del frontier en la que se encola ``url`` (o su token)."""
+        if self.frontier != "fifo":
+            match = _TOKEN_RE.match(url)
+            if match:
+                return f"{self.todo_key}:{TYPE_NAMES[match.group('code')]}"
+            for name, pattern in PRIORITY_LEVELS:
+                if pattern in url:
+                    return f"{self.todo_key}:{name}"
+        return self.todo_key
+
+    def dequeue(self, timeout=5):
+        """Saca la siguiente URL esperando hasta ``timeout`` segundos; None si no llega nada."""
+        url = self._pop(timeout)
+        if url is None and self.refill():
+            # Frontier vacío pero quedaban rangos semilla: ya hay un tramo nuevo encolado
+            url = self._pop(0.1)
+        return url
+
+    def _pop(self, timeout):
+        if self.reliable:
+            # BLMOVE sólo admite una lista de origen: script por prioridad + sondeo
+            deadline = time.monotonic() + timeout
+            while True:
+                url_bytes = self._dequeue(keys=self.todo_keys + [self.processing_key])
+                remaining = deadline - time.monotonic()
+                if url_bytes or remaining <= 0:
+                    break
+                time.sleep(min(0.5, remaining))
+        else:
+            item = self.r.blpop(self.todo_keys, timeout=timeout)
+            url_bytes = item[1] if item else None
+        return self.decode(url_bytes.decode()) if url_bytes else None
+
+    def enqueue_many(self, urls, chunk_size=1000):
+        """
+        Encola las URLs nuevas de un lote deduplicando contra ``seen_urls``.
+
+        Todo el lote viaja en un único pipeline; se trocea en scripts de
+        ``chunk_size`` URLs para no bloquear Redis con páginas de 10.000 hijos.
+        """
+        batches = list(self._enqueue_batches(urls, chunk_size))
+        if not batches:
+            return 0
+        pipe = self.r.pipeline(transaction=False)
+        for keys, args in batches:
+            self._enqueue(keys=keys, args=args, client=pipe)
+        return sum(pipe.execute())
+
+    def _enqueue_batches(self, urls, chunk_size):
+        """``(keys, args)`` de cada llamada a ENQUEUE_SCRIPT para un lote de URLs."""
+        urls = list(dict.fromkeys(self.encode(url) for url in urls))
+        groups = {}
+        for url in urls:
+            groups.setdefault(self.todo_key_for(url), []).append(url)
+        # En modo depth cada nivel es una pila: se apila al revés para sacar en orden de página
+        push = "LPUSH" if self.frontier == "depth" else "RPUSH"
+        for todo_key, group in groups.items():
+            if push == "LPUSH":
+                group.reverse()
+            keys = [todo_key, self.seen_key, self.done_key]
+            for code in TYPE_NAMES:
+                keys += [f"{self.seen_ids_prefix}{code}", f"{self.done_ids_prefix}{code}"]
+            head = [push, "".join(TYPE_NAMES)]
+            for i in range(0, len(group), chunk_size):
+                yield keys, head + group[i:i + chunk_size]
+
+    def seed(self, urls, load_key=None):
+        """
+        Encola URLs semilla aunque ya se hayan visto (no si están hechas).
+
+        Dos idas y vueltas en total: una para consultar ``done`` y otra para
+        encolar y marcar como vistas. Con ``load_key`` las URLs se marcan
+        también en ``<load_key>:<tipo>`` / ``<load_key>:urls`` en la primera ida
+        y vuelta, de modo que una semilla repetida en otro lote de la misma carga
+        no se encola dos veces. Devuelve ``(añadidas, saltadas)``.
+        """
+        items = [self.encode(url) for url in dict.fromkeys(urls)]
+        if not items:
+            return 0, 0
+        pipe = self.r.pipeline(transaction=False)
+        for item in items:
+            kind, key, arg = self._state(item, self.done_ids_prefix, self.done_key)
+            if kind == "bit":
+                pipe.getbit(key, arg)
+            else:
+                pipe.sismember(key, arg)
+        if load_key:
+            for item in items:
+                kind, key, arg = self._state(item, f"{load_key}:", f"{load_key}:urls")
+                if kind == "bit":
+                    pipe.setbit(key, arg, 1)    # devuelve el bit anterior: 1 = repetida
+                else:
+                    pipe.sadd(key, arg)         # devuelve 0 si ya estaba
+        results = pipe.execute()
+        skip = [bool(done) for done in results[:len(items)]]
+        if load_key:
+            for i, (item, marked) in enumerate(zip(items, results[len(items):])):
+                repeated = marked == 0 if _TOKEN_RE.match(item) is None else marked == 1
+                skip[i] = skip[i] or repeated
+
+        pipe = self.r.pipeline(transaction=False)
+        added = 0
+        for item, skipped in zip(items, skip):
+            if skipped:
+                continue
+            pipe.rpush(self.todo_key_for(item), item)
+            self._mark(pipe, item, self.seen_ids_prefix, self.seen_key)
+            added += 1
+        pipe.execute()
+        return added, len(items) - added
+
+    def _mark(self, pipe, item, prefix, set_key):
+        kind, key, arg = self._state(item, prefix, set_key)
+        if kind == "bit":
+            pipe.setbit(key, arg, 1)
+        else:
+            pipe.sadd(key, arg)
+
+    def are_done(self, urls):
+        """Lista de booleanos: si cada URL (o token) está hecha, en un solo pipeline."""
+        pipe = self.r.pipeline(transaction=False)
+        for url in urls:
+            kind, key, arg = self._state(self.encode(url), self.done_ids_prefix, self.done_key)
+            if kind == "bit":
+                pipe.getbit(key, arg)
+            else:
+                pipe.sismember(key, arg)
+        return [bool(v) for v in pipe.execute()]
+
+    def is_done(self, url):
+        return self.are_done([url])[0]
+
+    def ack(self, url):
+        """Marca la URL como hecha y la retira de la lista en curso en una sola ida y vuelta."""
+        item = self.encode(url)
+        pipe = self.r.pipeline()
+        self._mark(pipe, item, self.done_ids_prefix, self.done_key)
+        if self.reliable:
+            pipe.lrem(self.processing_key, 1, item)
+        pipe.execute()
+
+    def retry(self, url):
+        """Devuelve la URL al final de su nivel sin marcarla como hecha (p. ej. una contiene a medias)."""
+        item = self.encode(url)
+        pipe = self.r.pipeline()
+        if self.reliable:
+            pipe.lrem(self.processing_key, 1, item)
+        pipe.rpush(self.todo_key_for(item), item)
+        pipe.execute()
+
+    def fail(self, url, max_attempts=3):
+        """
+        Anota un error al procesar ``url``: la reencola hasta ``max_attempts`` intentos.
+
+        Los intentos se cuentan en ``url_attempts`` (compartido por los workers).
+        Agotados, la URL se marca como hecha y queda en ``failed_urls``.
+        Devuelve True si se ha reencolado.
+        """
+        item = self.encode(url)
+        if self.r.hincrby(self.attempts_key, item, 1) < max_attempts:
+            self.retry(url)
+            return True
+        pipe = self.r.pipeline()
+        pipe.hdel(self.attempts_key, item)
+        pipe.sadd(self.failed_key, item)
+        pipe.execute()
+        self.ack(url)
+        return False
+
+    def _count(self, prefix, set_key):
+        pipe = self.r.pipeline(transaction=False)
+        for code in TYPE_NAMES:
+            pipe.bitcount(f"{prefix}{code}")
+        pipe.scard(set_key)
+        return sum(pipe.execute())
+
+    def done_count(self):
+        """URLs hechas (bitmaps por tipo + set de URLs completas)."""
+        return self._count(self.done_ids_prefix, self.done_key)
+
+    def seen_count(self):
+        """URLs encoladas alguna vez."""
+        return self._count(self.seen_ids_prefix, self.seen_key)
+
+    def in_flight(self):
+        """Número total de URLs en curso en todos los workers (0 en modo simple)."""
+        if not self.reliable:
+            return 0
+        workers = [w.decode() for w in self.r.smembers(self.workers_key)]
+        if not workers:
+            return 0
+        pipe = self.r.pipeline()
+        for worker in workers:
+            pipe.llen(self.processing_key_for(worker))
+        return sum(pipe.execute())
+
+    def pending_by_level(self):
+        """Longitud de cada lista del frontier."""
+        pipe = self.r.pipeline(transaction=False)
+        for todo_key in self.todo_keys:
+            pipe.llen(todo_key)
+        return dict(zip(self.todo_keys, pipe.execute()))
+
+    def pending(self):
+        """URLs pendientes en todo el frontier, incluidos los ids de rangos semilla sin expandir."""
+        return sum(self.pending_by_level().values()) + self.ranges_remaining()
+
+    # --- Rangos semilla --------------------------------------------------------
+
+    def add_range(self, kind, start, end):
+        """
+        Registra un rango de ids semilla (``"description"``, 1000, 250000).
+
+        No se encola nada: :meth:`refill` lo expande por tramos cuando el frontier
+        se vacía. Si el rango ya estaba registrado se conserva su progreso.
+        """
+        if kind not in TYPE_CODES:
+            raise ValueError(f"Tipo de rango desconocido: {kind}")
+        start, end = min(start, end), max(start, end)
+        return bool(self.r.hsetnx(self.ranges_key, f"{kind}:{start}-{end}", start))
+
+    def ranges_remaining(self):
+        """Ids de rangos semilla aún sin expandir."""
+        return self._remaining(self.r.hgetall(self.ranges_key))
+
+    @staticmethod
+    def _remaining(ranges):
+        remaining = 0
+        for field, next_id in ranges.items():
+            end = int(field.decode().rsplit("-", 1)[1])
+            remaining += max(0, end - int(next_id) + 1)
+        return remaining
+
+    def refill(self, batch=1000):
+        """
+        Expande tramos de ``batch`` ids de los rangos semilla hasta encolar alguno.
+
+        Los ids ya vistos o hechos se saltan, así que un rango que ya se
+        recorrió sólo avanza. Devuelve cuántas URLs se han encolado.
+        """
+        keys, args = self._refill_call(batch)
+        while True:
+            result = self._take_range(keys=keys, args=args)
+            if not result:
+                return 0
+            taken, pushed = result
+            if pushed:
+                self.logger.debug(f"Rangos semilla: {pushed} URLs encoladas de {taken} ids")
+                return pushed
+
+    def _refill_call(self, batch):
+        """``(keys, args)`` de RANGE_SCRIPT: por tipo, lista destino y bitmaps vistos/hechos."""
+        keys = [self.ranges_key]
+        for name in ("description", "contiene"):
+            code = TYPE_CODES[name]
+            keys += [self.todo_key_for(f"{code}:0"), f"{self.seen_ids_prefix}{code}", f"{self.done_ids_prefix}{code}"]
+        push = "LPUSH" if self.frontier == "depth" else "RPUSH"
+        return keys, [batch, push]
+
+    def is_drained(self):
+        """Cierto si no queda nada pendiente ni en curso que pueda generar más trabajo."""
+        return self.pending() == 0 and self.in_flight() == 0
+
+    # --- Reaper ----------------------------------------------------------------
+
+    def _requeue(self, worker_id):
+        keys = [self.processing_key_for(worker_id), self.workers_key, self.lease_key_for(worker_id), self.todo_key]
+        args = [worker_id]
+        if self.frontier != "fifo":
+            # Cada token o URL vuelve a su nivel, igual que en todo_key_for
+            for name, pattern in PRIORITY_LEVELS:
+                keys.append(f"{self.todo_key}:{name}")
+                args += [TYPE_CODES.get(name, ""), pattern]
+        return self._reap(keys=keys, args=args)
+
+    def reap_expired(self):
+        """Devuelve a la cola las URLs de workers cuyo lease ha caducado."""
+        total = 0
+        for worker in self.r.smembers(self.workers_key):
+            worker_id = worker.decode()
+            moved = self._requeue(worker_id)
+            if moved > 0:
+                self.logger.warning(f"Lease caducado de {worker_id}: {moved} URLs devueltas a la cola")
+                total += moved
+        return total
+
+    # --- Migración -------------------------------------------------------------
+
+    def migrate_legacy(self, batch=1000):
+        """
+        Pasa el estado antiguo (URLs completas) al formato compacto.
+
+        Las URLs codificables de ``done_urls``/``seen_urls`` pasan a los bitmaps
+        y las listas del frontier y en curso se reescriben como tokens, de
+        ``batch`` en ``batch`` elementos. Al terminar se anota ``queue_schema``
+        y los arranques siguientes no recorren nada. Debe ejecutarse sin workers
+        activos (lo hace controller.py al arrancar). Devuelve cuántos elementos
+        se han convertido.
+        """
+        if int(self.r.get(self.schema_key) or 0) >= self.schema_version:
+            return 0
+        converted = 0
+        for set_key, prefix in ((self.done_key, self.done_ids_prefix), (self.seen_key, self.seen_ids_prefix)):
+            pipe = self.r.pipeline(transaction=False)
+            pending = 0
+            for raw in self.r.sscan_iter(set_key, count=batch):
+                url = raw.decode()
+                item = self.encode(url)
+                if item == url:
+                    continue
+                self._mark(pipe, item, prefix, set_key)
+                pipe.srem(set_key, url)
+                pending += 1
+                if pending >= batch:
+                    pipe.execute()
+                    converted += pending
+                    pending = 0
+            pipe.execute()
+            converted += pending
+
+        list_keys = list(self.todo_keys) + [k.decode() for k in self.r.scan_iter("processing:*")]
+        for list_key in list_keys:
+            converted += self._migrate_list(list_key, batch)
+        self.r.set(self.schema_key, self.schema_version)
+        if converted:
+            self.logger.info(f"Migradas {converted} URLs al formato compacto por id")
+        return converted
+
+    def _migrate_list(self, list_key, batch):
+        # Copia por tramos a una lista temporal y RENAME: nunca se lee la lista entera de golpe
+        tmp_key = f"{list_key}:migrating"
+        self.r.delete(tmp_key)
+        changed = 0
+        start = 0
+        while True:
+            items = [raw.decode() for raw in self.r.lrange(list_key, start, start + batch - 1)]
+            if not items:
+                break
+            encoded = [self.encode(item) for item in items]
+            changed += sum(1 for a, b in zip(items, encoded) if a != b)
+            self.r.rpush(tmp_key, *encoded)
+            start += batch
+        if changed:
+            self.r.rename(tmp_key, list_key)
+        else:
+            self.r.delete(tmp_key)
+        return changed
+
+
+class ReaperThread(threading.Thread):
+    """Ejecuta periódicamente :meth:`RedisWorkQueue.reap_expired` (usado por controller.py)."""
+
+    def __init__(self, queue, interval=30):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.queue.reap_expired()
+            except Exception as e:
+                self.queue.logger.error(f"Error en el reaper: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class AsyncRedisWorkQueue(RedisWorkQueue):
+    """
+    El mismo frontier sobre ``redis.asyncio`` para el motor asyncio (async_engine.py).
+
+    Comparte claves, scripts Lua y codificación con :class:`RedisWorkQueue`;
+    las operaciones que van a Redis son corrutinas. Sólo modo simple: el lease
+    y el heartbeat del modo fiable viven en hilos del worker síncrono.
+    """
+
+    def __init__(self, r, frontier="priority", base_url="https://pares.mcu.es"):
+        super().__init__(r, reliable=False, frontier=frontier, base_url=base_url)
+        # Sacadas por este proceso y aún sin ack/retry (sin lista en curso en Redis)
+        self._in_flight = 0
+
+    async def dequeue(self, timeout=5):
+        url = await self._pop(timeout)
+        if url is None and await self.refill():
+            url = await self._pop(0.1)
+        if url is not None:
+            self._in_flight += 1
+        return url
+
+    async def _pop(self, timeout):
+        item = await self.r.blpop(self.todo_keys, timeout=timeout)
+        return self.decode(item[1].decode()) if item else None
+
+    async def enqueue_many(self, urls, chunk_size=1000):
+        batches = list(self._enqueue_batches(urls, chunk_size))
+        if not batches:
+            return 0
+        pipe = self.r.pipeline(transaction=False)
+        for keys, args in batches:
+            await self._enqueue(keys=keys, args=args, client=pipe)
+        return sum(await pipe.execute())
+
+    async def are_done(self, urls):
+        pipe = self.r.pipeline(transaction=False)
+        for url in urls:
+            kind, key, arg = self._state(self.encode(url), self.done_ids_prefix, self.done_key)
+            if kind == "bit":
+                pipe.getbit(key, arg)
+            else:
+                pipe.sismember(key, arg)
+        return [bool(v) for v in await pipe.execute()]
+
+    async def is_done(self, url):
+        return (await self.are_done([url]))[0]
+
+    async def ack(self, url):
+        pipe = self.r.pipeline()
+        self._mark(pipe, self.encode(url), self.done_ids_prefix, self.done_key)
+        try:
+            await pipe.execute()
+        finally:
+            self._in_flight -= 1
+
+    async def retry(self, url):
+        item = self.encode(url)
+        try:
+            await self.r.rpush(self.todo_key_for(item), item)
+        finally:
+            self._in_flight -= 1
+
+    async def fail(self, url, max_attempts=3):
+        item = self.encode(url)
+        try:
+            attempts = await self.r.hincrby(self.attempts_key, item, 1)
+            if attempts >= max_attempts:
+                pipe = self.r.pipeline()
+                pipe.hdel(self.attempts_key, item)
+                pipe.sadd(self.failed_key, item)
+                await pipe.execute()
+        except Exception:
+            self._in_flight -= 1
+            raise
+        if attempts < max_attempts:
+            await self.retry(url)
+            return True
+        await self.ack(url)
+        return False
+
+    def in_flight(self):
+        return self._in_flight
+
+    async def pending(self):
+        pipe = self.r.pipeline(transaction=False)
+        for todo_key in self.todo_keys:
+            pipe.llen(todo_key)
+        pipe.hgetall(self.ranges_key)
+        *lengths, ranges = await pipe.execute()
+        return sum(lengths) + self._remaining(ranges)
+
+    async def refill(self, batch=1000):
+        keys, args = self._refill_call(batch)
+        while True:
+            result = await self._take_range(keys=keys, args=args)
+            if not result:
+                return 0
+            taken, pushed = result
+            if pushed:
+                self.logger.debug(f"Rangos semilla: {pushed} URLs encoladas de {taken} ids")
+                return pushed
+
+    async def is_drained(self):
+        return await self.pending() == 0 and self.in_flight() == 0
@@ -0,0 +1,230 @@
+# worker_supervisor.py
+import time
+import signal
+import logging
+from multiprocessing import Process
+
+
+def _worker_entry(target, kwargs):
+    # El hijo hereda los handlers del supervisor; Ctrl+C vuelve a ser KeyboardInterrupt
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Una excepción no capturada deja código de salida 1 y el supervisor lo relanza
+    target(**kwargs)
+
+
+class WorkerSlot:
+    """Un hueco del pool: su proceso actual y el historial de fallos para el backoff."""
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.started_at = 0.0
+        self.failures = 0
+        self.not_before = 0.0
+        self.stopping = False
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+
+class WorkerSupervisor:
+    """
+    Mantiene un pool de procesos ``target(**kwargs_for(i))`` entre ``min_workers`` y ``max_workers``.
+
+    Reinicios: un worker que muere con código distinto de 0 (Playwright, Tor…) se
+    relanza tras ``backoff_base * 2**(fallos-1)`` segundos, hasta ``backoff_max``.
+    Los fallos se olvidan si el worker aguanta ``stable_after`` segundos.
+
+    Escalado: cada ``scale_interval`` segundos se sube un worker si la cola supera
+    ``high_water`` URLs por worker y se baja uno si queda por debajo de
+    ``low_water``. También se baja si la tasa de error de las páginas
+    (contadores ``stats:pages_ok`` / ``stats:pages_failed``) pasa de
+    ``max_error_rate``: más workers sólo empeorarían la saturación.
+
+    Para bajar un worker, o al recibir SIGTERM/SIGINT, se le manda SIGTERM: termina
+    la URL en curso y sale (ver ``ParesFileScraper.stop_event``). Un segundo
+    SIGTERM/SIGINT al supervisor mata a los workers que sigan vivos.
+
+    Con ``upstream`` (otro supervisor cuyos workers alimentan ``queue``, p. ej.
+    el pool de imágenes tras el de rastreo) el pool no termina con la cola vacía
+    mientras ``upstream`` siga en marcha, y recibe las señales que llegan a éste.
+    Los contadores de error son ``<stats_prefix>_ok`` / ``<stats_prefix>_failed``.
+    """
+
+    def __init__(self, target, kwargs_for, queue, r, min_workers=1, max_workers=None,
+                 scale_interval=30, high_water=500, low_water=50, max_error_rate=0.2,
+                 backoff_base=5, backoff_max=300, stable_after=120, poll_interval=1,
+                 stats_prefix="stats:pages", upstream=None, name="Supervisor"):
+        self.target = target
+        self.kwargs_for = kwargs_for
+        self.queue = queue
+        self.r = r
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers or self.min_workers)
+        self.desired = self.min_workers
+        self.scale_interval = scale_interval
+        self.high_water = high_water
+        self.low_water = low_water
+        self.max_error_rate = max_error_rate
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.poll_interval = poll_interval
+        self.stats_prefix = stats_prefix
+        self.upstream = upstream
+        self.followers = []
+        if upstream is not None:
+            upstream.followers.append(self)
+        self.name = name
+        self.slots = [WorkerSlot(i) for i in range(self.max_workers)]
+        self.draining = False
+        self.finished = False
+        self._signals = 0
+        self._last_scale = time.monotonic()
+        self._last_stats = self._page_stats()
+        self.logger = logging.getLogger(f'ParesFileScraper.{name}')
+        self.logger.setLevel(logging.INFO)
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            self.logger.addHandler(handler)
+
+    # --- Señales -------------------------------------------------------------------------
+
+    def install_signal_handlers(self):
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+
+    def _on_signal(self, signum, frame):
+        for follower in self.followers:
+            follower._on_signal(signum, frame)
+        self._signals += 1
+        if self._signals == 1:
+            self.logger.info(f"Señal {signum}: drenando workers (terminan la URL en curso)")
+            self.drain()
+        else:
+            self.logger.warning(f"Señal {signum} repetida: matando workers")
+            for slot in self.slots:
+                if slot.alive:
+                    slot.process.kill()
+
+    # --- Procesos ------------------------------------------------------------------------
+
+    def _spawn(self, slot):
+        slot.process = Process(target=_worker_entry, args=(self.target, self.kwargs_for(slot.index)),
+                               name=f"{self.name.lower()}-worker-{slot.index}")
+        slot.process.start()
+        slot.started_at = time.monotonic()
+        slot.stopping = False
+        self.logger.info(f"Worker {slot.index} arrancado (pid {slot.process.pid})")
+
+    def _stop(self, slot):
+        if slot.alive and not slot.stopping:
+            slot.stopping = True
+            slot.process.terminate()   # SIGTERM: salida ordenada
+            self.logger.info(f"Worker {slot.index} (pid {slot.process.pid}) drenando")
+
+    def drain(self):
+        self.draining = True
+        for slot in self.slots:
+            self._stop(slot)
+
+    def _reap(self, slot):
+        """Recoge un worker terminado y decide si hay que relanzarlo con backoff."""
+        process = slot.process
+        process.join()
+        slot.process = None
+        uptime = time.monotonic() - slot.started_at
+        if process.exitcode == 0 or slot.stopping:
+            slot.failures = 0
+            self.logger.info(f"Worker {slot.index} terminó (código {process.exitcode}, {uptime:.0f}s)")
+            return
+        if uptime >= self.stable_after:
+            slot.failures = 0
+        slot.failures += 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (slot.failures - 1))
+        slot.not_before = time.monotonic() + delay
+        self.logger.warning(f"Worker {slot.index} murió (código {process.exitcode}, {uptime:.0f}s); "
+                            f"fallo {slot.failures}, se relanza en {delay:.0f}s")
+
+    # --- Escalado ------------------------------------------------------------------------
+
+    def _page_stats(self):
+        ok, failed = self.r.mget(f"{self.stats_prefix}_ok", f"{self.stats_prefix}_failed")
+        return int(ok or 0), int(failed or 0)
+
+    def _rescale(self, todo):
+        now = time.monotonic()
+        if now - self._last_scale < self.scale_interval:
+            return
+        self._last_scale = now
+        ok, failed = self._page_stats()
+        delta_ok, delta_failed = ok - self._last_stats[0], failed - self._last_stats[1]
+        self._last_stats = (ok, failed)
+        total = delta_ok + delta_failed
+        error_rate = delta_failed / total if total else 0.0
+
+        desired = self.desired
+        if error_rate > self.max_error_rate:
+            desired -= 1
+        elif todo > self.high_water * desired:
+            desired += 1
+        elif todo < self.low_water:
+            desired -= 1
+        desired = max(self.min_workers, min(self.max_workers, desired))
+        if desired != self.desired:
+            self.logger.info(f"Escalado {self.desired} → {desired} workers "
+                             f"(pendientes={todo}, error {error_rate:.0%} en {total})")
+            self.desired = desired
+
+    def run(self, install_signals=True):
+        """
+        Bucle principal; vuelve cuando la cola está vacía y no queda ningún worker.
+
+        Sólo el hilo principal puede instalar handlers de señales: un pool que corre
+        en otro hilo usa ``install_signals=False`` y recibe las señales por ``upstream``.
+        """
+        if install_signals:
+            self.install_signal_handlers()
+        try:
+            self._loop()
+        finally:
+            self.finished = True
+
+    def _loop(self):
+        while True:
+            for slot in self.slots:
+                if slot.process is not None and not slot.process.is_alive():
+                    self._reap(slot)
+
+            alive = [slot for slot in self.slots if slot.alive]
+            if self.draining:
+                if not alive:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+
+            todo = self.queue.pending()
+            drained = todo == 0 and self.queue.is_drained()
+            if not alive and drained:
+                if self.upstream is not None and not self.upstream.finished:
+                    # Los workers de upstream aún pueden generar trabajo
+                    time.sleep(self.poll_interval)
+                    continue
+                self.logger.info("Cola vacía y sin workers activos: fin del pool")
+                break
+            self._rescale(todo)
+
+            # Bajar: los workers sobrantes (los de índice más alto) terminan su URL y salen
+            running = [slot for slot in alive if not slot.stopping]
+            for slot in running[self.desired:]:
+                self._stop(slot)
+            # Subir (o reponer): sólo si queda trabajo y el hueco ha cumplido su backoff
+            if not drained:
+                now = time.monotonic()
+                free = [slot for slot in self.slots if slot.process is None and slot.not_before <= now]
+                for slot in free[:max(0, self.desired - len(running))]:
+                    self._spawn(slot)
+            time.sleep(self.poll_interval)